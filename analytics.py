@@ -0,0 +1,183 @@
+import csv
+from datetime import date
+
+from dates import day_label
+
+try:
+    import numpy as np
+except ImportError:  # optional dependency, only needed for the pivot reports
+    np = None
+
+# Rows fetched from the cursor per chunk while loading the columns
+LOAD_BATCH_SIZE = 50000
+# Capacity used for utilization: working hours per weekday
+HOURS_PER_DAY = 8
+
+def require_numpy():
+    if np is None:
+        raise RuntimeError("The pivot reports need NumPy. Install it with: pip install numpy")
+
+class Columns:
+    # The report rows as parallel arrays: day number (days since 1970-01-01, as stored), user id, project id, category code, hours
+    def __init__(self, day, user, project, category, hours):
+        self.day = day
+        self.user = user
+        self.project = project
+        self.category = category
+        self.hours = hours
+
+    def __len__(self):
+        return len(self.hours)
+
+class Pivot:
+    # A labelled matrix of values with a total, the entry count and the mean hours per entry
+    # for every row. The total defaults to the row sum; hours default to the total.
+    def __init__(self, title, row_header, row_labels, column_labels, values, counts, totals=None, hours=None, value_format='{:.2f}'):
+        self.title = title
+        self.row_header = row_header
+        self.row_labels = row_labels
+        self.column_labels = column_labels
+        self.values = values
+        self.counts = counts
+        self.totals = values.sum(axis=1) if totals is None else totals
+        self.hours = self.totals if hours is None else hours
+        self.value_format = value_format
+
+    def header(self):
+        return [self.row_header, *self.column_labels, 'Total', 'Entries', 'Mean']
+
+    def rows(self):
+        counts = self.counts.sum(axis=1)
+        means = np.divide(self.hours, counts, out=np.zeros_like(self.hours), where=counts > 0)
+        for i, label in enumerate(self.row_labels):
+            yield [label, *self.values[i].tolist(), float(self.totals[i]), int(counts[i]), float(means[i])]
+
+    def top(self, n):
+        # Rows ordered by their total, largest first, keeping only the first n when given
+        order = np.argsort(-self.totals, kind='stable')
+        if n:
+            order = order[:n]
+        self.row_labels = [self.row_labels[i] for i in order]
+        self.values = self.values[order]
+        self.counts = self.counts[order]
+        self.totals = self.totals[order]
+        self.hours = self.hours[order]
+        return self
+
+    def format_table(self):
+        header = self.header()
+        rows = [[str(row[0])] + [self.value_format.format(value) for value in row[1:-2]] + [str(row[-2]), f"{row[-1]:.2f}"]
+                for row in self.rows()]
+        widths = [max(len(str(cell)) for cell in column) for column in zip(header, *rows)]
+        lines = [self.title, '']
+        lines.append(' | '.join(str(cell).ljust(width) if i == 0 else str(cell).rjust(width) for i, (cell, width) in enumerate(zip(header, widths))))
+        lines.append('-+-'.join('-' * width for width in widths))
+        for row in rows:
+            lines.append(' | '.join(cell.ljust(width) if i == 0 else cell.rjust(width) for i, (cell, width) in enumerate(zip(row, widths))))
+        return lines
+
+    def write_csv(self, stream):
+        writer = csv.writer(stream)
+        writer.writerow(self.header())
+        writer.writerows(self.rows())
+
+def category_case(categories):
+    # SQL expression turning the category name into its index in CATEGORIES (-1 if unknown)
+    whens = ' '.join(f"WHEN '{name.replace(chr(39), chr(39) * 2)}' THEN {code}" for code, name in enumerate(categories))
+    return f"CASE category {whens} ELSE -1 END"
+
+def load_columns(cursor, where, params, categories, tables=('time_entries',), batch_size=LOAD_BATCH_SIZE):
+    # One pass over the filtered rows of each table, e.g. every partition of time_entries the
+    # date range reaches. The category is encoded in SQL, so each chunk goes straight from
+    # fetchmany() into a float array without per-row Python work.
+    require_numpy()
+    chunks = []
+    for table in tables:
+        cursor.execute(f'''
+            SELECT day, user_id, project_id, {category_case(categories)}, hours
+            FROM {table}
+            WHERE {where}
+        ''', params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.float64))
+    data = np.concatenate(chunks) if chunks else np.zeros((0, 5))
+    return Columns(
+        data[:, 0].astype(np.int64),
+        data[:, 1].astype(np.int64),
+        data[:, 2].astype(np.int64),
+        data[:, 3].astype(np.int64),
+        data[:, 4],
+    )
+
+def grouped(row_keys, column_keys, hours):
+    # Sums and counts of hours for every (row key, column key) pair, via one bincount each
+    row_values, row_index = np.unique(row_keys, return_inverse=True)
+    column_values, column_index = np.unique(column_keys, return_inverse=True)
+    shape = (len(row_values), len(column_values))
+    flat = row_index * shape[1] + column_index
+    sums = np.bincount(flat, weights=hours, minlength=shape[0] * shape[1]).reshape(shape)
+    counts = np.bincount(flat, minlength=shape[0] * shape[1]).reshape(shape)
+    return row_values, column_values, sums, counts
+
+def week_starts(days):
+    # Day number of the Monday of each day's week (1970-01-01 was a Thursday)
+    return days - (days + 3) % 7
+
+def hours_by_user_week(columns, user_names, top=None):
+    users, weeks, sums, counts = grouped(columns.user, week_starts(columns.day), columns.hours)
+    labels = [user_names.get(user_id, f"User {user_id}") for user_id in users.tolist()]
+    weeks = [day_label(week) for week in weeks.tolist()]
+    return Pivot("Hours by user and week (weeks starting on Monday)", 'User', labels, weeks, sums, counts).top(top)
+
+def hours_by_project_category(columns, project_names, categories, top=None):
+    projects, codes, sums, counts = grouped(columns.project, columns.category, columns.hours)
+    labels = [project_names.get(project_id, f"Project {project_id}") for project_id in projects.tolist()]
+    names = [categories[code] if 0 <= code < len(categories) else 'Other' for code in codes.tolist()]
+    return Pivot("Hours by project and category", 'Project', labels, names, sums, counts).top(top)
+
+def monthly_utilization(columns, user_names, date_range, top=None, hours_per_day=HOURS_PER_DAY):
+    # Logged hours as a percentage of weekday capacity, per user and month of the range
+    start_date, end_date = date_range
+    days = columns.day.astype('datetime64[D]')
+    # Capacity counts from start up to the day after the end, computed in numpy since date.max
+    # has no next day. An open side of the range (the all-time preset runs from date.min to
+    # date.max) stops at the first or last day with entries instead.
+    start = days.min() if start_date == date.min and len(days) else np.datetime64(start_date, 'D')
+    end = (days.max() if end_date == date.max and len(days) else np.datetime64(end_date, 'D')) + 1
+    months = days.astype('datetime64[M]')
+    users, month_values, sums, counts = grouped(columns.user, months.astype(np.int64), columns.hours)
+
+    month_starts = month_values.astype('datetime64[M]')
+    first = np.maximum(month_starts.astype('datetime64[D]'), start)
+    last = np.minimum((month_starts + 1).astype('datetime64[D]'), end)
+    capacity = np.busday_count(first, last) * hours_per_day
+    utilization = np.divide(sums * 100, capacity, out=np.zeros_like(sums), where=capacity > 0)
+
+    # The total is the utilization over the whole range, not the sum of the monthly percentages
+    hours = sums.sum(axis=1)
+    range_capacity = np.busday_count(start, end) * hours_per_day
+    totals = hours * 100 / range_capacity if range_capacity else np.zeros_like(hours)
+
+    labels = [user_names.get(user_id, f"User {user_id}") for user_id in users.tolist()]
+    month_labels = [str(month) for month in month_starts]
+    return Pivot("Utilization per month (% of weekday capacity)", 'User', labels, month_labels, utilization, counts,
+                 totals, hours, '{:.1f}%').top(top)
+
+# Report type -> menu label
+PIVOT_REPORTS = {
+    'user-week': "Hours by user and week",
+    'project-category': "Hours by project and category",
+    'utilization': "Utilization per month",
+}
+
+def build_pivot(report_type, columns, user_names, project_names, categories, date_range, top=None):
+    if report_type == 'user-week':
+        return hours_by_user_week(columns, user_names, top)
+    if report_type == 'project-category':
+        return hours_by_project_category(columns, project_names, categories, top)
+    if report_type == 'utilization':
+        return monthly_utilization(columns, user_names, date_range, top)
+    raise ValueError(f"Unknown pivot report {report_type!r}, expected one of: {', '.join(PIVOT_REPORTS)}")
@@ -0,0 +1,420 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from urllib.parse import parse_qs, urlsplit
+
+import profiler
+import shards
+import time_tracker
+from cli import JsonReportWriter, entry_row, search_row
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = int(os.environ.get('TIME_TRACKER_API_PORT', 8080))
+# Threads running SQLite calls; each one keeps its own read connection
+DEFAULT_WORKERS = 8
+MAX_BODY_BYTES = 1024 * 1024
+MAX_HEADERS = 100
+# Streamed report responses are sent in chunks of about this size, with at most
+# STREAM_QUEUE_CHUNKS of them waiting for a slow client before the query pauses
+STREAM_CHUNK_BYTES = 64 * 1024
+STREAM_QUEUE_CHUNKS = 8
+
+STATUS_TEXT = {
+    200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized', 403: 'Forbidden',
+    404: 'Not Found', 405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error',
+}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class StreamCancelled(Exception):
+    pass
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path.rstrip('/') or '/'
+        self.query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        self.headers = headers
+        self.body = body
+        self.user_id = None
+        self.session_id = None
+
+    def keep_alive(self):
+        return self.headers.get('connection', '').lower() != 'close'
+
+    def json(self):
+        try:
+            body = json.loads(self.body or b'{}')
+        except ValueError:
+            raise HttpError(400, "Request body is not valid JSON")
+        if not isinstance(body, dict):
+            raise HttpError(400, "Request body must be a JSON object")
+        return body
+
+async def read_request(reader):
+    # Parses one HTTP/1.1 request; returns None when the client closed the connection
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, _ = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(400, "Malformed request line")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= MAX_HEADERS:
+            raise HttpError(400, "Too many headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Request body too large")
+    body = await reader.readexactly(length) if length else b''
+    return Request(method.upper(), target, headers, body)
+
+def response_head(status, headers):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}"]
+    lines.extend(f"{name}: {value}" for name, value in headers)
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+def json_response(status, payload, keep_alive=True):
+    body = b'' if payload is None else json.dumps(payload).encode()
+    headers = [('Content-Type', 'application/json'), ('Content-Length', len(body))]
+    if not keep_alive:
+        headers.append(('Connection', 'close'))
+    return response_head(status, headers) + body
+
+def int_param(query, name, default=None):
+    value = query.get(name)
+    if value is None:
+        if default is None:
+            raise HttpError(400, f"Missing parameter: {name}")
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise HttpError(400, f"Invalid {name}: {value!r}")
+
+def date_param(query, name):
+    value = query.get(name)
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+    except ValueError:
+        raise HttpError(400, f"Invalid {name}: {value!r}, expected YYYY-MM-DD")
+
+def report_filters(query, default_range='this-month'):
+    # Same parameters as the report command: project, users, range or from/to
+    project_id = int_param(query, 'project', 0)
+    try:
+        users = [int(part) for part in query.get('users', '').split(',') if part.strip()]
+    except ValueError:
+        raise HttpError(400, f"Invalid users: {query['users']!r}")
+    start, end = date_param(query, 'from'), date_param(query, 'to')
+    if start or end:
+        if not (start and end):
+            raise HttpError(400, "from and to must be given together")
+        date_range = (start, end)
+    else:
+        try:
+            date_range = time_tracker.preset_date_range(query.get('range', default_range))
+        except ValueError as error:
+            raise HttpError(400, str(error))
+    user_choice, selected_users = ('3', users) if users else ('2', [])
+    return project_id, user_choice, selected_users, date_range
+
+class ChunkStream:
+    # File-like target for JsonReportWriter that hands the text to the event loop in chunks
+    def __init__(self, put):
+        self.put = put
+        self.parts = []
+        self.size = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= STREAM_CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if self.parts:
+            self.put(''.join(self.parts).encode())
+            self.parts = []
+            self.size = 0
+
+class ApiServer:
+    # JSON API over the tracker data. Requests are parsed on the event loop; every SQLite call
+    # runs on a bounded thread pool, so slow queries never stall other connections and at
+    # most `workers` read connections are open.
+
+    def __init__(self, workers=DEFAULT_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-db')
+        self.routes = {
+            ('POST', '/login'): (self.login, False),
+            ('POST', '/logout'): (self.logout, True),
+            ('GET', '/projects'): (self.projects, True),
+            ('GET', '/entries'): (self.entries, True),
+            ('POST', '/entries'): (self.add_entry, True),
+            ('GET', '/report'): (self.report, True),
+            ('GET', '/search'): (self.search, True),
+            ('GET', '/project-users'): (self.project_users, True),
+            ('GET', '/stats'): (self.stats, True),
+        }
+        self.requests = 0
+        self.errors = 0
+
+    async def run_db(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(function, *args))
+
+    async def run_write(self, unit):
+        # Writes go to the group-committing write queue instead of holding a database thread
+        # while they wait for the write lock and the commit
+        return await asyncio.wrap_future(time_tracker.submit(unit))
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await read_request(reader)
+                except HttpError as error:
+                    writer.write(json_response(error.status, {'error': error.message}, keep_alive=False))
+                    break
+                if request is None:
+                    break
+                keep_alive = await self.dispatch(request, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            # Disconnects, truncated requests and over-long lines just end the connection
+            pass
+        finally:
+            writer.close()
+
+    async def dispatch(self, request, writer):
+        # Handles one request; returns whether the connection can serve another one
+        self.requests += 1
+        keep_alive = request.keep_alive()
+        try:
+            route = self.routes.get((request.method, request.path))
+            if route is None:
+                if any(path == request.path for _, path in self.routes):
+                    raise HttpError(405, f"{request.method} not allowed on {request.path}")
+                raise HttpError(404, f"Not found: {request.path}")
+            handler, needs_session = route
+            if needs_session:
+                await self.authenticate(request)
+            result = await handler(request, writer)
+            if result is not None:
+                status, payload = result
+                writer.write(json_response(status, payload, keep_alive))
+            return keep_alive
+        except HttpError as error:
+            self.errors += 1
+            writer.write(json_response(error.status, {'error': error.message}, keep_alive))
+            return keep_alive
+        except ConnectionError:
+            raise
+        except Exception:
+            self.errors += 1
+            traceback.print_exc()
+            writer.write(json_response(500, {'error': "Internal server error"}, keep_alive=False))
+            return False
+
+    async def authenticate(self, request):
+        # Bearer token = a session id from POST /login (or the interactive login)
+        scheme, _, token = request.headers.get('authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not token:
+            raise HttpError(401, "Missing session: send 'Authorization: Bearer <session id>'")
+        session = await self.run_db(time_tracker.sessions.get, token.strip())
+        if session is None:
+            raise HttpError(401, "Unknown or expired session")
+        time_tracker.sessions.touch(session[0])
+        request.session_id, request.user_id = session[0], session[1]
+
+    async def login(self, request, writer):
+        body = request.json()
+        user = await self.run_db(time_tracker.authenticate, str(body.get('username', '')), str(body.get('password', '')))
+        if user is None:
+            raise HttpError(401, "Invalid username or password")
+        session_id = await self.run_write(time_tracker.sessions.creation(user[0]))
+        return 200, {'session': session_id, 'user': {'id': user[0], 'first_name': user[1], 'last_name': user[2]}}
+
+    async def logout(self, request, writer):
+        await self.run_db(time_tracker.delete_session, request.session_id)
+        return 200, {'logged_out': True}
+
+    async def projects(self, request, writer):
+        projects = await self.run_db(time_tracker.get_projects)
+        return 200, [{'id': project_id, 'name': name} for project_id, name in projects]
+
+    async def entries(self, request, writer):
+        # A page of the logged-in user's entries, newest first. Pass the returned "next" back as
+        # before= for the following page. Like the interactive listing, only one's own entries:
+        # other users' show up in /report.
+        user_id = int_param(request.query, 'user', request.user_id)
+        if user_id != request.user_id:
+            raise HttpError(403, "Only your own entries can be listed; use /report for other users")
+        page_size = min(max(int_param(request.query, 'limit', time_tracker.TIME_ENTRIES_PAGE_SIZE), 1), 1000)
+        before = time_tracker.NEWEST_KEY
+        if 'before' in request.query:
+            try:
+                day, entry_id = (int(part) for part in request.query['before'].split(':'))
+            except ValueError:
+                raise HttpError(400, f"Invalid before: {request.query['before']!r}, expected <day>:<id>")
+            before = (day, entry_id)
+        entries, more = await self.run_db(partial(time_tracker.get_time_entries_page, user_id, before, page_size=page_size))
+        next_key = f"{entries[-1][2]}:{entries[-1][0]}" if more else None
+        return 200, {'entries': [entry_row(entry) for entry in entries], 'next': next_key}
+
+    async def add_entry(self, request, writer):
+        body = request.json()
+        try:
+            project_id = int(body['project'])
+            hours = int(body['hours'])
+            entry_date = datetime.strptime(body.get('date') or datetime.now().strftime("%Y-%m-%d"), "%Y-%m-%d").date()
+        except (KeyError, TypeError, ValueError):
+            raise HttpError(400, "Expected project, hours and an optional date (YYYY-MM-DD)")
+        category = body.get('category')
+        if category not in time_tracker.CATEGORIES:
+            raise HttpError(400, f"Unknown category {category!r}, expected one of: {', '.join(time_tracker.CATEGORIES)}")
+        try:
+            entry_id = await self.run_write(time_tracker.time_entry_insert(project_id, request.user_id, entry_date, hours,
+                                                                           category, str(body.get('notes') or '')))
+        except shards.ClosedYearError as error:
+            raise HttpError(409, str(error))
+        return 201, {'id': entry_id}
+
+    async def search(self, request, writer):
+        # Entries whose notes contain every word of q, best first; takes the report filters too
+        text = request.query.get('q', '').strip()
+        if not text:
+            raise HttpError(400, "Missing parameter: q")
+        project_id, user_choice, selected_users, date_range = report_filters(request.query, 'all-time')
+        limit = min(max(int_param(request.query, 'limit', time_tracker.SEARCH_LIMIT), 1), 1000)
+        rows = await self.run_db(time_tracker.search_entries, text, project_id, user_choice, selected_users, date_range,
+                                 request.query.get('category'), limit)
+        return 200, [search_row(row) for row in rows]
+
+    async def project_users(self, request, writer):
+        users = await self.run_db(time_tracker.get_project_users, int_param(request.query, 'project', 0))
+        return 200, [{'id': user_id, 'first_name': first, 'last_name': last} for user_id, first, last in users]
+
+    async def stats(self, request, writer):
+        stats = {'requests': self.requests, 'errors': self.errors, 'report_cache': time_tracker.report_cache.stats(),
+                 'write_queue': time_tracker.write_queue().stats()}
+        if profiler.profiler.enabled:
+            stats['profile'] = profiler.profiler.to_dict()
+        return 200, stats
+
+    async def report(self, request, writer):
+        # Streams the same JSON document as `report --format json` with chunked encoding,
+        # so memory stays flat however many rows the report has
+        project_id, user_choice, selected_users, date_range = report_filters(request.query)
+        header = {'project_id': project_id, 'users': selected_users or 'all', 'from': str(date_range[0]), 'to': str(date_range[1])}
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+        cancelled = threading.Event()
+
+        def put(chunk):
+            if cancelled.is_set():
+                raise StreamCancelled()
+            asyncio.run_coroutine_threadsafe(queue.put(chunk), loop).result()
+
+        def produce():
+            try:
+                entries = time_tracker.iter_report_data(project_id, user_choice, selected_users, date_range)
+                time_tracker.export_report(entries, JsonReportWriter(ChunkStream(put), header))
+            except StreamCancelled:
+                pass
+            finally:
+                if not cancelled.is_set():
+                    put(None)
+
+        producer = loop.run_in_executor(self.executor, produce)
+        headers = [('Content-Type', 'application/json'), ('Transfer-Encoding', 'chunked')]
+        if not request.keep_alive():
+            headers.append(('Connection', 'close'))
+        writer.write(response_head(200, headers))
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                await writer.drain()
+            try:
+                await producer
+            except Exception:
+                # The status line is already sent: drop the connection without the final
+                # chunk so the client sees a truncated response instead of a complete one
+                traceback.print_exc()
+                raise ConnectionAbortedError("Report failed while streaming")
+            writer.write(b'0\r\n\r\n')
+        finally:
+            if not producer.done():
+                # The client went away or the query failed: stop the producer and unblock it
+                cancelled.set()
+                while not producer.done():
+                    while not queue.empty():
+                        queue.get_nowait()
+                    await asyncio.sleep(0.001)
+        return None
+
+    async def serve(self, host, port, ready=None):
+        server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_BODY_BYTES)
+        address = server.sockets[0].getsockname()
+        print(f"Listening on http://{address[0]}:{address[1]}", flush=True)
+        if ready:
+            ready(address)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='api.py', description="HTTP/JSON API over the time tracker database.")
+    parser.add_argument('--host', default=DEFAULT_HOST, help="address to listen on (default: %(default)s)")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port, 0 for any free port (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help="database threads (default: %(default)s)")
+    parser.add_argument('--db', help="database file (default: $TIME_TRACKER_DB or time_tracker.db)")
+    profiler.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.db:
+        time_tracker.use_database(args.db)
+    profiler.start_from_args(args)
+    server = ApiServer(args.workers)
+    time_tracker.sessions.start()
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        time_tracker.stop_writes()
+        time_tracker.sessions.stop()
+        profiler.finish_from_args(args)
+        time_tracker.db.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import time_tracker
+from exporters import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, create_exporter
+
+# Batch reports, e.g. the month-end set of one report per project or per user, run on a pool of
+# worker processes. Each worker opens its own read-only connection to the database and writes
+# its reports straight to their files; only the jobs and their outcomes cross between processes.
+# Wall time then depends on the number of cores and the largest report, not on how many there are.
+
+# The printed text report, or any of the export formats
+REPORT_FORMATS = ['text', *EXPORT_FORMATS]
+REPORT_RANGES = ['this-month', 'last-month', 'this-year']
+
+# One report; users is a tuple of user ids, empty for all users
+ReportJob = namedtuple('ReportJob', ['name', 'project_id', 'users', 'date_range', 'path'])
+# Rows written and seconds taken by a job, or the error that stopped it
+JobResult = namedtuple('JobResult', ['job', 'rows', 'seconds', 'error'])
+
+def safe_name(text):
+    return re.sub(r'[^\w.-]+', '_', text).strip('_')
+
+def job_path(output_dir, name, date_range, report_format):
+    start_date, end_date = date_range
+    extension = 'txt' if report_format == 'text' else EXPORT_FORMATS[report_format].extension
+    return os.path.join(output_dir, f"{safe_name(name)}_{start_date:%Y%m%d}_{end_date:%Y%m%d}.{extension}")
+
+def project_jobs(date_range, output_dir, report_format):
+    return [
+        ReportJob(name, project_id, (), date_range, job_path(output_dir, name, date_range, report_format))
+        for project_id, name in time_tracker.get_projects()
+    ]
+
+def user_jobs(date_range, output_dir, report_format):
+    jobs = []
+    for user_id, username, first_name, last_name in time_tracker.get_users():
+        name = f"{username} {first_name} {last_name}"
+        jobs.append(ReportJob(name, 0, (user_id,), date_range, job_path(output_dir, name, date_range, report_format)))
+    return jobs
+
+def parse_date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+def read_jobs(path, date_range, output_dir, report_format):
+    # JSON lines like {"project": 3, "users": [1, 2], "from": "2024-05-01", "to": "2024-05-31"};
+    # every key is optional: all projects, all users, the range given on the command line.
+    # "name" and "output" set the report's name and file.
+    jobs = []
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                spec = json.loads(line)
+                project_id = int(spec.get('project', 0))
+                users = tuple(int(user_id) for user_id in spec.get('users') or [])
+                job_range = (parse_date(spec['from']), parse_date(spec['to'])) if 'from' in spec else date_range
+            except (KeyError, TypeError, ValueError) as error:
+                raise ValueError(f"{path}:{line_number}: invalid report spec ({error})")
+            name = spec.get('name') or f"report {line_number}"
+            jobs.append(ReportJob(name, project_id, users, job_range,
+                                  spec.get('output') or job_path(output_dir, name, job_range, report_format)))
+    return jobs
+
+def estimate_rows(job):
+    # Entries in the report according to the daily rollup, which covers the closed years too
+    where, params = time_tracker.build_report_filters(job.project_id, '3', job.users, job.date_range, 'daily_totals')
+    cursor = time_tracker.db.cursor()
+    cursor.execute(f"SELECT IFNULL(SUM(entries), 0) FROM daily_totals WHERE {where}", params)
+    return cursor.fetchone()[0]
+
+class RowCounter:
+    # Report sink that only counts the rows, next to the one writing them
+
+    def __init__(self):
+        self.rows = 0
+
+    def start(self):
+        pass
+
+    def add(self, entry):
+        self.rows += 1
+
+    def finish(self):
+        pass
+
+def open_worker(path):
+    # Runs once in every worker process, which then reads through its own connections
+    time_tracker.use_database(path)
+
+def run_job(job, report_format, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Straight from the database: going through the report cache would only fill it with reports
+    # this process never asks for again
+    started = time.perf_counter()
+    counter = RowCounter()
+    try:
+        entries = time_tracker.fetch_report_rows(job.project_id, '3', job.users, job.date_range, chunk_size)
+        if report_format == 'text':
+            with open(job.path, 'w') as stream:
+                time_tracker.run_report(entries, [time_tracker.ReportPrinter(job.project_id, job.date_range, stream), counter])
+        else:
+            time_tracker.run_report(entries, [create_exporter(report_format, job.path, chunk_size=chunk_size), counter])
+    except Exception as error:
+        # A half-written report must not pass for a complete one
+        if os.path.exists(job.path):
+            os.remove(job.path)
+        return JobResult(job, counter.rows, time.perf_counter() - started, f"{type(error).__name__}: {error}")
+    return JobResult(job, counter.rows, time.perf_counter() - started, None)
+
+def run_batch(jobs, report_format, workers=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    # Yields a JobResult per job as each one finishes. The largest reports start first, so the
+    # batch does not end waiting on a big one picked up last. One worker runs the jobs in this
+    # process instead of a pool.
+    workers = workers or os.cpu_count() or 1
+    sizes = {job: estimate_rows(job) for job in jobs}
+    jobs = sorted(jobs, key=sizes.get, reverse=True)
+    if workers == 1:
+        for job in jobs:
+            yield run_job(job, report_format, chunk_size)
+        return
+    # Spawned rather than forked: an SQLite connection must not be carried into a child process
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(min(workers, len(jobs) or 1), mp_context=context, initializer=open_worker,
+                             initargs=(time_tracker.db.path,)) as pool:
+        futures = {pool.submit(run_job, job, report_format, chunk_size): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as error:
+                # The worker itself died, e.g. killed for running out of memory
+                yield JobResult(futures[future], 0, 0.0, f"{type(error).__name__}: {error}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a batch of reports in parallel, one file per report.")
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument('--every', choices=['project', 'user'], help="one report per project, or per user over all projects")
+    selection.add_argument('--jobs', help="JSON lines file with one report spec per line (see read_jobs)")
+    parser.add_argument('--range', choices=REPORT_RANGES, default='last-month', help="preset date range (default: %(default)s)")
+    parser.add_argument('--from', dest='start', type=parse_date, help="start date, YYYY-MM-DD")
+    parser.add_argument('--to', dest='end', type=parse_date, help="end date, YYYY-MM-DD")
+    parser.add_argument('--format', choices=REPORT_FORMATS, default='csv', help="report file format (default: %(default)s)")
+    parser.add_argument('--output-dir', default='.', help="directory for the report files (default: current directory)")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="rows fetched and written at a time (default: %(default)s)")
+    parser.add_argument('--json', action='store_true', help="print the per-report results as JSON")
+    args = parser.parse_args(argv)
+
+    if bool(args.start) != bool(args.end):
+        parser.error("--from and --to must be given together")
+    date_range = (args.start, args.end) if args.start else time_tracker.preset_date_range(args.range)
+    os.makedirs(args.output_dir, exist_ok=True)
+    if args.every == 'project':
+        jobs = project_jobs(date_range, args.output_dir, args.format)
+    elif args.every == 'user':
+        jobs = user_jobs(date_range, args.output_dir, args.format)
+    else:
+        try:
+            jobs = read_jobs(args.jobs, date_range, args.output_dir, args.format)
+        except (OSError, ValueError) as error:
+            print(f"error: {error}", file=sys.stderr)
+            return 2
+
+    started = time.perf_counter()
+    results = []
+    for result in run_batch(jobs, args.format, args.workers, args.chunk_size):
+        results.append(result)
+        if not args.json:
+            outcome = f"FAILED {result.error}" if result.error else result.job.path
+            print(f"  {result.job.name:32} {result.rows:9,} rows {result.seconds:8.3f}s  {outcome}", file=sys.stderr)
+    wall = time.perf_counter() - started
+    failed = [result for result in results if result.error]
+
+    if args.json:
+        json.dump({
+            'wall_seconds': round(wall, 3),
+            'reports': [
+                {'name': result.job.name, 'path': result.job.path, 'rows': result.rows,
+                 'seconds': round(result.seconds, 3), 'error': result.error}
+                for result in results
+            ],
+        }, sys.stdout, indent=2)
+        sys.stdout.write('\n')
+    print(f"{len(results)} reports ({len(failed)} failed), {sum(result.rows for result in results):,} rows "
+          f"in {wall:.2f}s ({sum(result.seconds for result in results):.2f}s of report time)", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import time_tracker
+from dates import day_number, iso_week_number
+
+# Requests each simulated dashboard cycles through (path, weight)
+REQUEST_MIX = [
+    ('/projects', 3),
+    ('/entries?user={user}&limit=20', 4),
+    ('/project-users?project={project}', 2),
+    ('/report?project={project}&range=this-month', 3),
+]
+
+def seed_database(path, users, projects, entries, seed=1):
+    # Synthetic data spread over the last year, so the preset ranges return rows
+    rng = random.Random(seed)
+    time_tracker.use_database(path)
+    for i in range(1, users + 1):
+        time_tracker.add_user(f"user{i}", "secret", f"First{i}", f"Last{i}")
+    for i in range(1, projects + 1):
+        time_tracker.add_project(f"Project {i}")
+    today = date.today()
+    rows = []
+    for i in range(entries):
+        entry_date = today - timedelta(days=rng.randint(0, 365))
+        rows.append((rng.randint(1, projects), rng.randint(1, users), day_number(entry_date), iso_week_number(entry_date),
+                     rng.randint(1, 8), rng.choice(time_tracker.CATEGORIES), f"Ticket {rng.randint(1, 9999)}"))
+    with time_tracker.db.transaction() as cursor:
+        cursor.executemany('''
+            INSERT INTO time_entries (project_id, user_id, day, iso_week, hours, category, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+    time_tracker.db.close()
+
+def start_server(path, workers):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'api.py'), '--port', '0', '--workers', str(workers), '--db', path],
+        stdout=subprocess.PIPE, text=True,
+    )
+    line = process.stdout.readline()
+    if not line.startswith('Listening on http://'):
+        process.kill()
+        raise RuntimeError(f"Server did not start: {line!r}")
+    host, port = line.strip()[len('Listening on http://'):].rsplit(':', 1)
+    return process, host, int(port)
+
+async def read_response(reader):
+    # (status, body) of one HTTP/1.1 response, with Content-Length or chunked encoding
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        parts = []
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            parts.append(chunk[:-2])
+        return status, b''.join(parts)
+    return status, await reader.readexactly(int(headers.get('content-length', 0)))
+
+async def request(reader, writer, method, path, host, token=None, body=b''):
+    head = [f"{method} {path} HTTP/1.1", f"Host: {host}", f"Content-Length: {len(body)}"]
+    if token:
+        head.append(f"Authorization: Bearer {token}")
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode() + body)
+    await writer.drain()
+    return await read_response(reader)
+
+async def client(host, port, token, deadline, users, projects, latencies, failures, seed):
+    # One keep-alive connection sending requests back to back until the deadline
+    rng = random.Random(seed)
+    paths = [path for path, weight in REQUEST_MIX for _ in range(weight)]
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            template = rng.choice(paths)
+            path = template.format(user=rng.randint(1, users), project=rng.randint(1, projects))
+            started = time.perf_counter()
+            status, _ = await request(reader, writer, 'GET', path, host, token)
+            elapsed = time.perf_counter() - started
+            endpoint = template.split('?')[0]
+            if status == 200:
+                latencies.setdefault(endpoint, []).append(elapsed)
+            else:
+                failures[endpoint] = failures.get(endpoint, 0) + 1
+    finally:
+        writer.close()
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+async def run_load(host, port, clients, duration, users, projects):
+    reader, writer = await asyncio.open_connection(host, port)
+    status, body = await request(reader, writer, 'POST', '/login', host, body=json.dumps({'username': 'user1', 'password': 'secret'}).encode())
+    writer.close()
+    if status != 200:
+        raise RuntimeError(f"Login failed: {body!r}")
+    token = json.loads(body)['session']
+
+    latencies = {}
+    failures = {}
+    started = time.perf_counter()
+    deadline = started + duration
+    await asyncio.gather(*(client(host, port, token, deadline, users, projects, latencies, failures, seed) for seed in range(clients)))
+    return time.perf_counter() - started, latencies, failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the HTTP API with many concurrent local clients.")
+    parser.add_argument('--clients', type=int, default=50, help="concurrent keep-alive connections (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of load (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=8, help="server database threads (default: %(default)s)")
+    parser.add_argument('--users', type=int, default=50, help="synthetic users (default: %(default)s)")
+    parser.add_argument('--projects', type=int, default=20, help="synthetic projects (default: %(default)s)")
+    parser.add_argument('--entries', type=int, default=100000, help="synthetic time entries (default: %(default)s)")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'time_tracker.db')
+        seed_database(path, args.users, args.projects, args.entries)
+        process, host, port = start_server(path, args.workers)
+        try:
+            elapsed, latencies, failures = asyncio.run(run_load(host, port, args.clients, args.duration, args.users, args.projects))
+        finally:
+            process.terminate()
+            process.wait()
+
+    all_samples = [sample for samples in latencies.values() for sample in samples]
+    results = {
+        'clients': args.clients,
+        'requests': len(all_samples),
+        'failures': sum(failures.values()),
+        'requests_per_sec': round(len(all_samples) / elapsed, 1),
+        'endpoints': {
+            endpoint: {
+                'requests': len(samples),
+                'p50_ms': round(percentile(samples, 0.50) * 1000, 2),
+                'p99_ms': round(percentile(samples, 0.99) * 1000, 2),
+            }
+            for endpoint, samples in sorted(latencies.items())
+        },
+    }
+    if all_samples:
+        results['p50_ms'] = round(percentile(all_samples, 0.50) * 1000, 2)
+        results['p99_ms'] = round(percentile(all_samples, 0.99) * 1000, 2)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+        return 0
+
+    print(f"{args.clients} clients, {args.duration:g} s, {args.entries} entries, {args.workers} server threads")
+    print(f"  {results['requests']} requests, {results['failures']} failures, {results['requests_per_sec']} requests/sec")
+    if all_samples:
+        print(f"  latency p50 {results['p50_ms']} ms, p99 {results['p99_ms']} ms")
+    for endpoint, stats in results['endpoints'].items():
+        print(f"  {endpoint:16} {stats['requests']:7} requests  p50 {stats['p50_ms']:8.2f} ms  p99 {stats['p99_ms']:8.2f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,315 @@
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import datagen
+import time_tracker
+from database import DEFAULT_BUSY_TIMEOUT_MS
+
+# Simulated clients replaying a mix of what people do in the tracker, all at once, like the
+# whole company logging its week at 5pm on Friday.
+#
+# threads: one process, every client a thread with a read connection of its own. Writes share
+# the process's single writer connection, and so queue up in-process, like the API server.
+# processes: every client a process with its connections of its own, like many terminal
+# sessions: the writers race for the file lock and wait in SQLite's busy handler.
+#
+# Session access times are written back by update_session_access once every --flush-interval
+# seconds per process, instead of by the session store's own thread, so that write is measured.
+#
+# A "database is locked" error is retried up to --retries times; latencies include the retries.
+MODES = ['threads', 'processes']
+WRITE_PATHS = ['direct', 'queued']
+# Operation -> share of the mix
+DEFAULT_MIX = {
+    'login': 1,
+    'create_time_entry': 4,
+    'update_session_access': 6,
+    'get_report_data': 2,
+    'list_time_entries': 3,
+}
+MIX_SETTING = re.compile(r'^\s*([a-z_]+)\s*=\s*(\d+)\s*$')
+REPORT_RANGES = ['this-month', 'last-month', 'this-year']
+RETRY_BACKOFF_SECONDS = 0.01
+BARRIER_TIMEOUT_SECONDS = 300
+# Opening the database and logging in before the clock starts
+SETUP_RETRIES = 100
+
+def parse_mix(text):
+    # "operation=weight,..." on top of DEFAULT_MIX; a weight of 0 leaves the operation out
+    mix = dict(DEFAULT_MIX)
+    for setting in filter(str.strip, text.split(',')):
+        match = MIX_SETTING.match(setting)
+        if not match or match.group(1) not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"invalid mix setting {setting!r}, expected one of {', '.join(DEFAULT_MIX)}=weight")
+        mix[match.group(1)] = int(match.group(2))
+    if not any(mix.values()):
+        raise argparse.ArgumentTypeError("the mix is empty")
+    return mix
+
+class Client:
+    # One simulated person: logs in as a random user, then runs operations picked from the mix
+    # When the clients of this process last wrote back session access times
+    last_flush = None
+
+    def __init__(self, number, users, projects, write_path, flush_interval):
+        self.rng = random.Random(number)
+        self.users = users
+        self.projects = projects
+        self.write_path = write_path
+        self.flush_interval = flush_interval
+        self.user_id = None
+        self.session_id = None
+
+    def write(self, unit):
+        if self.write_path == 'queued':
+            return time_tracker.submit(unit).result()
+        return time_tracker.run_unit(unit)
+
+    def login(self):
+        user_id = self.rng.choice(self.users)
+        user = time_tracker.authenticate(f"user{user_id}", datagen.PASSWORD)
+        self.session_id = self.write(time_tracker.sessions.creation(user[0]))
+        self.user_id = user[0]
+
+    def create_time_entry(self):
+        entry_date = date.today() - timedelta(days=self.rng.randint(0, 6))
+        self.write(time_tracker.time_entry_insert(self.rng.choice(self.projects), self.user_id, entry_date,
+                                                  self.rng.randint(1, 8), self.rng.choice(time_tracker.CATEGORIES), "Load test"))
+
+    def update_session_access(self):
+        time_tracker.update_session_access(self.session_id)
+        now = time.perf_counter()
+        if Client.last_flush is None:
+            Client.last_flush = now
+        elif now - Client.last_flush >= self.flush_interval:
+            time_tracker.sessions.flush()
+            Client.last_flush = time.perf_counter()
+
+    def get_report_data(self):
+        date_range = time_tracker.preset_date_range(self.rng.choice(REPORT_RANGES))
+        if self.rng.random() < 0.5:
+            time_tracker.get_report_data(self.rng.choice(self.projects), '1', [self.user_id], date_range)
+        else:
+            time_tracker.get_report_data(self.rng.choice(self.projects), '2', [], date_range)
+
+    def list_time_entries(self):
+        # The first screen of the listing: a page and its subtotals
+        entries, _ = time_tracker.get_time_entries_page(self.user_id)
+        if entries:
+            time_tracker.get_page_totals(self.user_id, entries)
+
+def is_locked(error):
+    return isinstance(error, sqlite3.OperationalError) and ('locked' in str(error) or 'busy' in str(error))
+
+def new_stat():
+    return {'latencies': [], 'locked': 0, 'retries': 0, 'failures': 0, 'errors': {}}
+
+def perform(function, stat, retries):
+    # Runs function, again while it finds the database locked, and records the outcome in stat.
+    # True once it succeeded.
+    started = time.perf_counter()
+    for attempt in range(retries + 1):
+        try:
+            function()
+        except Exception as error:
+            if not is_locked(error):
+                name = f"{type(error).__name__}: {error}"
+                stat['errors'][name] = stat['errors'].get(name, 0) + 1
+                return False
+            stat['locked'] += 1
+            if attempt == retries:
+                stat['failures'] += 1
+                return False
+            stat['retries'] += 1
+            time.sleep(RETRY_BACKOFF_SECONDS * (attempt + 1))
+        else:
+            stat['latencies'].append(time.perf_counter() - started)
+            return True
+
+def run_client(number, options, barrier, results):
+    # Logs in, waits for every other client, then runs operations until the duration is over.
+    # Puts {operation: stat} and the seconds it ran.
+    if options['own_database']:
+        time_tracker.use_database(options['path'], busy_timeout_ms=options['busy_timeout_ms'])
+    client = Client(number, options['users'], options['projects'], options['write_path'], options['flush_interval'])
+    setup = new_stat()
+    if not perform(client.login, setup, SETUP_RETRIES):
+        barrier.abort()
+        results.put((number, None, ', '.join(setup['errors']) or "database is locked"))
+        return
+    stats = {operation: new_stat() for operation in options['mix']}
+    operations = [operation for operation, weight in options['mix'].items() for _ in range(weight)]
+    try:
+        barrier.wait(BARRIER_TIMEOUT_SECONDS)
+    except threading.BrokenBarrierError:
+        results.put((number, None, "another client failed to start"))
+        return
+
+    try:
+        started = time.perf_counter()
+        deadline = started + options['duration']
+        while time.perf_counter() < deadline:
+            operation = client.rng.choice(operations)
+            perform(getattr(client, operation), stats[operation], options['retries'])
+        elapsed = time.perf_counter() - started
+        if options['own_database']:
+            # Pending session access times, outside the measured time
+            perform(time_tracker.sessions.flush, new_stat(), SETUP_RETRIES)
+            time_tracker.stop_writes()
+            time_tracker.db.close()
+    except Exception as error:
+        results.put((number, None, f"{type(error).__name__}: {error}"))
+        return
+    results.put((number, (stats, elapsed), None))
+
+def run_load(mode, options, clients):
+    # [(stats, seconds)] of every client
+    Client.last_flush = None
+    if mode == 'processes':
+        context = multiprocessing.get_context('spawn')
+        barrier, results, start = context.Barrier(clients + 1), context.Queue(), context.Process
+    else:
+        barrier, results, start = threading.Barrier(clients + 1), queue.Queue(), threading.Thread
+        time_tracker.use_database(options['path'], busy_timeout_ms=options['busy_timeout_ms'])
+    workers = [start(target=run_client, args=(number, options, barrier, results)) for number in range(clients)]
+    for worker in workers:
+        worker.start()
+    try:
+        barrier.wait(BARRIER_TIMEOUT_SECONDS)
+    except threading.BrokenBarrierError:
+        pass
+    collected = []
+    problems = []
+    for _ in workers:
+        number, result, problem = results.get()
+        if problem:
+            problems.append(f"client {number}: {problem}")
+        else:
+            collected.append(result)
+    for worker in workers:
+        worker.join()
+    if mode == 'threads':
+        time_tracker.stop_writes()
+        time_tracker.sessions.stop()
+        time_tracker.db.close()
+    if problems:
+        raise RuntimeError("; ".join(problems))
+    return collected
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def summarize(collected, mix):
+    seconds = max(elapsed for _, elapsed in collected)
+    operations = {}
+    for operation in mix:
+        stats = [client_stats[operation] for client_stats, _ in collected]
+        latencies = [sample for stat in stats for sample in stat['latencies']]
+        errors = {}
+        for stat in stats:
+            for name, count in stat['errors'].items():
+                errors[name] = errors.get(name, 0) + count
+        summary = {
+            'operations': len(latencies),
+            'per_sec': round(len(latencies) / seconds, 1),
+            'locked': sum(stat['locked'] for stat in stats),
+            'retries': sum(stat['retries'] for stat in stats),
+            'failures': sum(stat['failures'] for stat in stats),
+            'errors': errors,
+        }
+        if latencies:
+            for name, fraction in [('p50_ms', 0.50), ('p95_ms', 0.95), ('p99_ms', 0.99)]:
+                summary[name] = round(percentile(latencies, fraction) * 1000, 2)
+        operations[operation] = summary
+    total = sum(summary['operations'] for summary in operations.values())
+    return {
+        'seconds': round(seconds, 3),
+        'operations': total,
+        'per_sec': round(total / seconds, 1),
+        'locked': sum(summary['locked'] for summary in operations.values()),
+        'retries': sum(summary['retries'] for summary in operations.values()),
+        'failures': sum(summary['failures'] for summary in operations.values()),
+        'errors': sum(sum(summary['errors'].values()) for summary in operations.values()),
+        'by_operation': operations,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the data layer with many concurrent clients, each with its own connections.")
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 8, 32], help="concurrent client counts to run (default: %(default)s)")
+    parser.add_argument('--mode', choices=MODES, default='threads', help="clients as threads of one process or as processes (default: %(default)s)")
+    parser.add_argument('--writes', choices=WRITE_PATHS, default='direct', help="a transaction per write, or through the group-committing write queue (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of load per run (default: %(default)s)")
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="operation=weight,... changing the default mix " + ','.join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()))
+    parser.add_argument('--busy-timeout-ms', type=int, default=DEFAULT_BUSY_TIMEOUT_MS, help="how long SQLite waits for the file lock (default: %(default)s)")
+    parser.add_argument('--retries', type=int, default=3, help="retries of an operation that found the database locked (default: %(default)s)")
+    parser.add_argument('--flush-interval', type=float, default=time_tracker.sessions.flush_interval,
+                        help="seconds between write-backs of session access times (default: %(default)s)")
+    parser.add_argument('--scale', choices=list(datagen.SCALES), default='100k', help="synthetic data size (default: %(default)s)")
+    parser.add_argument('--db', help="run against this database, generating it if missing; it is written to (default: a temporary one)")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.db or os.path.join(scratch, 'load.db')
+        if not os.path.exists(path):
+            print(f"Generating {args.scale} entries into {path}", file=sys.stderr)
+            datagen.generate(path, *datagen.SCALES[args.scale], progress=True)
+        time_tracker.use_database(path)
+        users = [user[0] for user in time_tracker.get_users()]
+        projects = [project_id for project_id, _ in time_tracker.get_projects()]
+        time_tracker.db.close()
+        options = {
+            'path': path,
+            'own_database': args.mode == 'processes',
+            'write_path': args.writes,
+            'duration': args.duration,
+            'mix': {operation: weight for operation, weight in args.mix.items() if weight},
+            'busy_timeout_ms': args.busy_timeout_ms,
+            'retries': args.retries,
+            'flush_interval': args.flush_interval,
+            # Users with the data generator's password
+            'users': users,
+            'projects': projects,
+        }
+        if not args.json:
+            print(f"{args.mode}, {args.writes} writes, {args.duration:g} s per run, busy timeout {args.busy_timeout_ms} ms, "
+                  f"mix {','.join(f'{name}={weight}' for name, weight in options['mix'].items())}")
+        for clients in args.clients:
+            result = {'clients': clients, **summarize(run_load(args.mode, options, clients), options['mix'])}
+            results.append(result)
+            if args.json:
+                continue
+            print(f"\n{clients} clients: {result['operations']:,} operations, {result['per_sec']:,.1f}/sec, "
+                  f"{result['locked']} locked, {result['retries']} retries, {result['failures']} failed, {result['errors']} errors")
+            for operation, summary in result['by_operation'].items():
+                latency = (f"p50 {summary['p50_ms']:8.2f} ms  p95 {summary['p95_ms']:8.2f} ms  p99 {summary['p99_ms']:8.2f} ms"
+                           if summary['operations'] else f"{'no samples':>50}")
+                print(f"  {operation:22} {summary['operations']:8,} {summary['per_sec']:9,.1f}/sec  {latency}  "
+                      f"{summary['locked']:4} locked {summary['retries']:4} retries {summary['failures']:4} failed")
+                for name, count in summary['errors'].items():
+                    print(f"    {count} x {name}")
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return 1 if any(result['failures'] or result['errors'] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
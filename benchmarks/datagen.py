@@ -0,0 +1,129 @@
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import time_tracker
+from dates import day_number, iso_week_number
+
+# Scale name -> (entries, users, projects)
+SCALES = {
+    '1k': (1000, 20, 10),
+    '100k': (100000, 200, 50),
+    '10m': (10000000, 2000, 500),
+}
+# Relative share of each category in time_tracker.CATEGORIES
+CATEGORY_WEIGHTS = [50, 15, 10, 15, 10]
+# Weekdays carry most of the hours
+WEEKDAY_WEIGHTS = [10, 10, 10, 10, 9, 1, 1]
+HOURS_WEIGHTS = [2, 4, 6, 10, 8, 6, 4, 6]  # 1..8 hours
+YEARS_OF_HISTORY = 3
+BATCH_SIZE = 50000
+PASSWORD = 'secret'
+
+def zipf_cum_weights(count, exponent):
+    # A few users and projects account for most entries, like a real team
+    total = 0.0
+    cum_weights = []
+    for rank in range(1, count + 1):
+        total += 1 / rank ** exponent
+        cum_weights.append(total)
+    return cum_weights
+
+def entry_rows(rng, entries, users, projects, today):
+    # (project_id, user_id, day, iso_week, hours, category, notes) in batches of BATCH_SIZE.
+    # User and project ids are shuffled so the busiest ones are not simply id 1.
+    user_ids = rng.sample(range(1, users + 1), users)
+    project_ids = rng.sample(range(1, projects + 1), projects)
+    user_weights = zipf_cum_weights(users, 1.1)
+    project_weights = zipf_cum_weights(projects, 1.2)
+    days = [today - timedelta(days=offset) for offset in range(YEARS_OF_HISTORY * 365)]
+    day_keys = [(day_number(day), iso_week_number(day)) for day in days]
+    day_weights = list(itertools.accumulate(WEEKDAY_WEIGHTS[day.weekday()] for day in days))
+    category_weights = list(itertools.accumulate(CATEGORY_WEIGHTS))
+    hours_weights = list(itertools.accumulate(HOURS_WEIGHTS))
+
+    remaining = entries
+    while remaining:
+        count = min(BATCH_SIZE, remaining)
+        remaining -= count
+        yield list(zip(
+            rng.choices(project_ids, cum_weights=project_weights, k=count),
+            rng.choices(user_ids, cum_weights=user_weights, k=count),
+            *zip(*rng.choices(day_keys, cum_weights=day_weights, k=count)),
+            rng.choices(range(1, 9), cum_weights=hours_weights, k=count),
+            rng.choices(time_tracker.CATEGORIES, cum_weights=category_weights, k=count),
+            (f"Ticket {rng.randint(1, 99999)}" for _ in range(count)),
+        ))
+
+def generate(path, entries, users, projects, seed=1, today=None, progress=False):
+    # Fills a new database at path. The same arguments (and today) always produce the same rows.
+    if os.path.exists(path):
+        raise FileExistsError(f"{path} already exists")
+    rng = random.Random(seed)
+    today = today or date.today()
+    time_tracker.use_database(path)
+    db = time_tracker.db
+    started = time.perf_counter()
+
+    password = time_tracker.hash_password(PASSWORD)
+    with db.transaction() as cursor:
+        cursor.executemany(
+            'INSERT INTO users (id, username, password, first_name, last_name) VALUES (?, ?, ?, ?, ?)',
+            ((i, f"user{i}", password, f"First{i}", f"Last{i}") for i in range(1, users + 1)),
+        )
+        cursor.executemany('INSERT INTO projects (id, name) VALUES (?, ?)', ((i, f"Project {i}") for i in range(1, projects + 1)))
+        # One session per user; a quarter of them expired
+        now = datetime.now()
+        cursor.executemany(
+            'INSERT INTO sessions (id, user_id, created_at, last_accessed) VALUES (?, ?, ?, ?)',
+            ((f"session-{i}", i, (now - timedelta(days=30)).isoformat(),
+              (now - timedelta(days=30 if i % 4 == 0 else rng.randint(0, 3))).isoformat()) for i in range(1, users + 1)),
+        )
+
+    # Rollups and the search index are built once at the end instead of by the per-row triggers.
+    # Generated entries are not journaled: a first sync export sends every row anyway.
+    with db.transaction() as cursor:
+        cursor.execute('DROP TRIGGER IF EXISTS time_entries_rollup_insert')
+        cursor.execute('DROP TRIGGER IF EXISTS time_entries_search_insert')
+        cursor.execute('DROP TRIGGER IF EXISTS time_entries_journal_insert')
+    inserted = 0
+    for batch in entry_rows(rng, entries, users, projects, today):
+        with db.transaction() as cursor:
+            cursor.executemany('''
+                INSERT INTO time_entries (project_id, user_id, day, iso_week, hours, category, notes)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', batch)
+        inserted += len(batch)
+        if progress:
+            print(f"\r{inserted:,} entries ({inserted / (time.perf_counter() - started):,.0f}/sec)", end='', file=sys.stderr)
+    with db.transaction() as cursor:
+        time_tracker.create_rollup_triggers(cursor)
+        time_tracker.rebuild_rollups(cursor)
+        time_tracker.create_search_triggers(cursor)
+        time_tracker.add_entries_to_search_index(cursor, 0)
+        time_tracker.create_journal_triggers(cursor)
+    if progress:
+        print(f"\nGenerated {path} in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+    time_tracker.db.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic time tracker database.")
+    parser.add_argument('path', help="database file to create")
+    parser.add_argument('--scale', choices=list(SCALES), default='100k', help="entries, users and projects preset (default: %(default)s)")
+    parser.add_argument('--entries', type=int, help="override the number of entries")
+    parser.add_argument('--seed', type=int, default=1, help="random seed (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    entries, users, projects = SCALES[args.scale]
+    generate(args.path, args.entries or entries, users, projects, args.seed, progress=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import argparse
+import io
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import render
+import time_tracker
+from dates import day_label, day_number
+from time_tracker import CATEGORIES
+
+def synthetic_rows(count, seed=1):
+    # Rows shaped like get_report_data() output (dates as day numbers), newest first, a few entries per day
+    rng = random.Random(seed)
+    rows = []
+    day = date(2026, 12, 31)
+    for entry_id in range(count, 0, -1):
+        if rng.random() < 0.2:
+            day -= timedelta(days=1)
+        rows.append((entry_id, rng.randint(1, 20), day_number(day), rng.randint(1, 8),
+                     rng.choice(CATEGORIES), "Worked on ticket %d" % rng.randint(1, 9999),
+                     "Project %d" % rng.randint(1, 20), "First%d" % rng.randint(1, 50), "Last"))
+    return rows
+
+def legacy_print_report(entries, project_id, date_range):
+    # print_report as it was before the buffered renderer and integer dates: several print() calls
+    # and a strptime() per row, over rows with text dates
+    start_date, end_date = date_range
+    total_hours = sum(float(entry[3]) for entry in entries)
+
+    print(f"\nReport for {'all projects' if project_id == 0 else f'Project ID {project_id}'} from {start_date} to {end_date}")
+    print(f"Total Hours: {total_hours:.2f}")
+
+    current_date = None
+    current_week_start = None
+    daily_total = 0
+    weekly_total = 0
+
+    print("\n{:3} | {:7} | {:5} | {:22} | {:20} | {}".format("ID", "Project", "Hours", "Category", "User", "Notes"))
+    print("-" * 100)
+
+    for entry in entries:
+        entry_date = datetime.strptime(entry[2], "%Y-%m-%d").date()
+
+        if entry_date != current_date:
+            if current_date:
+                print("Daily total: {:.2f} hours".format(daily_total))
+
+            if not current_week_start or entry_date < current_week_start:
+                if current_week_start:
+                    print("Weekly total: {:.2f} hours\n".format(weekly_total))
+                current_week_start = entry_date - timedelta(days=entry_date.weekday())
+                weekly_total = 0
+
+            print("\nDate: {} ({})".format(entry_date.strftime('%Y-%m-%d'), entry_date.strftime('%A')))
+            print("-" * 100)
+            current_date = entry_date
+            daily_total = 0
+
+        print("{:3} | {:7} | {:5.2f} | {:22} | {:20} | {}".format(
+            entry[0], entry[6], float(entry[3]), entry[4], f"{entry[7]} {entry[8]}", entry[5]
+        ))
+
+        daily_total += float(entry[3])
+        weekly_total += float(entry[3])
+
+    if current_date:
+        print("Daily total: {:.2f} hours".format(daily_total))
+        print("Weekly total: {:.2f} hours".format(weekly_total))
+
+def open_pipe():
+    # Text stream whose other end is drained by a thread, like piping into cat
+    read_fd, write_fd = os.pipe()
+
+    def drain():
+        with os.fdopen(read_fd, 'rb') as reader:
+            while reader.read(1 << 16):
+                pass
+
+    thread = threading.Thread(target=drain, daemon=True)
+    thread.start()
+    # Line buffered, like stdout on a terminal, so print() per line costs a write each
+    return os.fdopen(write_fd, 'w', buffering=1), thread
+
+def time_render(renderer, rows, runs):
+    best = None
+    for _ in range(runs):
+        stream, thread = open_pipe()
+        started = time.perf_counter()
+        renderer(rows, stream)
+        stream.flush()
+        elapsed = time.perf_counter() - started
+        stream.close()
+        thread.join()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def render_before(rows, stream):
+    with redirect_stdout(stream):
+        legacy_print_report(rows, 0, (date(2026, 1, 1), date(2026, 12, 31)))
+
+def render_after(rows, stream):
+    time_tracker.run_report(rows, [time_tracker.ReportPrinter(0, (date(2026, 1, 1), date(2026, 12, 31)), stream)])
+
+def time_clear(runs):
+    # os.system("clear") as before, against writing the ANSI sequence
+    started = time.perf_counter()
+    for _ in range(runs):
+        os.system('clear >/dev/null 2>&1' if os.name != 'nt' else 'cls >NUL')
+    system_clear = (time.perf_counter() - started) / runs
+
+    buffer = io.StringIO()
+    started = time.perf_counter()
+    for _ in range(runs):
+        buffer.write(render.ANSI_CLEAR)
+    ansi_clear = (time.perf_counter() - started) / runs
+    return system_clear, ansi_clear
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time rendering a large report to a pipe, before and after the buffered renderer.")
+    parser.add_argument('--rows', type=int, default=100000, help="report rows (default: %(default)s)")
+    parser.add_argument('--runs', type=int, default=3, help="best of N runs (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    rows = synthetic_rows(args.rows)
+    text_rows = [entry[:2] + (day_label(entry[2]),) + entry[3:] for entry in rows]
+    before = time_render(render_before, text_rows, args.runs)
+    after = time_render(render_after, rows, args.runs)
+    system_clear, ansi_clear = time_clear(20)
+
+    print(f"Rendering {args.rows} report rows to a pipe (best of {args.runs})")
+    print(f"  print() per row:   {before * 1000:9.1f} ms")
+    print(f"  buffered renderer: {after * 1000:9.1f} ms  ({before / after:.1f}x faster)")
+    print("Clearing the screen")
+    print(f"  os.system('clear'): {system_clear * 1e6:9.1f} us")
+    print(f"  ANSI sequence:      {ansi_clear * 1e6:9.1f} us")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
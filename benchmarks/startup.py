@@ -0,0 +1,76 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# What a one-shot invocation pays: importing the module, then the first query (which opens
+# the database and checks the schema version)
+SCENARIOS = {
+    'import': "import time_tracker",
+    'first_query': "import time_tracker; time_tracker.get_user_by_id(1)",
+}
+
+def run_python(args, env):
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr)
+    return elapsed, result.stderr
+
+def import_times(env):
+    # Parses python -X importtime output into {module: cumulative microseconds}
+    _, stderr = run_python(['-X', 'importtime', '-c', SCENARIOS['import']], env)
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure time_tracker startup time.")
+    parser.add_argument('--runs', type=int, default=20, help="runs per scenario (default: %(default)s)")
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to list (default: %(default)s)")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, TIME_TRACKER_DB=os.path.join(tmp, 'time_tracker.db'))
+        # Create and migrate the database once, so the runs measure the steady state
+        run_python(['-c', SCENARIOS['first_query']], env)
+
+        results = {'wall_clock_ms': {}, 'import_time_us': {}}
+        for name, code in SCENARIOS.items():
+            samples = [run_python(['-c', code], env)[0] * 1000 for _ in range(args.runs)]
+            results['wall_clock_ms'][name] = {
+                'median': round(statistics.median(samples), 2),
+                'min': round(min(samples), 2),
+                'max': round(max(samples), 2),
+            }
+
+        times = import_times(env)
+        slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)[:args.top]
+        results['import_time_us'] = dict(slowest)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+
+    print(f"Wall clock over {args.runs} runs (ms)")
+    for name, stats in results['wall_clock_ms'].items():
+        print(f"  {name:12} median {stats['median']:8.2f}  min {stats['min']:8.2f}  max {stats['max']:8.2f}")
+    print("\nSlowest imports (cumulative us, python -X importtime)")
+    for module, cumulative in results['import_time_us'].items():
+        print(f"  {cumulative:10}  {module}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,295 @@
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import bulk_import
+import datagen
+import time_tracker
+from dates import day_number
+from exporters import CsvExporter
+from sessions import SessionStore
+
+# Each benchmark runs at least MIN_RUNS times and until BUDGET_SECONDS or MAX_RUNS are reached
+MIN_RUNS = 5
+MAX_RUNS = 200
+BUDGET_SECONDS = 2.0
+# The whole suite runs this many times; each benchmark keeps the lowest of its medians
+DEFAULT_REPEATS = 3
+# A benchmark whose median and fastest run are both this much slower than the baseline is a
+# regression, provided the median grew by more than NOISE_FLOOR_MS and by more than the medians
+# of either run's repeats varied. The small scale's sub-millisecond timings vary more from one
+# run to the next, so they need a larger slowdown.
+DEFAULT_THRESHOLDS = {'1k': 0.5, '100k': 0.25, '10m': 0.25}
+NOISE_FLOOR_MS = 0.05
+BULK_INSERT_ROWS = 20000
+SINGLE_INSERTS = 100
+
+def measure(function, setup=None, min_runs=MIN_RUNS, max_runs=MAX_RUNS, budget=BUDGET_SECONDS):
+    # Wall clock samples in seconds; setup() runs before every sample and is not timed
+    if setup:
+        setup()
+    function()  # warm up
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < min_runs or (len(samples) < max_runs and time.perf_counter() - started < budget):
+        if setup:
+            setup()
+        sample_started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - sample_started)
+    return samples
+
+def summarize(repeats, rows=None):
+    # repeats holds the samples of every run of the suite. median_ms is the lowest of their
+    # medians, the one least disturbed by the rest of the machine; spread_ms is how far apart
+    # the medians were.
+    medians = [statistics.median(samples) for samples in repeats]
+    samples = [sample for repeat in repeats for sample in repeat]
+    result = {
+        'median_ms': round(min(medians) * 1000, 3),
+        'min_ms': round(min(samples) * 1000, 3),
+        'max_ms': round(max(samples) * 1000, 3),
+        'spread_ms': round((max(medians) - min(medians)) * 1000, 3),
+        'runs': len(samples),
+        'repeats': len(repeats),
+    }
+    if rows is not None:
+        result['rows'] = rows
+    return result
+
+def busiest(column):
+    cursor = time_tracker.db.cursor()
+    cursor.execute(f'SELECT {column} FROM daily_totals GROUP BY {column} ORDER BY SUM(entries) DESC LIMIT 1')
+    return cursor.fetchone()[0]
+
+def read_benchmarks(scratch):
+    # ({name: (function, setup)}, {name: rows returned}). Reports are timed with an empty
+    # report cache unless the name says cached.
+    today = date.today()
+    this_month = (today.replace(day=1), today)
+    this_year = (today - timedelta(days=365), today)
+    all_time = time_tracker.preset_date_range('all-time')
+    user_id = busiest('user_id')
+    project_id = busiest('project_id')
+    cache = time_tracker.report_cache
+    devnull = open(os.devnull, 'w')
+    csv_path = os.path.join(scratch, 'export.csv')
+
+    def report(project, users, date_range):
+        user_choice = '3' if users else '2'
+        return lambda: time_tracker.get_report_data(project, user_choice, users, date_range)
+
+    def print_report():
+        entries = time_tracker.iter_report_data(0, '2', [], this_month)
+        time_tracker.print_report(entries, 0, this_month, devnull)
+
+    def export_csv():
+        entries = time_tracker.iter_report_data(project_id, '2', [], this_year)
+        time_tracker.export_report(entries, CsvExporter(csv_path))
+
+    def entries_page(before):
+        def run():
+            entries, _ = time_tracker.get_time_entries_page(user_id, before)
+            daily, weekly = time_tracker.get_page_totals(user_id, entries)
+            time_tracker.format_time_entries_page(entries, daily, weekly)
+        return run
+
+    def session_lookup_db():
+        SessionStore(time_tracker.db).get('session-1')
+
+    # Loaded once here, so session_lookup_memory measures the in-memory path
+    time_tracker.sessions.get('session-2')
+
+    def row_count(function):
+        return len(function())
+
+    benchmarks = {
+        'report_month_all': (report(0, [], this_month), cache.clear),
+        'report_year_project': (report(project_id, [], this_year), cache.clear),
+        'report_year_user': (report(0, [user_id], this_year), cache.clear),
+        'report_month_all_cached': (report(0, [], this_month), None),
+        'print_report_month_all': (print_report, cache.clear),
+        'export_csv_year_project': (export_csv, cache.clear),
+        'summary_year_all': (lambda: time_tracker.get_summary_data(0, '2', [], this_year), None),
+        'list_entries_first_page': (entries_page(time_tracker.NEWEST_KEY), None),
+        'list_entries_old_page': (entries_page((day_number(today - timedelta(days=700)), 0)), None),
+        'search_rare_word': (lambda: time_tracker.search_entries('4242', 0, '2', [], all_time), None),
+        'search_common_word_user': (lambda: time_tracker.search_entries('ticket', 0, '3', [user_id], this_year), None),
+        'search_prefix': (lambda: time_tracker.search_entries('ticket 42*', 0, '2', [], all_time), None),
+        'project_users_all': (lambda: time_tracker.get_project_users(0), None),
+        'project_users_one': (lambda: time_tracker.get_project_users(project_id), None),
+        'session_lookup_db': (session_lookup_db, None),
+        'session_lookup_memory': (lambda: time_tracker.sessions.get('session-2'), None),
+    }
+    rows = {
+        'report_month_all': row_count(benchmarks['report_month_all'][0]),
+        'report_year_project': row_count(benchmarks['report_year_project'][0]),
+        'report_year_user': row_count(benchmarks['report_year_user'][0]),
+    }
+    return benchmarks, rows
+
+def write_benchmarks(scratch):
+    # Run last, on a copy of the database, since they add rows. {name: (function, setup, max_runs)}
+    today = date.today()
+    jsonl_path = os.path.join(scratch, 'bulk.jsonl')
+    with open(jsonl_path, 'w') as file:
+        for i in range(BULK_INSERT_ROWS):
+            entry_date = today - timedelta(days=i % 300)
+            file.write(json.dumps({'date': entry_date.strftime("%Y-%m-%d"), 'project': f"Project {i % 7 + 1}",
+                                   'hours': i % 8 + 1, 'category': time_tracker.CATEGORIES[i % 5],
+                                   'notes': f"Bulk {i}", 'user': f"First{i % 11 + 1} Last{i % 11 + 1}"}) + '\n')
+
+    def single_inserts():
+        for i in range(SINGLE_INSERTS):
+            time_tracker.add_time_entry(1, 1, today, 1, time_tracker.CATEGORIES[0], f"Single {i}")
+
+    def login():
+        # What POST /login and the interactive login do: check the password, then start a session
+        user = time_tracker.authenticate('user1', datagen.PASSWORD)
+        time_tracker.create_session(user[0])
+
+    def bulk_insert():
+        imported, rejected, _ = bulk_import.import_entries(jsonl_path, progress=False)
+        if rejected:
+            raise RuntimeError(f"{rejected} benchmark rows rejected")
+
+    return {
+        'login': (login, None, MAX_RUNS),
+        'add_time_entry_x100': (single_inserts, None, 10),
+        'bulk_import_20k': (bulk_insert, None, 10),
+    }
+
+def copy_database(source, target):
+    # Online copy, so the WAL of the source is included
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+
+def run_suite(path, scratch, only=None):
+    # ({name: samples}, {name: rows returned}) of one run of every benchmark
+    samples = {}
+    time_tracker.use_database(path)
+    benchmarks, rows = read_benchmarks(scratch)
+    for name, (function, setup) in benchmarks.items():
+        if only and name not in only:
+            continue
+        print(f"  {name}...", file=sys.stderr, flush=True)
+        samples[name] = measure(function, setup)
+    time_tracker.db.close()
+
+    # A fresh copy every run, so each one writes to a database of the same size
+    write_path = os.path.join(scratch, 'writes.db')
+    copy_database(path, write_path)
+    time_tracker.use_database(write_path)
+    for name, (function, setup, max_runs) in write_benchmarks(scratch).items():
+        if only and name not in only:
+            continue
+        print(f"  {name}...", file=sys.stderr, flush=True)
+        samples[name] = measure(function, setup, min_runs=3, max_runs=max_runs)
+    time_tracker.db.close()
+    return samples, rows
+
+def run_repeats(path, scratch, repeats, only=None):
+    # {name: summary} over several runs of the suite
+    runs = []
+    for repeat in range(repeats):
+        print(f"Run {repeat + 1} of {repeats}", file=sys.stderr)
+        samples, rows = run_suite(path, scratch, only)
+        runs.append(samples)
+    return {name: summarize([run[name] for run in runs], rows.get(name)) for name in runs[0]}
+
+def compare(results, baseline, threshold, floor_ms=NOISE_FLOOR_MS):
+    # [(name, baseline ms, current ms, change, regressed)] for benchmarks present in both
+    rows = []
+    for name, current in results['benchmarks'].items():
+        previous = baseline['benchmarks'].get(name)
+        if previous is None:
+            continue
+        change = current['median_ms'] / previous['median_ms'] - 1 if previous['median_ms'] else 0.0
+        fastest_change = current['min_ms'] / previous['min_ms'] - 1 if previous['min_ms'] else 0.0
+        # Baselines recorded before repeats existed have no spread
+        margin = max(floor_ms, previous.get('spread_ms', 0.0), current['spread_ms'])
+        regressed = change > threshold and fastest_change > threshold and current['median_ms'] - previous['median_ms'] > margin
+        rows.append((name, previous['median_ms'], current['median_ms'], change, regressed))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data-access hot paths on a synthetic database.")
+    parser.add_argument('--scale', choices=list(datagen.SCALES), default='100k', help="synthetic data size (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=1, help="data generator seed (default: %(default)s)")
+    parser.add_argument('--db', help="reuse this generated database, creating it if missing (default: a temporary one)")
+    parser.add_argument('--only', nargs='+', help="run only these benchmarks")
+    parser.add_argument('--output', help="also write the JSON results to this file, e.g. to save a baseline")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS, help="runs of the whole suite (default: %(default)s)")
+    parser.add_argument('--threshold', type=float, help="slowdown that counts as a regression (default: 0.5 at the 1k scale, 0.25 otherwise)")
+    parser.add_argument('--floor-ms', type=float, default=NOISE_FLOOR_MS, help="smallest slowdown in ms that counts as a regression (default: %(default)s)")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+    if args.threshold is None:
+        args.threshold = DEFAULT_THRESHOLDS[args.scale]
+
+    entries, users, projects = datagen.SCALES[args.scale]
+    with tempfile.TemporaryDirectory() as scratch:
+        path = args.db or os.path.join(scratch, 'data.db')
+        if not os.path.exists(path):
+            print(f"Generating {args.scale} entries into {path}", file=sys.stderr)
+            datagen.generate(path, entries, users, projects, args.seed, progress=True)
+        print("Running benchmarks", file=sys.stderr)
+        benchmarks = run_repeats(path, scratch, max(1, args.repeats), args.only)
+
+    results = {
+        'meta': {
+            'scale': args.scale,
+            'seed': args.seed,
+            'repeats': max(1, args.repeats),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+        },
+        'benchmarks': benchmarks,
+    }
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        if baseline['meta'].get('scale') != args.scale:
+            print(f"warning: baseline was recorded at scale {baseline['meta'].get('scale')}, not {args.scale}", file=sys.stderr)
+        comparison = compare(results, baseline, args.threshold, args.floor_ms)
+        results['comparison'] = {
+            name: {'baseline_ms': before, 'median_ms': after, 'change': round(change, 3), 'regression': regressed}
+            for name, before, after, change, regressed in comparison
+        }
+        regressions = [name for name, _, _, _, regressed in comparison if regressed]
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print(f"Scale {args.scale} (seed {args.seed}), lowest median of {max(1, args.repeats)} repeats of N runs")
+        for name, result in benchmarks.items():
+            line = f"  {name:26} {result['median_ms']:10.3f} ms  (min {result['min_ms']:.3f}, spread {result['spread_ms']:.3f}, {result['runs']} runs)"
+            if name in results.get('comparison', {}):
+                compared = results['comparison'][name]
+                line += f"  {compared['change']:+7.1%} vs baseline{'  REGRESSION' if compared['regression'] else ''}"
+            print(line)
+        if args.baseline:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%}" + (f": {', '.join(regressions)}" if regressions else ""))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
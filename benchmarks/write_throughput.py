@@ -0,0 +1,95 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import time_tracker
+
+# Each producer thread adds entries one at a time and waits for every one to be committed, like
+# API clients do. direct: each write is its own transaction (add_time_entry); queued: writes go
+# through the group-committing write queue (submit(time_entry_insert(...)).result()).
+MODES = ['direct', 'queued']
+USERS = 20
+PROJECTS = 10
+
+def seed(path):
+    time_tracker.use_database(path)
+    for i in range(1, USERS + 1):
+        time_tracker.add_user(f"user{i}", "secret", f"First{i}", f"Last{i}")
+    for i in range(1, PROJECTS + 1):
+        time_tracker.add_project(f"Project {i}")
+
+def produce(mode, producer, writes, errors):
+    today = date.today()
+    for i in range(writes):
+        unit = time_tracker.time_entry_insert(i % PROJECTS + 1, producer % USERS + 1, today - timedelta(days=i % 30), 1,
+                                              time_tracker.CATEGORIES[i % 5], f"Producer {producer} write {i}")
+        try:
+            if mode == 'direct':
+                time_tracker.run_unit(unit)
+            else:
+                time_tracker.submit(unit).result()
+        except Exception as error:
+            errors.append(error)
+
+def run(path, mode, producers, writes):
+    # (seconds, errors, write queue stats) for producers threads each making writes writes
+    time_tracker.use_database(path)
+    errors = []
+    threads = [threading.Thread(target=produce, args=(mode, producer, writes, errors)) for producer in range(producers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    stats = time_tracker.write_queue().stats()
+    time_tracker.stop_writes()
+    time_tracker.db.close()
+    return elapsed, errors, stats
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure entry writes/sec with concurrent producers, one transaction per write vs group commit.")
+    parser.add_argument('--producers', type=int, nargs='+', default=[1, 4, 16, 64], help="producer thread counts (default: %(default)s)")
+    parser.add_argument('--writes', type=int, default=2000, help="total writes per run (default: %(default)s)")
+    parser.add_argument('--modes', nargs='+', choices=MODES, default=MODES, help="write paths to compare (default: both)")
+    parser.add_argument('--json', action='store_true', help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'writes.db')
+        seed(path)
+        for producers in args.producers:
+            for mode in args.modes:
+                per_producer = max(1, args.writes // producers)
+                elapsed, errors, stats = run(path, mode, producers, per_producer)
+                total = per_producer * producers
+                results.append({
+                    'mode': mode,
+                    'producers': producers,
+                    'writes': total,
+                    'errors': len(errors),
+                    'seconds': round(elapsed, 3),
+                    'writes_per_sec': round(total / elapsed, 1),
+                    'writes_per_commit': round(stats['writes_per_batch'], 1) if mode == 'queued' else 1.0,
+                })
+                if not args.json:
+                    result = results[-1]
+                    print(f"  {mode:7} {producers:4} producers  {result['writes_per_sec']:10,.0f} writes/sec  "
+                          f"{result['writes_per_commit']:6.1f} writes/commit  {result['errors']} errors", flush=True)
+
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return 1 if any(result['errors'] for result in results) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from functools import lru_cache
+from operator import itemgetter
+
+import shards
+import time_tracker
+from dates import day_number, iso_week_number
+from time_tracker import CATEGORIES
+
+DEFAULT_BATCH_SIZE = 50000
+
+INSERT_ENTRY = '''
+    INSERT INTO time_entries (id, project_id, user_id, day, iso_week, hours, category, notes)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+class RejectedRow(Exception):
+    pass
+
+def read_csv_records(path):
+    # Same columns the CSV export writes: Date, Project, Hours, Category, Notes, User
+    with open(path, newline='') as csvfile:
+        reader = csv.reader(csvfile)
+        header = [column.strip().lower() for column in next(reader, [])]
+        for line_number, row in enumerate(reader, 2):
+            yield line_number, dict(zip(header, row)), row
+
+def read_jsonl_records(path):
+    with open(path) as jsonfile:
+        for line_number, line in enumerate(jsonfile, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_number, None, line
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, line
+                continue
+            yield line_number, {key.lower(): value for key, value in record.items()}, line
+
+def detect_format(path):
+    return 'jsonl' if path.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+class Lookups:
+    # Resolves project names and users to ids from dictionaries loaded once up front
+
+    def __init__(self, create_projects=False):
+        self.create_projects = create_projects
+        cursor = time_tracker.db.cursor()
+        # Rows dated in a closed year are rejected (see shards.py)
+        self.closed_through = shards.closed_through(time_tracker.db.attached)
+
+        cursor.execute("SELECT id, name FROM projects")
+        self.projects = {name: project_id for project_id, name in cursor.fetchall()}
+
+        cursor.execute("SELECT id, username, first_name, last_name FROM users")
+        self.usernames = {}
+        self.full_names = {}
+        for user_id, username, first_name, last_name in cursor.fetchall():
+            self.usernames[username] = user_id
+            full_name = f"{first_name} {last_name}"
+            # Full names are not unique; an ambiguous one cannot be resolved
+            self.full_names[full_name] = None if full_name in self.full_names else user_id
+
+    def project_id(self, name):
+        if name in self.projects:
+            return self.projects[name]
+        if not self.create_projects:
+            raise RejectedRow(f"Unknown project: {name!r}")
+        self.projects[name] = time_tracker.add_project(name)
+        return self.projects[name]
+
+    def user_id(self, record):
+        username = record.get('username')
+        if username:
+            if username not in self.usernames:
+                raise RejectedRow(f"Unknown username: {username!r}")
+            return self.usernames[username]
+
+        user = record.get('user')
+        if not user:
+            raise RejectedRow("Missing user")
+        if user in self.usernames:
+            return self.usernames[user]
+        if self.full_names.get(user):
+            return self.full_names[user]
+        if user in self.full_names:
+            raise RejectedRow(f"Ambiguous user name: {user!r}")
+        raise RejectedRow(f"Unknown user: {user!r}")
+
+@lru_cache(maxsize=65536)
+def normalize_date(text):
+    # (day number, ISO week). An import only has a few thousand distinct dates, so each one is parsed once.
+    entry_date = datetime.strptime(text.strip(), "%Y-%m-%d").date()
+    return day_number(entry_date), iso_week_number(entry_date)
+
+def parse_record(record, lookups):
+    if record is None:
+        raise RejectedRow("Malformed record")
+
+    entry_date = str(record.get('date') or '')
+    try:
+        day, iso_week = normalize_date(entry_date)
+    except ValueError:
+        raise RejectedRow(f"Invalid date: {entry_date!r}")
+    if lookups.closed_through is not None and day <= lookups.closed_through:
+        raise RejectedRow(f"Date in a closed year: {entry_date!r}")
+
+    try:
+        hours = float(record.get('hours'))
+    except (TypeError, ValueError):
+        raise RejectedRow(f"Invalid hours: {record.get('hours')!r}")
+    if hours < 0:
+        raise RejectedRow(f"Negative hours: {hours}")
+    if hours.is_integer():
+        hours = int(hours)
+
+    category = record.get('category')
+    if category not in CATEGORIES:
+        raise RejectedRow(f"Unknown category: {category!r}")
+
+    project = record.get('project')
+    if not project:
+        raise RejectedRow("Missing project")
+
+    return (lookups.project_id(project), lookups.user_id(record), day, iso_week, hours, category, record.get('notes') or '')
+
+def import_entries(path, batch_size=DEFAULT_BATCH_SIZE, reject_path=None, file_format=None, create_projects=False, progress=True):
+    # Streams the file into time_entries with one executemany() and one commit per batch.
+    # Returns (imported, rejected, seconds).
+    file_format = file_format or detect_format(path)
+    records = read_jsonl_records(path) if file_format == 'jsonl' else read_csv_records(path)
+    reject_path = reject_path or f"{os.path.splitext(path)[0]}.rejects.csv"
+
+    lookups = Lookups(create_projects)
+    imported = 0
+    rejected = 0
+    batch = []
+    reject_file = None
+    reject_writer = None
+    started = time.perf_counter()
+
+    def flush():
+        nonlocal imported
+        # Per-row rollup, search index and journal triggers dominate a bulk load, so the insert
+        # triggers are suspended inside this transaction and the whole batch is added to the
+        # rollups, the search index and the change journal with one statement each
+        with time_tracker.db.transaction() as cursor:
+            cursor.execute(f'SELECT {time_tracker.NEXT_ENTRY_ID} - 1')
+            last_id = cursor.fetchone()[0]
+            cursor.execute('DROP TRIGGER IF EXISTS time_entries_rollup_insert')
+            cursor.execute('DROP TRIGGER IF EXISTS time_entries_search_insert')
+            cursor.execute('DROP TRIGGER IF EXISTS time_entries_journal_insert')
+            batch.sort(key=itemgetter(2))
+            cursor.executemany(INSERT_ENTRY, ((entry_id, *row) for entry_id, row in enumerate(batch, last_id + 1)))
+            time_tracker.add_entries_to_rollups(cursor, last_id)
+            time_tracker.add_entries_to_search_index(cursor, last_id)
+            time_tracker.add_entries_to_journal(cursor, last_id)
+            time_tracker.create_rollup_triggers(cursor)
+            time_tracker.create_search_triggers(cursor)
+            time_tracker.create_journal_triggers(cursor)
+        time_tracker.report_cache.clear()
+        imported += len(batch)
+        batch.clear()
+        if progress:
+            elapsed = time.perf_counter() - started
+            print(f"Imported {imported} rows ({imported / elapsed:,.0f} rows/sec)", file=sys.stderr)
+
+    try:
+        for line_number, record, raw in records:
+            try:
+                batch.append(parse_record(record, lookups))
+            except RejectedRow as error:
+                if reject_writer is None:
+                    reject_file = open(reject_path, 'w', newline='')
+                    reject_writer = csv.writer(reject_file)
+                    reject_writer.writerow(['Line', 'Error', 'Record'])
+                reject_writer.writerow([line_number, str(error), raw if isinstance(raw, str) else json.dumps(raw)])
+                rejected += 1
+                continue
+
+            if len(batch) >= batch_size:
+                flush()
+
+        if batch:
+            flush()
+    finally:
+        if reject_file:
+            reject_file.close()
+
+    elapsed = time.perf_counter() - started
+    if progress:
+        rate = imported / elapsed if elapsed else 0
+        print(f"Done: {imported} rows imported, {rejected} rejected in {elapsed:.2f}s ({rate:,.0f} rows/sec)", file=sys.stderr)
+        if rejected:
+            print(f"Rejected rows written to {reject_path}", file=sys.stderr)
+    return imported, rejected, elapsed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import time entries from a CSV or JSONL file.")
+    parser.add_argument('path', help="CSV file with the CSV export columns, or a JSONL file with the same keys")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="input format (default: from the file extension)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="rows per transaction (default: %(default)s)")
+    parser.add_argument('--rejects', help="where to write rejected rows (default: <input>.rejects.csv)")
+    parser.add_argument('--create-projects', action='store_true', help="create projects that do not exist yet")
+    args = parser.parse_args(argv)
+
+    _, rejected, _ = import_entries(args.path, args.batch_size, args.rejects, args.format, args.create_projects)
+    return 1 if rejected else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,388 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from datetime import datetime
+
+import exporters
+import profiler
+import shards
+from dates import day_label
+import time_tracker
+
+ENTRY_FIELDS = ['id', 'project', 'date', 'hours', 'category', 'notes', 'user']
+
+def report_row(entry):
+    return {
+        'id': entry[0],
+        'project_id': entry[1],
+        'date': day_label(entry[2]),
+        'hours': float(entry[3]),
+        'category': entry[4],
+        'notes': entry[5],
+        'project': entry[6],
+        'user': f"{entry[7]} {entry[8]}",
+    }
+
+SEARCH_FIELDS = ['score', 'id', 'project_id', 'date', 'hours', 'category', 'notes', 'project', 'user']
+
+def search_row(entry):
+    # No score when the matches are listed newest first (see time_tracker.search_entries)
+    return {'score': None if entry[9] is None else round(entry[9], 3), **report_row(entry)}
+
+def entry_row(entry):
+    return {
+        'id': entry[0],
+        'project': entry[1],
+        'date': day_label(entry[2]),
+        'hours': float(entry[3]),
+        'category': entry[4],
+        'notes': entry[5],
+        'user': f"{entry[6]} {entry[7]}",
+    }
+
+class JsonReportWriter:
+    # Streams a report as one JSON document, with the total written after the rows
+
+    def __init__(self, stream, header):
+        self.stream = stream
+        self.header = header
+        self.total_hours = 0
+        self.count = 0
+
+    def start(self):
+        header = json.dumps(self.header)
+        self.stream.write(header[:-1] + ', "entries": [')
+
+    def add(self, entry):
+        row = report_row(entry)
+        self.stream.write((',\n' if self.count else '\n') + json.dumps(row))
+        self.total_hours += row['hours']
+        self.count += 1
+
+    def finish(self):
+        self.stream.write(f'\n], "count": {self.count}, "total_hours": {self.total_hours}}}\n')
+        self.stream.flush()
+
+def write_rows(rows, fields, output_format, stream):
+    if output_format == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        json.dump(list(rows), stream, indent=2)
+        stream.write('\n')
+
+def parse_date(text):
+    try:
+        return datetime.strptime(text, "%Y-%m-%d").date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {text!r}, expected YYYY-MM-DD")
+
+def parse_ids(text):
+    try:
+        return [int(part) for part in text.split(',') if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid id list {text!r}, expected e.g. 1,2,3")
+
+def report_filters(args):
+    # The same (project_id, user_choice, selected_users, date_range) the interactive menu builds
+    if args.start or args.end:
+        if not (args.start and args.end):
+            raise SystemExit("error: --from and --to must be given together")
+        date_range = (args.start, args.end)
+    else:
+        date_range = time_tracker.preset_date_range(args.range)
+    user_choice, selected_users = ('3', args.users) if args.users else ('2', [])
+    return args.project, user_choice, selected_users, date_range
+
+REPORT_RANGES = ['this-month', 'last-month', 'this-year']
+
+def add_filter_arguments(parser, ranges=REPORT_RANGES, default_range='this-month'):
+    parser.add_argument('--project', type=int, default=0, help="project id (default: 0, all projects)")
+    parser.add_argument('--users', type=parse_ids, help="comma-separated user ids (default: all users)")
+    parser.add_argument('--range', choices=ranges, default=default_range, help="preset date range (default: %(default)s)")
+    parser.add_argument('--from', dest='start', type=parse_date, help="start date, YYYY-MM-DD")
+    parser.add_argument('--to', dest='end', type=parse_date, help="end date, YYYY-MM-DD")
+
+def add_report_arguments(parser):
+    add_filter_arguments(parser)
+    parser.add_argument('--type', choices=PIVOT_TYPES, help="pivot report instead of the entry listing (needs numpy)")
+    parser.add_argument('--top', type=int, help="with --type: only the N rows with the most hours")
+
+PIVOT_TYPES = ['user-week', 'project-category', 'utilization']
+
+def pivot_report(args, project_id, user_choice, selected_users, date_range):
+    try:
+        return time_tracker.get_pivot_report(args.type, project_id, user_choice, selected_users, date_range, args.top)
+    except RuntimeError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return None
+
+def command_report(args):
+    project_id, user_choice, selected_users, date_range = report_filters(args)
+
+    if args.type:
+        pivot = pivot_report(args, project_id, user_choice, selected_users, date_range)
+        if pivot is None:
+            return 2
+        if args.format == 'text':
+            time_tracker.print_pivot_report(pivot, project_id, date_range)
+        elif args.format == 'csv':
+            pivot.write_csv(sys.stdout)
+        else:
+            header = pivot.header()
+            rows = (dict(zip(header, row)) for row in pivot.rows())
+            write_rows(rows, header, args.format, sys.stdout)
+        return 0
+
+    if args.summary:
+        days = time_tracker.get_summary_data(project_id, user_choice, selected_users, date_range)
+        if args.format == 'text':
+            time_tracker.print_summary_report(days, project_id, date_range)
+        else:
+            rows = ({'date': day_label(day), 'hours': hours, 'entries': entries} for day, hours, entries in days)
+            write_rows(rows, ['date', 'hours', 'entries'], args.format, sys.stdout)
+        return 0
+
+    entries = time_tracker.iter_report_data(project_id, user_choice, selected_users, date_range)
+    if args.format == 'text':
+        time_tracker.print_report(entries, project_id, date_range)
+    elif args.format == 'csv':
+        time_tracker.export_report(entries, exporters.CsvExporter(stream=sys.stdout))
+    else:
+        header = {'project_id': project_id, 'users': selected_users or 'all', 'from': str(date_range[0]), 'to': str(date_range[1])}
+        time_tracker.export_report(entries, JsonReportWriter(sys.stdout, header))
+    return 0
+
+def command_export(args):
+    project_id, user_choice, selected_users, date_range = report_filters(args)
+    exporter_class = exporters.EXPORT_FORMATS[args.format]
+    progress = None if args.quiet else exporters.print_progress
+
+    if args.type:
+        # Pivots are small, already aggregated tables: always written as CSV in one go
+        if args.format != 'csv':
+            print("error: pivot reports can only be exported as csv", file=sys.stderr)
+            return 2
+        pivot = pivot_report(args, project_id, user_choice, selected_users, date_range)
+        if pivot is None:
+            return 2
+        if args.output == '-':
+            pivot.write_csv(sys.stdout)
+            return 0
+        filename = args.output or time_tracker.report_filename(project_id)
+        with open(filename, 'w', newline='') as file:
+            pivot.write_csv(file)
+        print(f"Report exported to {filename} ({len(pivot.row_labels)} rows)", file=sys.stderr)
+        return 0
+
+    if args.output == '-':
+        if args.format == 'sqlite':
+            print("error: the sqlite format can only be written to a file", file=sys.stderr)
+            return 2
+        # Binary formats go to the raw stdout buffer
+        stream = sys.stdout.buffer if args.format == 'csv.gz' else sys.stdout
+        exporter = exporters.create_exporter(args.format, stream=stream, chunk_size=args.chunk_size)
+    else:
+        filename = args.output or time_tracker.report_filename(project_id, exporter_class.extension)
+        exporter = exporters.create_exporter(args.format, filename, chunk_size=args.chunk_size, progress=progress)
+
+    entries = time_tracker.iter_report_data(project_id, user_choice, selected_users, date_range, args.chunk_size)
+    time_tracker.export_report(entries, exporter)
+    if exporter.path:
+        if progress:
+            sys.stderr.write('\n')
+        print(f"Report exported to {exporter.path} ({exporter.rows} rows, {exporter.bytes_written()} bytes)", file=sys.stderr)
+    return 0
+
+def command_search(args):
+    project_id, user_choice, selected_users, date_range = report_filters(args)
+    text = ' '.join(args.words)
+    rows = time_tracker.search_entries(text, project_id, user_choice, selected_users, date_range, args.category, args.limit)
+    if args.format == 'text':
+        time_tracker.print_search_results(rows, text)
+    else:
+        write_rows((search_row(row) for row in rows), SEARCH_FIELDS, args.format, sys.stdout)
+    return 0
+
+def command_entries_list(args):
+    rows = (entry_row(entry) for entry in time_tracker.get_time_entries(args.user))
+    write_rows(rows, ENTRY_FIELDS, args.format, sys.stdout)
+    return 0
+
+def command_entries_add(args):
+    if args.category not in time_tracker.CATEGORIES:
+        print(f"error: unknown category {args.category!r}, expected one of: {', '.join(time_tracker.CATEGORIES)}", file=sys.stderr)
+        return 2
+    try:
+        entry_id = time_tracker.add_time_entry(args.project, args.user, args.date, args.hours, args.category, args.notes)
+    except shards.ClosedYearError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 2
+    json.dump({'id': entry_id}, sys.stdout)
+    sys.stdout.write('\n')
+    return 0
+
+def command_projects_list(args):
+    rows = ({'id': project_id, 'name': name} for project_id, name in time_tracker.get_projects())
+    write_rows(rows, ['id', 'name'], args.format, sys.stdout)
+    return 0
+
+def command_shards_list(args):
+    rows = ({'year': year, 'file': path, 'entries': entries, 'last_id': last_id} for year, path, entries, last_id in time_tracker.get_shards())
+    write_rows(rows, ['year', 'file', 'entries', 'last_id'], args.format, sys.stdout)
+    return 0
+
+def command_shards_close(args):
+    try:
+        years = time_tracker.close_years(args.through, args.vacuum)
+    except ValueError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 2
+    print(f"Closed {', '.join(map(str, years))}" if years else "No open years to close", file=sys.stderr)
+    return 0
+
+def command_check_plans(args):
+    return 0 if time_tracker.print_query_plans() else 1
+
+def command_rollups(args):
+    return 0 if time_tracker.check_rollups(rebuild=args.action == 'rebuild') else 1
+
+def command_import(args):
+    import bulk_import
+    return bulk_import.main(args.forward_args)
+
+def command_batch(args):
+    import batch_reports
+    return batch_reports.main(args.forward_args)
+
+def command_sync(args):
+    import sync
+    return sync.main(args.forward_args)
+
+def command_maintenance(args):
+    import maintenance
+    return maintenance.main(args.forward_args)
+
+def command_serve(args):
+    import api
+    return api.main(args.forward_args)
+
+def command_interactive(args):
+    # No command, e.g. `time_tracker.py --profile`: the interactive menu
+    time_tracker.run_interactive()
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='time_tracker.py', description="Time tracker. Run without arguments for the interactive menu.")
+    parser.add_argument('--db', help="database file (default: $TIME_TRACKER_DB or time_tracker.db)")
+    profiler.add_arguments(parser)
+    parser.set_defaults(handler=command_interactive)
+    commands = parser.add_subparsers(dest='command')
+
+    report = commands.add_parser('report', help="print a report")
+    add_report_arguments(report)
+    report.add_argument('--format', choices=['json', 'csv', 'text'], default='json', help="output format (default: %(default)s)")
+    report.add_argument('--summary', action='store_true', help="daily totals from the rollup tables instead of every entry")
+    report.set_defaults(handler=command_report)
+
+    export = commands.add_parser('export', help="export a report to a file")
+    add_report_arguments(export)
+    export.add_argument('--format', choices=list(exporters.EXPORT_FORMATS), default='csv', help="export format (default: %(default)s)")
+    export.add_argument('--output', help="output file, '-' for stdout (default: <Project>_<YYYYMMDD>.<format>)")
+    export.add_argument('--chunk-size', type=int, default=exporters.DEFAULT_CHUNK_SIZE, help="rows fetched and written at a time (default: %(default)s)")
+    export.add_argument('--quiet', action='store_true', help="no progress counter")
+    export.set_defaults(handler=command_export)
+
+    search = commands.add_parser('search', help="full-text search over the notes, best matches first")
+    search.add_argument('words', nargs='+', help="words that must all appear in the notes; word* matches a prefix")
+    add_filter_arguments(search, [*REPORT_RANGES, 'all-time'], 'all-time')
+    search.add_argument('--category', help="only entries in this category")
+    search.add_argument('--limit', type=int, default=time_tracker.SEARCH_LIMIT, help="most matches to return (default: %(default)s)")
+    search.add_argument('--format', choices=['json', 'csv', 'text'], default='json', help="output format (default: %(default)s)")
+    search.set_defaults(handler=command_search)
+
+    entries = commands.add_parser('entries', help="time entries").add_subparsers(dest='entries_command', required=True)
+    entries_list = entries.add_parser('list', help="list a user's time entries")
+    entries_list.add_argument('--user', type=int, required=True, help="user id")
+    entries_list.add_argument('--format', choices=['json', 'csv'], default='json', help="output format (default: %(default)s)")
+    entries_list.set_defaults(handler=command_entries_list)
+    entries_add = entries.add_parser('add', help="add a time entry")
+    entries_add.add_argument('--user', type=int, required=True, help="user id")
+    entries_add.add_argument('--project', type=int, required=True, help="project id")
+    entries_add.add_argument('--date', type=parse_date, default=datetime.now().date(), help="YYYY-MM-DD (default: today)")
+    entries_add.add_argument('--hours', type=int, required=True)
+    entries_add.add_argument('--category', required=True, help=f"one of: {', '.join(time_tracker.CATEGORIES)}")
+    entries_add.add_argument('--notes', default='')
+    entries_add.set_defaults(handler=command_entries_add)
+
+    projects = commands.add_parser('projects', help="projects").add_subparsers(dest='projects_command', required=True)
+    projects_list = projects.add_parser('list', help="list projects")
+    projects_list.add_argument('--format', choices=['json', 'csv'], default='json', help="output format (default: %(default)s)")
+    projects_list.set_defaults(handler=command_projects_list)
+
+    shard_commands = commands.add_parser('shards', help="closed years kept in per-year files").add_subparsers(dest='shards_command', required=True)
+    shards_list = shard_commands.add_parser('list', help="list the closed years")
+    shards_list.add_argument('--format', choices=['json', 'csv'], default='json', help="output format (default: %(default)s)")
+    shards_list.set_defaults(handler=command_shards_list)
+    shards_close = shard_commands.add_parser('close', help="move past years out of the main file into read-only per-year files; "
+                                                           "run while nothing else has the database open")
+    shards_close.add_argument('--through', type=int, help="last year to close (default: last year)")
+    shards_close.add_argument('--vacuum', action='store_true', help="compact the main file afterwards")
+    shards_close.set_defaults(handler=command_shards_close)
+
+    check_plans = commands.add_parser('check-plans', help="check that every report query uses an index")
+    check_plans.set_defaults(handler=command_check_plans)
+
+    rollups = commands.add_parser('rollups', help="verify or rebuild the rollup tables")
+    rollups.add_argument('action', choices=['verify', 'rebuild'])
+    rollups.set_defaults(handler=command_rollups)
+
+    bulk = commands.add_parser('import', help="bulk import entries from CSV or JSONL (see bulk_import.py --help)", add_help=False)
+    bulk.add_argument('forward_args', nargs=argparse.REMAINDER)
+    bulk.set_defaults(handler=command_import)
+
+    batch = commands.add_parser('batch', help="generate reports in parallel, e.g. one per project (see batch_reports.py --help)", add_help=False)
+    batch.add_argument('forward_args', nargs=argparse.REMAINDER)
+    batch.set_defaults(handler=command_batch)
+
+    sync = commands.add_parser('sync', help="export, apply or pull changes between databases (see sync.py --help)", add_help=False)
+    sync.add_argument('forward_args', nargs=argparse.REMAINDER)
+    sync.set_defaults(handler=command_sync)
+
+    maintenance = commands.add_parser('maintenance', help="analyze, vacuum, check or back up the database (see maintenance.py --help)", add_help=False)
+    maintenance.add_argument('forward_args', nargs=argparse.REMAINDER)
+    maintenance.set_defaults(handler=command_maintenance)
+
+    serve = commands.add_parser('serve', help="run the HTTP/JSON API (see api.py --help)", add_help=False)
+    serve.add_argument('forward_args', nargs=argparse.REMAINDER)
+    serve.set_defaults(handler=command_serve)
+
+    return parser
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if extra:
+        # REMAINDER misses options that come first (`serve --port 0`); hand them on as well
+        if not hasattr(args, 'forward_args'):
+            parser.error(f"unrecognized arguments: {' '.join(extra)}")
+        args.forward_args = extra + args.forward_args
+    if args.db:
+        time_tracker.use_database(args.db)
+    profiler.start_from_args(args)
+    try:
+        return args.handler(args)
+    except BrokenPipeError:
+        # Output piped into e.g. head: stop quietly instead of failing again on exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    finally:
+        time_tracker.sessions.stop()
+        profiler.finish_from_args(args)
+        time_tracker.db.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
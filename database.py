@@ -0,0 +1,207 @@
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+DEFAULT_PATH = 'time_tracker.db'
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+# Called with every new connection, e.g. by the profiler to install its trace callbacks
+CONNECTION_HOOKS = []
+
+# Settings applied to every connection. TIME_TRACKER_PRAGMA_PROFILE picks the profile and
+# TIME_TRACKER_PRAGMAS overrides single settings, e.g. "cache_size=-131072,mmap_size=0".
+# cache_size is in KiB when negative, per connection; mmap_size in bytes.
+PRAGMA_PROFILES = {
+    # Every commit is synced to disk before it returns
+    'durable': {'synchronous': 'FULL', 'cache_size': -32768, 'mmap_size': 256 * 1024 * 1024, 'temp_store': 'MEMORY'},
+    # WAL commits are only synced at checkpoints: a crash of the program loses nothing, a power
+    # failure can lose the latest commits. For bulk loads and disposable copies.
+    'fast': {'synchronous': 'NORMAL', 'cache_size': -131072, 'mmap_size': 1024 * 1024 * 1024, 'temp_store': 'MEMORY'},
+}
+DEFAULT_PRAGMA_PROFILE = 'durable'
+PRAGMA_SETTING = re.compile(r'^\s*([a-z_]+)\s*=\s*(-?\d+|[A-Za-z_]+)\s*$')
+
+def pragma_profile(name=None, overrides=None):
+    # {pragma: value} of the named profile with "name=value,..." overrides applied on top;
+    # both default to the environment
+    name = name or os.environ.get('TIME_TRACKER_PRAGMA_PROFILE') or DEFAULT_PRAGMA_PROFILE
+    if name not in PRAGMA_PROFILES:
+        raise ValueError(f"Unknown pragma profile {name!r}, expected one of: {', '.join(PRAGMA_PROFILES)}")
+    pragmas = dict(PRAGMA_PROFILES[name])
+    overrides = os.environ.get('TIME_TRACKER_PRAGMAS', '') if overrides is None else overrides
+    for setting in filter(str.strip, overrides.split(',')):
+        match = PRAGMA_SETTING.match(setting)
+        if not match:
+            raise ValueError(f"Invalid pragma setting {setting!r}, expected name=value")
+        pragmas[match.group(1)] = match.group(2)
+    return pragmas
+
+class Database:
+    # Connection manager for one SQLite file in WAL mode.
+    # Each thread gets its own read connection; all writes go through a single writer
+    # connection guarded by a lock, so readers never block on writers and writers queue up
+    # in-process instead of racing for the file lock.
+    # Nothing is opened until the first query; setup(database) runs once at that point.
+    # attach(conn) returns {schema: file URI} of other files to ATTACH to every new connection.
+    # pragmas defaults to pragma_profile().
+    cursor_class = sqlite3.Cursor
+
+    def __init__(self, path=None, busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, setup=None, attach=None, pragmas=None):
+        self.path = path or os.environ.get('TIME_TRACKER_DB', DEFAULT_PATH)
+        self.busy_timeout_ms = busy_timeout_ms
+        self.pragmas = pragma_profile() if pragmas is None else pragmas
+        self.setup = setup
+        self.attach = attach
+        # What attach() returned for the newest connection
+        self.attached = {}
+        self._setup_done = setup is None
+        self._in_setup = False
+        self._setup_lock = threading.RLock()
+        self.write_lock = threading.RLock()
+        self._local = threading.local()
+        self._writer = None
+        # data_version() bookkeeping, see there
+        self._monitor = None
+        self._monitor_lock = threading.Lock()
+        self._monitor_version = None
+        self._writer_version = None
+        self._external_commits = 0
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def connect(self, read_only=False):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,
+            check_same_thread=False,
+            uri=True,
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        # Lets maintenance.py hand free pages back to the file system. Only takes effect in a new
+        # file, before WAL mode is set, or at the next VACUUM of an existing one.
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('PRAGMA journal_mode = WAL')
+        for pragma, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        if self.attach:
+            self.attached = self.attach(conn)
+            for schema, uri in self.attached.items():
+                conn.execute('ATTACH DATABASE ? AS ?', (uri, schema))
+        if read_only:
+            conn.execute('PRAGMA query_only = ON')
+        for hook in CONNECTION_HOOKS:
+            hook(conn)
+        with self._connections_lock:
+            self._connections.append(conn)
+        return conn
+
+    def ensure_setup(self):
+        if self._setup_done:
+            return
+        with self._setup_lock:
+            # Queries issued by setup itself run without recursing into it
+            if self._setup_done or self._in_setup:
+                return
+            self._in_setup = True
+            try:
+                self.setup(self)
+                self._setup_done = True
+            finally:
+                self._in_setup = False
+
+    def reader(self):
+        # The calling thread's read connection, opened on first use
+        conn = getattr(self._local, 'reader', None)
+        if conn is None:
+            self.ensure_setup()
+            conn = self._local.reader = self.connect(read_only=True)
+        return conn
+
+    def cursor(self):
+        return self.reader().cursor(self.cursor_class)
+
+    def writer(self):
+        # Only use while holding write_lock
+        if self._writer is None:
+            self.ensure_setup()
+            self._writer = self.connect()
+            # The writer sees other connections' commits from here on; anything before is
+            # counted by the monitor
+            self._writer_version = self._writer.execute('PRAGMA data_version').fetchone()[0]
+            self.data_version()
+        return self._writer
+
+    def _monitor_data_version(self):
+        # With _monitor_lock held
+        if self._monitor is None:
+            self._monitor = self.connect(read_only=True)
+        return self._monitor.execute('PRAGMA data_version').fetchone()[0]
+
+    def data_version(self):
+        # Changes whenever another connection, e.g. another process, commits to the file; commits
+        # made through transaction() never change it. Never waits for the writer: a monitor
+        # connection of its own notices every commit, and after each of ours _note_commit() moves
+        # the monitor's baseline past it.
+        with self._monitor_lock:
+            version = self._monitor_data_version()
+            if version != self._monitor_version:
+                if self._monitor_version is not None:
+                    self._external_commits += 1
+                self._monitor_version = version
+            return self._external_commits
+
+    def _note_commit(self):
+        # With write_lock held, right after the writer committed. The monitor's baseline is moved
+        # first and the writer's own data_version, which only other connections change, read
+        # second, so a commit by another process just before or after ours is counted by one of
+        # them. One seen by both is counted twice, which does no harm.
+        with self._monitor_lock:
+            self._monitor_version = self._monitor_data_version()
+        version = self._writer.execute('PRAGMA data_version').fetchone()[0]
+        with self._monitor_lock:
+            if version != self._writer_version:
+                self._external_commits += 1
+            self._writer_version = version
+
+    @contextmanager
+    def transaction(self):
+        # Yields a cursor on the writer connection inside BEGIN IMMEDIATE, so the file lock
+        # is taken up front (and waited for with busy_timeout) instead of failing on upgrade.
+        # Commits on success and rolls back on error. A nested call joins the outer transaction.
+        with self.write_lock:
+            conn = self.writer()
+            cursor = conn.cursor(self.cursor_class)
+            if conn.in_transaction:
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+                return
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                yield cursor
+            except BaseException:
+                conn.rollback()
+                raise
+            else:
+                # Through the cursor, so a profiling cursor times the commit as well
+                cursor.execute('COMMIT')
+                self._note_commit()
+            finally:
+                cursor.close()
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._writer = None
+        self._local = threading.local()
+        self.attached = {}
+        with self._monitor_lock:
+            self._monitor = None
+            self._monitor_version = self._writer_version = None
+            # Anything may change while nothing is open
+            self._external_commits += 1
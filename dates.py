@@ -0,0 +1,37 @@
+import calendar
+from datetime import date
+from functools import lru_cache
+
+# time_entries stores dates as day numbers (days since 1970-01-01) plus a precomputed
+# ISO week (ISO year * 100 + week). Range filters, ordering and week breaks are then plain
+# integer comparisons, and rows are turned back into text only when they are displayed.
+EPOCH = date(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+# julianday() of 1970-01-01, to convert in SQL
+EPOCH_JULIAN_DAY = 2440587.5
+
+def day_number(value):
+    return value.toordinal() - EPOCH_ORDINAL
+
+def day_date(day):
+    return date.fromordinal(day + EPOCH_ORDINAL)
+
+def iso_week_number(value):
+    year, week, _ = value.isocalendar()
+    return year * 100 + week
+
+def weekday(day):
+    # Monday is 0, like date.weekday(); 1970-01-01 was a Thursday
+    return (day + 3) % 7
+
+def week_start(day):
+    # Day number of the Monday of the day's week
+    return day - (day + 3) % 7
+
+# A report covers a few thousand distinct days at most, so each label is formatted once
+@lru_cache(maxsize=65536)
+def day_label(day):
+    return day_date(day).strftime("%Y-%m-%d")
+
+def day_name(day):
+    return calendar.day_name[(day + 3) % 7]
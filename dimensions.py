@@ -0,0 +1,69 @@
+import threading
+
+class DimensionCache:
+    # Project names and user names held in memory, so entry rows carry only ids and the names are
+    # looked up here instead of joining every row to projects and users.
+    #
+    # Both tables are small and loaded together on first use. Writes to them in this process call
+    # invalidate(); commits from other processes are noticed by check(), through the database's
+    # data_version, which each operation calls once before its lookups rather than on every
+    # get(). Either way the next lookup loads them again.
+
+    def __init__(self, database):
+        self.database = database
+        self._lock = threading.Lock()
+        self._projects = None  # {project_id: name}
+        self._users = None  # {user_id: (first_name, last_name)}
+        self._data_version = None
+        self.generation = 0
+        self.loads = 0
+
+    def _load(self):
+        cursor = self.database.cursor()
+        cursor.execute('SELECT id, name FROM projects ORDER BY id')
+        projects = dict(cursor.fetchall())
+        cursor.execute('SELECT id, first_name, last_name FROM users ORDER BY id')
+        users = {user_id: (first_name, last_name) for user_id, first_name, last_name in cursor}
+        return projects, users
+
+    def check(self):
+        # Drops the tables when another process committed since they were loaded
+        data_version = self.database.data_version()
+        with self._lock:
+            if data_version != self._data_version:
+                self.generation += 1
+                self._projects = self._users = None
+                self._data_version = data_version
+
+    def get(self):
+        # ({project_id: name}, {user_id: (first_name, last_name)}); treat both as read-only
+        with self._lock:
+            if self._projects is not None:
+                return self._projects, self._users
+            generation = self.generation
+        projects, users = self._load()
+        with self._lock:
+            # Not kept when invalidate() ran during the load, which may have missed the write
+            if generation == self.generation:
+                self._projects, self._users = projects, users
+            self.loads += 1
+        return projects, users
+
+    def reload(self):
+        # For ids missing from what get() returned, e.g. a project created by another thread
+        # after the load and before its invalidate()
+        self.invalidate()
+        return self.get()
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._projects = self._users = None
+
+    def projects(self):
+        self.check()
+        return self.get()[0]
+
+    def users(self):
+        self.check()
+        return self.get()[1]
@@ -0,0 +1,184 @@
+import io
+import os
+import sqlite3
+import sys
+
+from dates import day_label
+
+# Rows handed to the underlying writer at a time; memory use is bounded by one chunk
+DEFAULT_CHUNK_SIZE = 5000
+
+EXPORT_HEADER = ['Date', 'Project', 'Hours', 'Category', 'Notes', 'User']
+
+def export_values(entry):
+    # A get_report_data() row as the CSV export columns
+    return [day_label(entry[2]), entry[6], float(entry[3]), entry[4], entry[5], f"{entry[7]} {entry[8]}"]
+
+class Exporter:
+    # Base class for report sinks (start/add/finish, as used by time_tracker.run_report) that
+    # write to a file in chunks. Subclasses implement open(), write_chunk() and close().
+    extension = None
+
+    def __init__(self, path=None, stream=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+        self.path = path
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.chunk = []
+        self.rows = 0
+
+    def start(self):
+        self.open()
+
+    def add(self, entry):
+        self.chunk.append(entry)
+        if len(self.chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunk:
+            self.write_chunk(self.chunk)
+            self.rows += len(self.chunk)
+            self.chunk = []
+            if self.progress:
+                self.progress(self)
+
+    def finish(self):
+        self.flush()
+        self.close()
+
+    def bytes_written(self):
+        # Size of the output file so far; streams are not measured
+        if self.path and os.path.exists(self.path):
+            return os.path.getsize(self.path)
+        return 0
+
+# The format modules are imported when an exporter of theirs opens, not when the tracker starts
+
+class CsvExporter(Exporter):
+    extension = 'csv'
+
+    def open(self):
+        import csv
+        self.file = self.stream or open(self.path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_HEADER)
+
+    def write_chunk(self, entries):
+        self.writer.writerows(export_values(entry) for entry in entries)
+        self.file.flush()
+
+    def close(self):
+        if self.stream:
+            self.file.flush()
+        else:
+            self.file.close()
+
+class GzipCsvExporter(CsvExporter):
+    extension = 'csv.gz'
+
+    def open(self):
+        import csv
+        import gzip
+        self.raw = self.stream or open(self.path, 'wb')
+        self.gzip = gzip.GzipFile(fileobj=self.raw, mode='wb', compresslevel=6)
+        self.file = io.TextIOWrapper(self.gzip, newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(EXPORT_HEADER)
+
+    def bytes_written(self):
+        if self.raw.closed or not self.raw.seekable():
+            return super().bytes_written()
+        return self.raw.tell()
+
+    def close(self):
+        self.file.close()
+        if self.stream:
+            self.raw.flush()
+        else:
+            self.raw.close()
+
+class JsonLinesExporter(Exporter):
+    # One object per line with the keys bulk_import.py reads back
+    extension = 'jsonl'
+
+    def open(self):
+        import json
+        self.dumps = json.dumps
+        self.file = self.stream or open(self.path, 'w', encoding='utf-8')
+
+    def write_chunk(self, entries):
+        dumps = self.dumps
+        self.file.write(''.join(
+            dumps({'id': entry[0], 'date': day_label(entry[2]), 'project': entry[6], 'hours': float(entry[3]),
+                   'category': entry[4], 'notes': entry[5], 'user': f"{entry[7]} {entry[8]}"}) + '\n'
+            for entry in entries
+        ))
+        self.file.flush()
+
+    def close(self):
+        if self.stream:
+            self.file.flush()
+        else:
+            self.file.close()
+
+class SqliteExporter(Exporter):
+    # Standalone SQLite file with the selected rows, e.g. for shipping to another office
+    extension = 'sqlite'
+
+    def open(self):
+        if self.stream:
+            raise ValueError("The sqlite format can only be written to a file")
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.conn = sqlite3.connect(self.path, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode = OFF')
+        self.conn.execute('PRAGMA synchronous = OFF')
+        self.conn.execute('''
+            CREATE TABLE report_entries (
+                id INTEGER PRIMARY KEY,
+                project_id INTEGER,
+                date TEXT,
+                hours REAL,
+                category TEXT,
+                notes TEXT,
+                project TEXT,
+                user TEXT
+            )
+        ''')
+        self.conn.execute('BEGIN')
+
+    def write_chunk(self, entries):
+        self.conn.executemany(
+            'INSERT INTO report_entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            ((entry[0], entry[1], day_label(entry[2]), entry[3], entry[4], entry[5], entry[6], f"{entry[7]} {entry[8]}") for entry in entries),
+        )
+
+    def close(self):
+        self.conn.execute('COMMIT')
+        self.conn.execute('CREATE INDEX idx_report_entries_date ON report_entries (date)')
+        self.conn.close()
+
+# Format name -> exporter class. Add an entry here (or call register_format) for new formats.
+EXPORT_FORMATS = {
+    'csv': CsvExporter,
+    'csv.gz': GzipCsvExporter,
+    'jsonl': JsonLinesExporter,
+    'sqlite': SqliteExporter,
+}
+
+def register_format(name, exporter_class):
+    EXPORT_FORMATS[name] = exporter_class
+
+def create_exporter(export_format, path=None, stream=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    try:
+        exporter_class = EXPORT_FORMATS[export_format]
+    except KeyError:
+        raise ValueError(f"Unknown export format {export_format!r}, expected one of: {', '.join(EXPORT_FORMATS)}")
+    return exporter_class(path, stream, chunk_size, progress)
+
+def print_progress(exporter, stream=None):
+    # Progress callback: rows and bytes so far, rewritten in place on one line
+    stream = stream or sys.stderr
+    stream.write(f"\rExported {exporter.rows:,} rows, {exporter.bytes_written():,} bytes")
+    stream.flush()
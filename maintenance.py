@@ -0,0 +1,240 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import time
+
+import shards
+import time_tracker
+
+# Routine upkeep of a tracker database: planner statistics, handing free pages back to the file
+# system, integrity checks and online backups. Closed-year shard files (see shards.py) are
+# analyzed and compacted once when they are built and never change afterwards, so only the
+# main file needs the first two.
+
+# Pages copied per backup step, and the pause after each step in which writers get the file
+BACKUP_STEP_PAGES = int(os.environ.get('TIME_TRACKER_BACKUP_STEP_PAGES', 1024))
+BACKUP_STEP_SLEEP = float(os.environ.get('TIME_TRACKER_BACKUP_STEP_SLEEP_MS', 5)) / 1000
+# A commit by another connection during a stepped backup makes SQLite start it over. After this
+# many restarts the rest is copied in one step, a single read transaction, which in WAL mode
+# still blocks neither readers nor writers.
+BACKUP_MAX_RESTARTS = 3
+INTEGRITY_MAX_ERRORS = 100
+
+class MaintenanceError(Exception):
+    pass
+
+class BackupRestarted(Exception):
+    pass
+
+def analyze(database, full=False):
+    # PRAGMA optimize gathers statistics only for the tables whose indexes were used by queries
+    # on this connection or have changed a lot since they were last analyzed, and is cheap
+    # enough to run often; ANALYZE reads every index. Returns the seconds taken.
+    started = time.perf_counter()
+    with database.transaction() as cursor:
+        cursor.execute('ANALYZE main' if full else 'PRAGMA main.optimize')
+    return time.perf_counter() - started
+
+def page_counts(cursor):
+    # (pages in the file, free pages in it)
+    cursor.execute('PRAGMA main.page_count')
+    pages = cursor.fetchone()[0]
+    cursor.execute('PRAGMA main.freelist_count')
+    return pages, cursor.fetchone()[0]
+
+def incremental_vacuum(database, pages=None):
+    # Hands up to pages free pages (default: all) back to the file system, without rewriting
+    # the file like VACUUM does. Returns the pages freed.
+    with database.write_lock:
+        conn = database.writer()
+        cursor = conn.cursor()
+        cursor.execute('PRAGMA main.auto_vacuum')
+        if cursor.fetchone()[0] != 2:
+            raise MaintenanceError("The database is not in incremental auto-vacuum mode yet: run one full vacuum first")
+        before, _ = page_counts(cursor)
+        # Frees one page per step of the statement, and execute() steps a statement without
+        # result columns only once; executescript() runs it to the end, as its own transaction
+        conn.executescript(f'PRAGMA main.incremental_vacuum({int(pages or 0)})')
+        after, _ = page_counts(cursor)
+    return max(0, before - after)
+
+def full_vacuum(database):
+    # Rewrites the main file compactly, and switches it to incremental auto-vacuum. Writers wait
+    # until it is done; readers do not. Returns the pages freed.
+    with database.write_lock:
+        conn = database.writer()
+        before, _ = page_counts(conn.cursor())
+        conn.execute('VACUUM main')
+        after, _ = page_counts(conn.cursor())
+    # The rewrite can come out a page larger than a file that had nothing to free
+    return max(0, before - after)
+
+def integrity_check(database, quick=False, max_errors=INTEGRITY_MAX_ERRORS):
+    # Problems found in the main file and every attached shard; an empty list when all is well.
+    # quick_check skips matching the indexes against their tables and is much faster.
+    cursor = database.cursor()
+    cursor.execute(f"PRAGMA {'quick_check' if quick else 'integrity_check'}({int(max_errors)})")
+    messages = [row[0] for row in cursor.fetchall()]
+    return [] if messages == ['ok'] else messages
+
+def verify_backup(target, max_errors=INTEGRITY_MAX_ERRORS):
+    # integrity_check of a backup and the shards copied next to it. Opened read-only on a plain
+    # connection: Database would switch the file to WAL and auto-vacuum, changing what it checks.
+    from pathlib import Path
+    conn = sqlite3.connect(Path(target).resolve().as_uri() + '?mode=ro', uri=True)
+    try:
+        for schema, uri in shards.attached_shards(conn).items():
+            conn.execute('ATTACH DATABASE ? AS ?', (uri, schema))
+        return integrity_check(conn, max_errors=max_errors)
+    except sqlite3.DatabaseError as error:
+        # Damage bad enough that SQLite cannot even walk the file
+        return [str(error)]
+    finally:
+        conn.close()
+
+def copy_shards(database, target):
+    # The closed-year files the main file refers to, copied next to target under the same names
+    # (the registry holds paths relative to the main file). They never change, so one already
+    # there with the same size is kept.
+    directory = os.path.dirname(os.path.abspath(target))
+    copied = []
+    for _, path, _, _ in time_tracker.get_shards():
+        source = os.path.join(os.path.dirname(os.path.abspath(database.path)), path)
+        destination = os.path.join(directory, path)
+        if os.path.exists(destination) and (os.path.samefile(source, destination) or os.path.getsize(source) == os.path.getsize(destination)):
+            continue
+        shutil.copyfile(source, destination)
+        copied.append(destination)
+    return copied
+
+def backup(database, target, step_pages=BACKUP_STEP_PAGES, progress=None):
+    # Consistent copy of the live main file at target, taken step_pages pages at a time from a
+    # read-only connection of its own, so reports keep running and writers get the file between
+    # steps. Written to a temporary file and renamed into place once complete; the shards are
+    # copied alongside. progress(remaining, total) is called after every step.
+    # Returns (pages, restarts, shard files copied).
+    temporary = target + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    time_tracker.get_shards()  # opens the database, migrating it if needed
+    source = database.connect(read_only=True)
+    destination = sqlite3.connect(temporary)
+    restarts = 0
+    total = 0
+    last_remaining = None
+
+    def step(status, remaining, pages):
+        nonlocal restarts, total, last_remaining
+        total = pages
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > BACKUP_MAX_RESTARTS:
+                raise BackupRestarted()
+        last_remaining = remaining
+        if progress:
+            progress(remaining, pages)
+
+    try:
+        try:
+            source.backup(destination, pages=step_pages, progress=step, sleep=BACKUP_STEP_SLEEP)
+        except BackupRestarted:
+            source.backup(destination, pages=-1)
+        # A backup is a file of its own: no WAL left behind to copy along
+        destination.execute('PRAGMA journal_mode = DELETE')
+        total = destination.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        destination.close()
+        source.close()
+    os.replace(temporary, target)
+    return total, restarts, copy_shards(database, target)
+
+def print_progress(remaining, total):
+    done = total - remaining
+    print(f"\r{done:,} of {total:,} pages ({done / total if total else 1:.0%})", end='', file=sys.stderr)
+
+def command_analyze(args):
+    seconds = analyze(time_tracker.db, args.full)
+    print(f"{'Analyzed' if args.full else 'Optimized'} in {seconds:.2f}s", file=sys.stderr)
+    return 0
+
+def command_vacuum(args):
+    pages = full_vacuum(time_tracker.db) if args.full else incremental_vacuum(time_tracker.db, args.pages)
+    print(f"Freed {pages:,} pages", file=sys.stderr)
+    return 0
+
+def command_check(args):
+    problems = integrity_check(time_tracker.db, args.quick)
+    for problem in problems:
+        print(problem)
+    print(f"{len(problems)} problem(s) found" if problems else "ok", file=sys.stderr)
+    return 1 if problems else 0
+
+def command_backup(args):
+    started = time.perf_counter()
+    pages, restarts, copied = backup(time_tracker.db, args.target, args.step_pages, None if args.quiet else print_progress)
+    if not args.quiet:
+        sys.stderr.write('\n')
+    print(f"Backed up {pages:,} pages to {args.target} in {time.perf_counter() - started:.2f}s"
+          f"{f' ({restarts} restarts)' if restarts else ''}"
+          f"{f', with {len(copied)} shard file(s)' if copied else ''}", file=sys.stderr)
+    if args.verify:
+        problems = verify_backup(args.target)
+        for problem in problems:
+            print(problem)
+        if problems:
+            return 1
+        print("Backup verified", file=sys.stderr)
+    return 0
+
+def command_status(args):
+    cursor = time_tracker.db.cursor()
+    pages, free = page_counts(cursor)
+    cursor.execute('PRAGMA main.page_size')
+    page_size = cursor.fetchone()[0]
+    cursor.execute('PRAGMA main.auto_vacuum')
+    auto_vacuum = ['none', 'full', 'incremental'][cursor.fetchone()[0]]
+    cursor.execute("SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'")
+    analyzed = cursor.fetchone()[0] > 0
+    settings = {}
+    for pragma in time_tracker.db.pragmas:
+        cursor.execute(f'PRAGMA {pragma}')
+        settings[pragma] = cursor.fetchone()[0]
+    json.dump({'path': time_tracker.db.path, 'bytes': pages * page_size, 'pages': pages, 'free_pages': free,
+               'auto_vacuum': auto_vacuum, 'analyzed': analyzed, 'pragmas': settings}, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the time tracker database.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    analyze_command = commands.add_parser('analyze', help="refresh the query planner statistics (PRAGMA optimize)")
+    analyze_command.add_argument('--full', action='store_true', help="run a full ANALYZE instead")
+    analyze_command.set_defaults(handler=command_analyze)
+    vacuum = commands.add_parser('vacuum', help="hand free pages back to the file system")
+    vacuum.add_argument('--pages', type=int, help="at most this many pages (default: all)")
+    vacuum.add_argument('--full', action='store_true', help="rewrite the whole file (needed once for incremental vacuums)")
+    vacuum.set_defaults(handler=command_vacuum)
+    check = commands.add_parser('check', help="check the main file and the shards for corruption")
+    check.add_argument('--quick', action='store_true', help="skip checking the indexes against the tables")
+    check.set_defaults(handler=command_check)
+    backup_command = commands.add_parser('backup', help="copy the live database to a file without stopping it")
+    backup_command.add_argument('target', help="backup file; the shard files are copied next to it")
+    backup_command.add_argument('--step-pages', type=int, default=BACKUP_STEP_PAGES, help="pages copied per step (default: %(default)s)")
+    backup_command.add_argument('--verify', action='store_true', help="integrity-check the backup afterwards")
+    backup_command.add_argument('--quiet', action='store_true', help="no progress output")
+    backup_command.set_defaults(handler=command_backup)
+    status = commands.add_parser('status', help="file size, free pages and the connection settings in effect")
+    status.set_defaults(handler=command_status)
+    args = parser.parse_args(argv)
+
+    try:
+        return args.handler(args)
+    except MaintenanceError as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,405 @@
+import itertools
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from functools import wraps
+
+import database
+from database import Database
+
+# Statements slower than this, from execute to the last row fetched, go to the slow-query log
+SLOW_QUERY_MS = float(os.environ.get('TIME_TRACKER_SLOW_QUERY_MS', 100))
+# Slow queries kept for the summary and the JSON dump; all of them are logged as they happen
+SLOW_QUERY_LOG_SIZE = 100
+# SQLite virtual machine instructions between two progress handler calls
+PROGRESS_STEPS = 1000
+# Upper bounds of the latency histogram buckets in milliseconds; the last bucket is open ended
+HISTOGRAM_BOUNDS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# Statements EXPLAIN QUERY PLAN can describe
+EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+SQL_WIDTH = 70
+
+def normalize_sql(sql):
+    return ' '.join(sql.split())
+
+def is_full_scan(step):
+    # A plan step that reads every row of time_entries instead of seeking an index. The \b keeps
+    # out time_entries_fts and the rollup tables; only an index the scan itself uses counts.
+    scan = re.match(r'SCAN (?:TABLE )?time_entries\b(?: AS \w+)?(.*)', step)
+    return scan is not None and re.match(r' USING (?:COVERING )?INDEX\b', scan.group(1)) is None
+
+class Histogram:
+    # Latency counts per HISTOGRAM_BOUNDS_MS bucket, plus the exact count, total and maximum
+
+    def __init__(self):
+        self.buckets = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, ms):
+        self.buckets[bisect_left(HISTOGRAM_BOUNDS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, fraction):
+        # Upper bound of the bucket that holds this share of the samples, never above the maximum
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(HISTOGRAM_BOUNDS_MS + (self.max_ms,), self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.50), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'max_ms': round(self.max_ms, 3),
+            'buckets': {
+                (f"<={bound}" if i < len(HISTOGRAM_BOUNDS_MS) else f">{HISTOGRAM_BOUNDS_MS[-1]}"): count
+                for i, (bound, count) in enumerate(zip(HISTOGRAM_BOUNDS_MS + (None,), self.buckets))
+                if count
+            },
+        }
+
+class QueryStats:
+    # Everything recorded for one statement text, whatever parameters it ran with
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.latency = Histogram()
+        self.rows = 0
+        self.steps = 0
+        self.statements = 0
+        self.plan = None
+        self.full_scan = False
+
+    def to_dict(self):
+        return {
+            'sql': self.sql,
+            'rows': self.rows,
+            'vm_steps': self.steps,
+            'sqlite_statements': self.statements,
+            'plan': self.plan,
+            'full_scan': self.full_scan,
+            'latency': self.latency.to_dict(),
+        }
+
+class Execution:
+    # One run of a statement on a profiled cursor, open until its last row is fetched
+    __slots__ = ('sql', 'parameters', 'elapsed', 'rows', 'steps', 'statements', 'expanded')
+
+    def __init__(self, sql, parameters):
+        self.sql = sql
+        self.parameters = parameters
+        self.elapsed = 0.0
+        self.rows = 0
+        self.steps = 0
+        self.statements = 0
+        self.expanded = None
+
+class ProfiledCursor(sqlite3.Cursor):
+    # Reports every statement to the profiler: the time spent inside execute and fetch calls,
+    # the rows fetched (or changed, for writes), and what SQLite's trace callback and progress
+    # handler saw while it ran. Time spent by the caller between fetches is not counted.
+    _execution = None
+
+    def _call(self, method, *args):
+        local = profiler.local
+        outer = getattr(local, 'execution', None)
+        local.execution = self._execution
+        started = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            self._execution.elapsed += time.perf_counter() - started
+            local.execution = outer
+
+    def _finish(self):
+        execution, self._execution = self._execution, None
+        if execution is not None:
+            profiler.record(execution, self.connection)
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        self._execution = Execution(sql, parameters)
+        self._call(super().execute, sql, parameters)
+        if self.description is None:
+            self._execution.rows = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        # The first parameter set is kept for EXPLAIN without consuming a generator
+        self._finish()
+        parameters = iter(seq_of_parameters)
+        first = next(parameters, None)
+        self._execution = Execution(sql, first if first is not None else ())
+        if first is not None:
+            parameters = itertools.chain([first], parameters)
+        self._call(super().executemany, sql, parameters)
+        self._execution.rows = max(self.rowcount, 0)
+        self._finish()
+        return self
+
+    def fetchone(self):
+        if self._execution is None:
+            return super().fetchone()
+        row = self._call(super().fetchone)
+        if row is None:
+            self._finish()
+        else:
+            self._execution.rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        if self._execution is None:
+            return super().fetchmany(size)
+        rows = self._call(super().fetchmany, size)
+        self._execution.rows += len(rows)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        if self._execution is None:
+            return super().fetchall()
+        rows = self._call(super().fetchall)
+        self._execution.rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        if self._execution is None:
+            return super().__next__()
+        try:
+            row = self._call(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        self._execution.rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        # Single-row lookups usually stop after one fetchone() and drop the cursor
+        try:
+            self._finish()
+        except sqlite3.Error:
+            pass
+
+class Profiler:
+    # Opt-in query tracing and operation timing. enable() makes every Database connection
+    # opened afterwards use ProfiledCursor and reports SQLite's trace callback and progress
+    # handler here. Aggregates are shared by all threads.
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_query_ms = SLOW_QUERY_MS
+        self.slow_log = None
+        self.local = threading.local()
+        self._lock = threading.Lock()
+        self.started = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.operations = {}  # name -> Histogram
+            self.queries = {}  # normalized sql -> QueryStats
+            self.other_statements = {}  # sql run outside a profiled cursor -> count
+            self.slow_queries = deque(maxlen=SLOW_QUERY_LOG_SIZE)
+            self.slow_query_count = 0
+
+    def enable(self, slow_query_ms=None, slow_log=None):
+        # Call before the first query; connections that are already open are not traced
+        if slow_query_ms is not None:
+            self.slow_query_ms = slow_query_ms
+        self.slow_log = slow_log
+        Database.cursor_class = ProfiledCursor
+        if self.attach not in database.CONNECTION_HOOKS:
+            database.CONNECTION_HOOKS.append(self.attach)
+        self.started = time.perf_counter()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        Database.cursor_class = sqlite3.Cursor
+        if self.attach in database.CONNECTION_HOOKS:
+            database.CONNECTION_HOOKS.remove(self.attach)
+
+    def attach(self, connection):
+        connection.set_trace_callback(self._on_statement)
+        connection.set_progress_handler(self._on_progress, PROGRESS_STEPS)
+
+    def _on_statement(self, sql):
+        # Called by SQLite with the expanded text of every statement it starts, trigger
+        # programs included
+        local = self.local
+        if getattr(local, 'explaining', False):
+            return
+        execution = getattr(local, 'execution', None)
+        if execution is None:
+            key = normalize_sql(sql)
+            with self._lock:
+                self.other_statements[key] = self.other_statements.get(key, 0) + 1
+            return
+        execution.statements += 1
+        if execution.expanded is None:
+            execution.expanded = sql
+
+    def _on_progress(self):
+        execution = getattr(self.local, 'execution', None)
+        if execution is not None:
+            execution.steps += PROGRESS_STEPS
+        return 0
+
+    def explain(self, connection, sql, parameters):
+        # EXPLAIN QUERY PLAN steps for the statement, on the connection that ran it
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return []
+        local = self.local
+        outer = getattr(local, 'execution', None)
+        local.explaining = True
+        local.execution = None
+        try:
+            cursor = sqlite3.Cursor(connection)
+            try:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, parameters)
+                return [row[3] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        except sqlite3.Error as error:
+            return [f"(no plan: {error})"]
+        finally:
+            local.explaining = False
+            local.execution = outer
+
+    def record(self, execution, connection):
+        key = normalize_sql(execution.sql)
+        ms = execution.elapsed * 1000
+        with self._lock:
+            stats = self.queries.get(key)
+            if stats is None:
+                stats = self.queries[key] = QueryStats(key)
+            stats.latency.add(ms)
+            stats.rows += execution.rows
+            stats.steps += execution.steps
+            stats.statements += execution.statements
+            needs_plan = stats.plan is None
+            if needs_plan:
+                stats.plan = []
+        if needs_plan:
+            plan = self.explain(connection, execution.sql, execution.parameters)
+            with self._lock:
+                stats.plan = plan
+                stats.full_scan = any(is_full_scan(step) for step in plan)
+        if ms >= self.slow_query_ms:
+            self.log_slow_query(execution, ms, stats.full_scan)
+
+    def log_slow_query(self, execution, ms, full_scan):
+        sql = normalize_sql(execution.expanded or execution.sql)
+        entry = {'ms': round(ms, 3), 'rows': execution.rows, 'vm_steps': execution.steps, 'full_scan': full_scan, 'sql': sql}
+        with self._lock:
+            self.slow_queries.append(entry)
+            self.slow_query_count += 1
+        stream = self.slow_log or sys.stderr
+        print(f"slow query: {ms:.1f} ms, {execution.rows} rows{', full scan of time_entries' if full_scan else ''}: {sql}",
+              file=stream, flush=True)
+
+    def record_call(self, name, seconds):
+        with self._lock:
+            histogram = self.operations.get(name)
+            if histogram is None:
+                histogram = self.operations[name] = Histogram()
+            histogram.add(seconds * 1000)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'elapsed_s': round(time.perf_counter() - self.started, 3) if self.started else 0.0,
+                'slow_query_ms': self.slow_query_ms,
+                'operations': {name: histogram.to_dict() for name, histogram in sorted(self.operations.items())},
+                'queries': [stats.to_dict() for stats in sorted(self.queries.values(), key=lambda stats: -stats.latency.total_ms)],
+                'other_statements': dict(sorted(self.other_statements.items(), key=lambda item: -item[1])),
+                'slow_query_count': self.slow_query_count,
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def format_summary(self):
+        profile = self.to_dict()
+        lines = [f"Profile of {profile['elapsed_s']:.1f} s"]
+        if profile['operations']:
+            lines.append(f"\n{'Operation':32} {'calls':>7} {'total ms':>11} {'mean':>9} {'p50':>9} {'p99':>9} {'max':>9}")
+            for name, latency in profile['operations'].items():
+                lines.append(f"{name:32} {latency['count']:7} {latency['total_ms']:11.1f} {latency['mean_ms']:9.2f} "
+                             f"{latency['p50_ms']:9.2f} {latency['p99_ms']:9.2f} {latency['max_ms']:9.2f}")
+        if profile['queries']:
+            lines.append(f"\n{'Query (by total time)':{SQL_WIDTH + 5}} {'calls':>7} {'rows':>9} {'total ms':>11} {'p99':>9} {'vm steps':>10}")
+            for query in profile['queries']:
+                latency = query['latency']
+                flag = 'SCAN' if query['full_scan'] else '    '
+                sql = query['sql'] if len(query['sql']) <= SQL_WIDTH else query['sql'][:SQL_WIDTH - 3] + '...'
+                lines.append(f"{flag} {sql:{SQL_WIDTH}} {latency['count']:7} {query['rows']:9} {latency['total_ms']:11.1f} "
+                             f"{latency['p99_ms']:9.2f} {query['vm_steps']:10}")
+            scans = [query for query in profile['queries'] if query['full_scan']]
+            for query in scans:
+                lines.append(f"\nFull scan of time_entries: {query['sql']}")
+                lines.extend(f"    {step}" for step in query['plan'])
+        if profile['other_statements']:
+            lines.append("\nOther statements: " + ", ".join(f"{sql} x{count}" for sql, count in profile['other_statements'].items()))
+        lines.append(f"\nSlow queries over {profile['slow_query_ms']:g} ms: {profile['slow_query_count']}")
+        return '\n'.join(lines)
+
+profiler = Profiler()
+
+def profiled(name):
+    # Times every call of the decorated function into the histogram for name while profiling is on
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profiler.record_call(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+def add_arguments(parser):
+    parser.add_argument('--profile', action='store_true', help="trace every query and time the main operations; prints a summary to stderr at exit")
+    parser.add_argument('--profile-json', metavar='PATH', help="write the profile as JSON to PATH ('-' for stdout) at exit; implies --profile")
+    parser.add_argument('--slow-query-ms', type=float, default=SLOW_QUERY_MS, help="with --profile, log statements slower than this to stderr (default: %(default)s)")
+
+def start_from_args(args):
+    if args.profile or args.profile_json:
+        profiler.enable(args.slow_query_ms)
+
+def finish_from_args(args):
+    if not profiler.enabled:
+        return
+    import json
+    if args.profile_json == '-':
+        json.dump(profiler.to_dict(), sys.stdout, indent=2)
+        print()
+    elif args.profile_json:
+        with open(args.profile_json, 'w') as file:
+            json.dump(profiler.to_dict(), file, indent=2)
+    if args.profile:
+        print(profiler.format_summary(), file=sys.stderr)
@@ -0,0 +1,104 @@
+import os
+import sys
+from contextlib import contextmanager
+
+# Clear screen and move the cursor home
+ANSI_CLEAR = '\033[2J\033[H'
+# Buffered output is handed to the stream once it grows past this many characters
+FLUSH_THRESHOLD = 64 * 1024
+DEFAULT_PAGER = 'less -FRX'
+
+_ansi_enabled = os.name != 'nt'
+
+def ansi_clear(stream):
+    global _ansi_enabled
+    if not stream.isatty():
+        return ''
+    if not _ansi_enabled:
+        # Windows consoles only honour escape sequences once VT processing is on;
+        # an empty system() call switches it on for the rest of the process
+        os.system('')
+        _ansi_enabled = True
+    return ANSI_CLEAR
+
+def clear_screen(stream=None):
+    stream = stream or sys.stdout
+    prefix = ansi_clear(stream)
+    if prefix:
+        stream.write(prefix)
+        stream.flush()
+
+def draw_screen(lines, stream=None):
+    # Clears the terminal and draws a whole menu screen with a single write
+    stream = stream or sys.stdout
+    prefix = ansi_clear(stream)
+    stream.write(prefix + '\n'.join(lines) + '\n')
+    stream.flush()
+
+class Screen:
+    # Collects the lines of a screen and writes them in large chunks instead of one
+    # write per print()
+
+    def __init__(self, stream=None, threshold=FLUSH_THRESHOLD):
+        self.stream = stream or sys.stdout
+        self.threshold = threshold
+        self.parts = []
+        self.size = 0
+
+    def line(self, text=''):
+        self.parts.append(text)
+        self.parts.append('\n')
+        self.size += len(text) + 1
+        if self.size >= self.threshold:
+            self.flush()
+
+    def lines(self, texts):
+        for text in texts:
+            self.line(text)
+
+    def flush(self):
+        if self.parts:
+            self.stream.write(''.join(self.parts))
+            self.parts.clear()
+            self.size = 0
+        self.stream.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+def pager_command():
+    import shlex
+    pager = os.environ.get('PAGER', DEFAULT_PAGER)
+    return shlex.split(pager) if pager else None
+
+@contextmanager
+def paged(enabled=True):
+    # Yields a stream for long output: the pager's stdin when writing to a terminal,
+    # stdout otherwise (pipes, files, PAGER set to an empty string)
+    command = pager_command() if enabled and sys.stdout.isatty() else None
+    if not command:
+        yield sys.stdout
+        return
+
+    # Only interactive screens page, so subprocess is imported here rather than at startup
+    import subprocess
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, text=True)
+    except OSError:
+        yield sys.stdout
+        return
+
+    try:
+        yield process.stdin
+    except BrokenPipeError:
+        # The user quit the pager before the end of the output
+        pass
+    finally:
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+        process.wait()
@@ -0,0 +1,151 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+# Upper bounds for the cached report results; least recently used reports are evicted first
+REPORT_CACHE_MAX_ENTRIES = int(os.environ.get('TIME_TRACKER_REPORT_CACHE_ENTRIES', 128))
+REPORT_CACHE_MAX_BYTES = int(os.environ.get('TIME_TRACKER_REPORT_CACHE_MB', 64)) * 1024 * 1024
+
+def estimate_size(row):
+    getsizeof = sys.getsizeof
+    return getsizeof(row) + sum(getsizeof(value) for value in row)
+
+class ReportCache:
+    # Report rows keyed by (project_id, user ids or None for all users, first day, last day).
+    #
+    # Every write to time_entries or projects calls invalidate() with what it touched, which
+    # drops only the cached reports that could contain that row and bumps the write
+    # generation. A result loaded while any write happened is not stored, so a report read
+    # just before a commit never outlives it. Commits from other processes are noticed
+    # through the database's data_version and clear everything.
+
+    def __init__(self, database, max_entries=REPORT_CACHE_MAX_ENTRIES, max_bytes=REPORT_CACHE_MAX_BYTES):
+        self.database = database
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (rows, size)
+        self._bytes = 0
+        self._data_version = None
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _check_external_writes(self):
+        data_version = self.database.data_version()
+        with self._lock:
+            if self._data_version is not None and data_version != self._data_version:
+                self._clear()
+            self._data_version = data_version
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def _clear(self):
+        self.generation += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self._bytes = 0
+
+    def lookup(self, key):
+        # (rows, generation): rows is None on a miss, and the generation is passed to store()
+        if self.max_entries <= 0:
+            return None, None
+        self._check_external_writes()
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached[0], self.generation
+            self.misses += 1
+            return None, self.generation
+
+    def store(self, key, rows, generation, size=None):
+        if generation is None:
+            return
+        size = sum(map(estimate_size, rows)) if size is None else size
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if generation != self.generation:
+                return
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (rows, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def load(self, key, fetch):
+        # Cached rows for key, or fetch() them and keep the result
+        rows, generation = self.lookup(key)
+        if rows is None:
+            rows = fetch()
+            self.store(key, rows, generation)
+        return rows
+
+    def stream(self, key, rows):
+        # Yields rows (an iterator from the database) on a miss, keeping a copy as long as it
+        # stays under the byte cap, and caches it once the whole report has been read
+        cached, generation = self.lookup(key)
+        if cached is not None:
+            yield from cached
+            return
+
+        kept = [] if generation is not None else None
+        size = 0
+        for row in rows:
+            if kept is not None:
+                kept.append(row)
+                size += estimate_size(row)
+                if size > self.max_bytes:
+                    kept = None
+            yield row
+        if kept is not None:
+            self.store(key, kept, generation, size)
+
+    def invalidate(self, day=None, project_id=None, user_id=None):
+        # Drops cached reports whose filters match a written row. None matches everything:
+        # invalidate(project_id=3) after a rename, invalidate() to empty the cache.
+        with self._lock:
+            self.generation += 1
+            for key in list(self._entries):
+                cached_project, cached_users, first_day, last_day = key
+                if day is not None and not first_day <= day <= last_day:
+                    continue
+                if project_id is not None and cached_project not in (0, project_id):
+                    continue
+                if user_id is not None and cached_users is not None and user_id not in cached_users:
+                    continue
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'generation': self.generation,
+            }
+
+    def format_stats(self):
+        stats = self.stats()
+        return (f"Report cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), "
+                f"{stats['evictions']} evictions, {stats['invalidations']} invalidations, "
+                f"{stats['entries']} reports, {stats['bytes'] / 1024 / 1024:.1f} MB")
@@ -0,0 +1,222 @@
+import os
+import threading
+from datetime import datetime, timedelta
+
+from profiler import profiled
+
+# Sessions untouched for longer than this are expired and swept
+SESSION_TTL_SECONDS = int(os.environ.get('TIME_TRACKER_SESSION_TTL', 7 * 24 * 3600))
+# How often coalesced last_accessed updates are written back
+FLUSH_INTERVAL_SECONDS = 30
+# How often expired sessions are deleted by the background sweeper
+SWEEP_INTERVAL_SECONDS = 600
+
+class SessionStore:
+    # Keeps active sessions in memory. Creating and deleting a session is written through
+    # immediately; last_accessed updates only touch memory and are flushed in one
+    # transaction every FLUSH_INTERVAL_SECONDS, on logout and on stop().
+    # After every commit by another process, which may have logged a session out or swept it,
+    # each cached session is looked up again the next time it is used.
+
+    def __init__(self, database, ttl_seconds=SESSION_TTL_SECONDS, flush_interval=FLUSH_INTERVAL_SECONDS, sweep_interval=SWEEP_INTERVAL_SECONDS):
+        self.database = database
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.flush_interval = flush_interval
+        self.sweep_interval = sweep_interval
+        self._lock = threading.Lock()
+        self._sessions = {}  # id -> [user_id, created_at, last_accessed]
+        self._dirty = set()
+        self._latest_id = None
+        # Cached sessions whose row was seen since the last commit by another process
+        self._verified = set()
+        self._data_version = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _cutoff(self):
+        return (datetime.now() - self.ttl).isoformat()
+
+    def _is_expired(self, session):
+        return session[2] < self._cutoff()
+
+    def _forget(self, session_id):
+        # With _lock held
+        self._sessions.pop(session_id, None)
+        self._dirty.discard(session_id)
+        self._verified.discard(session_id)
+        if self._latest_id == session_id:
+            self._latest_id = None
+
+    def _verify(self, session_id):
+        # Whether the cached session still has its row; drops it from the cache if not
+        data_version = self.database.data_version()
+        with self._lock:
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._verified.clear()
+            if session_id in self._verified:
+                return True
+        cursor = self.database.cursor()
+        cursor.execute('SELECT last_accessed FROM sessions WHERE id = ?', (session_id,))
+        row = cursor.fetchone()
+        with self._lock:
+            if row is None:
+                self._forget(session_id)
+                return False
+            session = self._sessions.get(session_id)
+            if session is not None and row[0] > session[2]:
+                # Used by another process since
+                session[2] = row[0]
+            if data_version == self._data_version:
+                self._verified.add(session_id)
+            return True
+
+    def creation(self, user_id):
+        # The insert as a unit of work, (work(cursor) -> session id, after(session id)), e.g. for
+        # a write queue; the session is usable once after() has run
+        # uuid (and the platform module it loads) is only needed once someone logs in
+        import uuid
+        session_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+
+        def work(cursor):
+            cursor.execute('''
+                INSERT INTO sessions (id, user_id, created_at, last_accessed)
+                VALUES (?, ?, ?, ?)
+            ''', (session_id, user_id, now, now))
+            return session_id
+
+        def after(session_id):
+            with self._lock:
+                self._sessions[session_id] = [user_id, now, now]
+                self._verified.add(session_id)
+                self._latest_id = session_id
+
+        return work, after
+
+    @profiled('sessions.create')
+    def create(self, user_id):
+        work, after = self.creation(user_id)
+        with self.database.transaction() as cursor:
+            session_id = work(cursor)
+        after(session_id)
+        return session_id
+
+    def get_active(self):
+        # Most recently used unexpired session as (id, user_id, created_at, last_accessed)
+        with self._lock:
+            session_id = self._latest_id
+            session = self._sessions.get(session_id)
+        if session and not self._is_expired(session) and self._verify(session_id):
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session:
+                    return (session_id, *session)
+
+        cursor = self.database.cursor()
+        cursor.execute('''
+            SELECT id, user_id, created_at, last_accessed
+            FROM sessions
+            WHERE last_accessed >= ?
+            ORDER BY last_accessed DESC
+            LIMIT 1
+        ''', (self._cutoff(),))
+        row = cursor.fetchone()
+        if row:
+            with self._lock:
+                # A pending in-memory update is newer than what the table holds
+                session = self._sessions.setdefault(row[0], list(row[1:]))
+                self._latest_id = row[0]
+                return (row[0], *session)
+        return None
+
+    @profiled('sessions.get')
+    def get(self, session_id):
+        # The session as (id, user_id, created_at, last_accessed), or None if unknown or expired
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is not None:
+            if self._is_expired(session) or not self._verify(session_id):
+                return None
+            with self._lock:
+                session = self._sessions.get(session_id)
+                if session is not None:
+                    return (session_id, *session)
+            return None
+
+        cursor = self.database.cursor()
+        cursor.execute('''
+            SELECT user_id, created_at, last_accessed
+            FROM sessions
+            WHERE id = ? AND last_accessed >= ?
+        ''', (session_id, self._cutoff()))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        with self._lock:
+            session = self._sessions.setdefault(session_id, list(row))
+            return (session_id, *session)
+
+    @profiled('sessions.touch')
+    def touch(self, session_id):
+        now = datetime.now().isoformat()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return
+            session[2] = now
+            self._dirty.add(session_id)
+            self._latest_id = session_id
+
+    @profiled('sessions.flush')
+    def flush(self):
+        with self._lock:
+            updates = [(self._sessions[session_id][2], session_id) for session_id in self._dirty if session_id in self._sessions]
+            self._dirty.clear()
+        if updates:
+            with self.database.transaction() as cursor:
+                cursor.executemany('UPDATE sessions SET last_accessed = ? WHERE id = ?', updates)
+
+    def delete(self, session_id):
+        with self._lock:
+            self._forget(session_id)
+        with self.database.transaction() as cursor:
+            cursor.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+        self.flush()
+
+    def sweep(self):
+        # Deletes expired sessions; returns how many rows were removed
+        cutoff = self._cutoff()
+        with self._lock:
+            for session_id in [session_id for session_id, session in self._sessions.items() if session[2] < cutoff]:
+                self._forget(session_id)
+        # Write pending updates first so a session that is still in use is not swept
+        self.flush()
+        with self.database.transaction() as cursor:
+            cursor.execute('DELETE FROM sessions WHERE last_accessed < ?', (cutoff,))
+            return cursor.rowcount
+
+    def _run(self):
+        last_sweep = None
+        while True:
+            now = datetime.now()
+            if last_sweep is None or (now - last_sweep).total_seconds() >= self.sweep_interval:
+                self.sweep()
+                last_sweep = now
+            if self._stop.wait(self.flush_interval):
+                break
+            self.flush()
+
+    def start(self):
+        # Starts the background flusher/sweeper thread
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='session-sweeper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
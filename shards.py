@@ -0,0 +1,103 @@
+import os
+import sqlite3
+from collections import namedtuple
+from datetime import date
+
+from dates import day_number
+
+# Partitioned storage for time_entries. The years that are still open stay in the main file;
+# each closed year is moved to a shard file of its own next to it (time_tracker.2023.db),
+# which is attached to every connection as schema y2023. Closed years are every year up to the
+# newest shard: their files are read-only and nothing can be written into them any more.
+# Rollups, projects, users and sessions stay in the main file and keep covering every year.
+
+# Schema name prefix of an attached shard, followed by its year
+SCHEMA_PREFIX = 'y'
+# Day bounds beyond any real entry, for partitions and ranges with no end
+FIRST_DAY = -2 ** 62
+LAST_DAY = 2 ** 62
+
+# Where a partition's time_entries table lives and the days it can hold, both inclusive
+Partition = namedtuple('Partition', ['schema', 'first_day', 'last_day'])
+
+class ClosedYearError(Exception):
+    pass
+
+def create_registry(cursor):
+    # One row per closed year. last_id is the highest entry id moved to the shard, so ids
+    # handed out in the main file never repeat one of them.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS entry_shards (
+            year INTEGER PRIMARY KEY,
+            path TEXT NOT NULL,
+            entries INTEGER NOT NULL,
+            last_id INTEGER NOT NULL
+        )
+    ''')
+
+def schema_name(year):
+    return f"{SCHEMA_PREFIX}{year}"
+
+def shard_path(db_path, year):
+    stem, extension = os.path.splitext(db_path)
+    return f"{stem}.{year}{extension or '.db'}"
+
+def year_days(year):
+    return day_number(date(year, 1, 1)), day_number(date(year, 12, 31))
+
+def shard_uri(path):
+    # Opened read-only and immutable: SQLite then takes no locks and never checks the file for
+    # changes, which is safe because a closed year's file is never written again.
+    # pathlib is imported here, only once a database has closed years.
+    from pathlib import Path
+    return Path(path).resolve().as_uri() + '?mode=ro&immutable=1'
+
+def attached_shards(conn):
+    # {schema: URI} of every shard registered in the main file of conn, for Database(attach=...).
+    # Shard paths are stored relative to the main file, so the set of files can be moved together.
+    cursor = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entry_shards'")
+    if cursor.fetchone() is None:
+        return {}
+    main_path = next(row[2] for row in conn.execute('PRAGMA database_list') if row[1] == 'main')
+    directory = os.path.dirname(main_path)
+    return {
+        schema_name(year): shard_uri(os.path.join(directory, path))
+        for year, path in conn.execute('SELECT year, path FROM entry_shards ORDER BY year')
+    }
+
+def shard_years(attached):
+    # Closed years, newest first
+    return sorted((int(schema[len(SCHEMA_PREFIX):]) for schema in attached if schema.startswith(SCHEMA_PREFIX)), reverse=True)
+
+def closed_through(attached):
+    # Last day of the newest closed year, or None when every year is open
+    years = shard_years(attached)
+    return year_days(years[0])[1] if years else None
+
+def partitions(attached, first_day=FIRST_DAY, last_day=LAST_DAY):
+    # The partitions whose days overlap first_day..last_day, newest first. Each holds only
+    # days older than the one before it, so their rows in turn are already in day order.
+    years = shard_years(attached)
+    newest_closed = year_days(years[0])[1] if years else FIRST_DAY
+    candidates = [Partition('main', newest_closed + 1, LAST_DAY)]
+    candidates.extend(Partition(schema_name(year), *year_days(year)) for year in years)
+    return [partition for partition in candidates if partition.first_day <= last_day and first_day <= partition.last_day]
+
+def table(schema, name='time_entries'):
+    # FROM clause for a partition's table under its usual name, so column references like
+    # time_entries.day work unchanged. The main file's queries are left exactly as they were.
+    return name if schema == 'main' else f"{schema}.{name} AS {name}"
+
+def check_open(attached, day):
+    # Raises ClosedYearError when day falls in a closed year
+    last_closed = closed_through(attached)
+    if last_closed is not None and day <= last_closed:
+        raise ClosedYearError(f"Years up to {shard_years(attached)[0]} are closed; entries dated in them cannot be changed")
+
+def attach_limit():
+    # Most files one connection can attach; the main file is not counted
+    conn = sqlite3.connect(':memory:')
+    try:
+        return conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    finally:
+        conn.close()
@@ -0,0 +1,340 @@
+import argparse
+import json
+import sys
+import tempfile
+from datetime import datetime
+
+import shards
+import time_tracker
+from database import Database
+from dates import day_label, day_number, iso_week_number
+
+# Incremental sync between tracker databases, e.g. one per office into a consolidated one.
+# Every change to projects, users and time_entries is appended to the changes journal with an
+# increasing sequence number (see time_tracker.migration_change_journal). An export writes the
+# rows changed after a watermark as JSON lines; applying it to another database upserts or
+# deletes them there and remembers the export's last sequence number as that database's
+# watermark for the source, so the next export only has to cover what changed since.
+#
+# A row is named by (origin, id): the random id of the database it was created in and its id
+# there. Rows received from elsewhere get a local id and keep their original name in sync_ids,
+# so a row passed on through several databases, or back to where it came from, is never
+# duplicated. Projects and users that already exist under the same name or username are merged.
+
+DELTA_FORMAT = 'time-tracker-changes'
+DELTA_VERSION = 1
+
+class SyncError(Exception):
+    pass
+
+def get_origin(cursor):
+    cursor.execute('SELECT origin FROM sync_origin')
+    return cursor.fetchone()[0]
+
+def get_watermark(cursor, origin):
+    cursor.execute('SELECT seq FROM sync_watermarks WHERE origin = ?', (origin,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+class Identities:
+    # Converts between the ids of one database and (origin, id) names, remembering lookups
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.origin = get_origin(cursor)
+        self.names = {}
+
+    def name(self, table, local_id):
+        key = (table, local_id)
+        if key not in self.names:
+            self.cursor.execute('SELECT origin, origin_id FROM sync_ids WHERE table_name = ? AND local_id = ?', key)
+            row = self.cursor.fetchone()
+            self.names[key] = list(row) if row else [self.origin, local_id]
+        return self.names[key]
+
+    def local_id(self, table, origin, origin_id):
+        # Id of the named row here, or None when it has not been received (or was deleted)
+        if origin == self.origin:
+            return origin_id
+        self.cursor.execute('SELECT local_id FROM sync_ids WHERE origin = ? AND table_name = ? AND origin_id = ?',
+                            (origin, table, origin_id))
+        row = self.cursor.fetchone()
+        return row[0] if row else None
+
+    def remember(self, table, origin, origin_id, local_id):
+        if origin != self.origin:
+            self.cursor.execute('INSERT OR REPLACE INTO sync_ids (origin, table_name, origin_id, local_id) VALUES (?, ?, ?, ?)',
+                                (origin, table, origin_id, local_id))
+        self.names[(table, local_id)] = [origin, origin_id]
+
+def row_record(table, row, identities):
+    # The exported form of a row: ids of other rows become names, days become dates
+    if table == 'projects':
+        return {'name': row[0]}
+    if table == 'users':
+        return dict(zip(time_tracker.JOURNALED_TABLES['users'], row))
+    project_id, user_id, day, hours, category, notes = row
+    return {
+        'project': identities.name('projects', project_id),
+        'user': identities.name('users', user_id),
+        'date': day_label(day),
+        'hours': hours,
+        'category': category,
+        'notes': notes,
+    }
+
+def select_rows(table, source):
+    return f"SELECT id, {', '.join(time_tracker.JOURNALED_TABLES[table])} FROM {source}"
+
+def changed_rows(cursor, table, since, until):
+    # (seq, row_id, op, origin, origin_id) of every deletion after since, and of the last change
+    # of each row that still exists
+    cursor.execute('''
+        SELECT seq, row_id, op, origin, origin_id FROM changes AS change
+        WHERE table_name = ? AND seq > ? AND seq <= ?
+          AND (op = 'delete' OR seq = (
+              SELECT MAX(seq) FROM changes WHERE table_name = change.table_name AND row_id = change.row_id AND seq <= ?
+          ))
+        ORDER BY seq
+    ''', (table, since, until, until))
+    return cursor.fetchall()
+
+def export_changes(database, since, stream):
+    # Writes the changes after sequence number since, parents before the rows referring to
+    # them. Since 0 sends every row instead (a full snapshot). Returns (records, until).
+    cursor = database.cursor()
+    lookups = database.cursor()
+    rows = database.cursor()
+    # One read transaction, so the rows and the watermark belong to the same moment
+    cursor.execute('BEGIN')
+    try:
+        identities = Identities(lookups)
+        cursor.execute('SELECT IFNULL(MAX(seq), 0) FROM changes')
+        until = cursor.fetchone()[0]
+        stream.write(json.dumps({'format': DELTA_FORMAT, 'version': DELTA_VERSION, 'origin': identities.origin,
+                                 'since': since, 'until': until}) + '\n')
+        records = 0
+        for table in time_tracker.JOURNALED_TABLES:
+            if since == 0:
+                source = time_tracker.all_entries_source(database) if table == 'time_entries' else table
+                cursor.execute(select_rows(table, source))
+                for row_id, *row in cursor:
+                    stream.write(json.dumps({'table': table, 'id': identities.name(table, row_id),
+                                             'row': row_record(table, row, identities)}) + '\n')
+                    records += 1
+                continue
+            for _, row_id, op, origin, origin_id in changed_rows(cursor, table, since, until):
+                if op == 'delete':
+                    name = [origin, origin_id] if origin else [identities.origin, row_id]
+                    record = {'table': table, 'id': name, 'deleted': True}
+                else:
+                    rows.execute(f"{select_rows(table, table)} WHERE id = ?", (row_id,))
+                    _, *row = rows.fetchone()
+                    record = {'table': table, 'id': identities.name(table, row_id), 'row': row_record(table, row, identities)}
+                stream.write(json.dumps(record) + '\n')
+                records += 1
+    finally:
+        cursor.execute('COMMIT')
+    return records, until
+
+def read_header(stream):
+    try:
+        header = json.loads(stream.readline())
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get('format') != DELTA_FORMAT:
+        raise SyncError("Not a change export")
+    if header.get('version') != DELTA_VERSION:
+        raise SyncError(f"Unsupported change export version {header.get('version')}")
+    return header
+
+def find_by_key(cursor, table, row):
+    # Existing project or user with the same name or username, to merge with
+    column = 'name' if table == 'projects' else 'username'
+    cursor.execute(f"SELECT id FROM {table} WHERE {column} = ?", (row[column],))
+    found = cursor.fetchone()
+    return found[0] if found else None
+
+def entry_values(record, identities):
+    # time_entries column values of an exported entry, with the names resolved to local ids
+    row = record['row']
+    project_id = identities.local_id('projects', *row['project'])
+    user_id = identities.local_id('users', *row['user'])
+    if project_id is None or user_id is None:
+        raise SyncError(f"Entry {record['id']} refers to a project or user that has not been received")
+    entry_date = datetime.strptime(row['date'], "%Y-%m-%d").date()
+    return [project_id, user_id, day_number(entry_date), row['hours'], row['category'], row['notes']], iso_week_number(entry_date)
+
+def apply_record(cursor, record, identities, counts):
+    table = record['table']
+    if table not in time_tracker.JOURNALED_TABLES:
+        raise SyncError(f"Unknown table {table!r}")
+    columns = time_tracker.JOURNALED_TABLES[table]
+    origin, origin_id = record['id']
+    local_id = identities.local_id(table, origin, origin_id)
+    # A name of this database can point at a row deleted here since
+    if local_id is not None and origin == identities.origin:
+        cursor.execute(f"SELECT 1 FROM {table} WHERE id = ?", (local_id,))
+        if cursor.fetchone() is None:
+            if table == 'time_entries':
+                time_tracker.get_entry_scope(cursor, local_id)  # raises when it is in a closed year
+            local_id = None
+
+    if record.get('deleted'):
+        if local_id is not None:
+            if table == 'time_entries':
+                time_tracker.get_entry_scope(cursor, local_id)  # raises for a closed year
+            cursor.execute(f"DELETE FROM {table} WHERE id = ?", (local_id,))
+            counts['deleted'] += cursor.rowcount
+        return
+
+    if table == 'time_entries':
+        values, iso_week = entry_values(record, identities)
+    else:
+        values = [record['row'][column] for column in columns]
+        if local_id is None:
+            local_id = find_by_key(cursor, table, record['row'])
+            if local_id is not None:
+                identities.remember(table, origin, origin_id, local_id)
+
+    if local_id is None:
+        if origin == identities.origin:
+            return  # created here and deleted here since: the deletion wins
+        if table == 'time_entries':
+            shards.check_open(time_tracker.db.attached, values[2])
+            cursor.execute(f'''
+                INSERT INTO time_entries (id, {', '.join(columns)}, iso_week)
+                VALUES ({time_tracker.NEXT_ENTRY_ID}, ?, ?, ?, ?, ?, ?, ?)
+            ''', (*values, iso_week))
+        else:
+            cursor.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", values)
+        identities.remember(table, origin, origin_id, cursor.lastrowid)
+        counts['inserted'] += 1
+        return
+
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE id = ?", (local_id,))
+    current = cursor.fetchone()
+    if current is None:
+        # Only entries can be missing from the main file: they are in a closed year
+        raise shards.ClosedYearError(f"Entry {local_id} is in a closed year")
+    if list(current) == values:
+        return
+    if table == 'time_entries':
+        shards.check_open(time_tracker.db.attached, current[2])
+        shards.check_open(time_tracker.db.attached, values[2])
+        cursor.execute('''
+            UPDATE time_entries SET project_id = ?, user_id = ?, day = ?, hours = ?, category = ?, notes = ?, iso_week = ?
+            WHERE id = ?
+        ''', (*values, iso_week, local_id))
+    else:
+        assignments = ', '.join(f"{column} = ?" for column in columns)
+        cursor.execute(f"UPDATE {table} SET {assignments} WHERE id = ?", (*values, local_id))
+    counts['updated'] += 1
+
+def apply_changes(stream):
+    # Applies an export to time_tracker.db in one transaction. Applying the same export, or one
+    # already covered by a later export, again changes nothing. Returns {inserted, updated,
+    # deleted, skipped} counts; skipped is set when the export was already applied.
+    header = read_header(stream)
+    counts = {'inserted': 0, 'updated': 0, 'deleted': 0, 'skipped': False}
+    with time_tracker.db.transaction() as cursor:
+        identities = Identities(time_tracker.db.writer().cursor())
+        if header['origin'] == identities.origin:
+            raise SyncError("The export comes from this database")
+        watermark = get_watermark(cursor, header['origin'])
+        # A database upgraded with rows but no journal yet exports its snapshot up to change 0
+        if header['until'] <= watermark and watermark:
+            counts['skipped'] = True
+            return counts
+        if header['since'] > watermark:
+            raise SyncError(f"Changes {watermark + 1} to {header['since']} of {header['origin']} are missing: "
+                            f"export again with --since {watermark}")
+        for line_number, line in enumerate(stream, 2):
+            if not line.strip():
+                continue
+            try:
+                apply_record(cursor, json.loads(line), identities, counts)
+            except (KeyError, TypeError, ValueError) as error:
+                raise SyncError(f"Line {line_number}: malformed change ({error})")
+        cursor.execute('INSERT OR REPLACE INTO sync_watermarks (origin, seq) VALUES (?, ?)', (header['origin'], header['until']))
+    time_tracker.dimensions.invalidate()
+    time_tracker.report_cache.clear()
+    return counts
+
+def pull(source_path):
+    # Export from another database file, since the watermark this one has for it, and apply
+    source = Database(source_path, setup=time_tracker.migrate, attach=shards.attached_shards)
+    try:
+        watermark = get_watermark(time_tracker.db.cursor(), get_origin(source.cursor()))
+        with tempfile.TemporaryFile('w+') as delta:
+            records, until = export_changes(source, watermark, delta)
+            delta.seek(0)
+            return apply_changes(delta), records, until
+    finally:
+        source.close()
+
+def print_counts(counts):
+    if counts['skipped']:
+        print("Already applied", file=sys.stderr)
+    else:
+        print(f"Applied: {counts['inserted']} inserted, {counts['updated']} updated, {counts['deleted']} deleted", file=sys.stderr)
+
+def command_export(args):
+    if args.output in (None, '-'):
+        records, until = export_changes(time_tracker.db, args.since, sys.stdout)
+        sys.stdout.flush()
+    else:
+        with open(args.output, 'w') as stream:
+            records, until = export_changes(time_tracker.db, args.since, stream)
+    print(f"Exported {records} changes up to {until}", file=sys.stderr)
+    return 0
+
+def command_apply(args):
+    if args.path == '-':
+        print_counts(apply_changes(sys.stdin))
+    else:
+        with open(args.path) as stream:
+            print_counts(apply_changes(stream))
+    return 0
+
+def command_pull(args):
+    counts, records, until = pull(args.source)
+    print(f"Pulled {records} changes up to {until}", file=sys.stderr)
+    print_counts(counts)
+    return 0
+
+def command_status(args):
+    cursor = time_tracker.db.cursor()
+    origin = get_origin(cursor)
+    cursor.execute('SELECT IFNULL(MAX(seq), 0) FROM changes')
+    last_change = cursor.fetchone()[0]
+    cursor.execute('SELECT origin, seq FROM sync_watermarks ORDER BY origin')
+    json.dump({'origin': origin, 'last_change': last_change, 'applied': dict(cursor.fetchall())}, sys.stdout, indent=2)
+    sys.stdout.write('\n')
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sync changes between time tracker databases.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    export = commands.add_parser('export', help="write the changes after a watermark as JSON lines")
+    export.add_argument('--since', type=int, default=0, help="last change the receiver has applied (default: 0, every row)")
+    export.add_argument('-o', '--output', help="output file (default: stdout)")
+    export.set_defaults(handler=command_export)
+    apply = commands.add_parser('apply', help="apply an export to this database; applying one twice is harmless")
+    apply.add_argument('path', help="export file, '-' for stdin")
+    apply.set_defaults(handler=command_apply)
+    pull_command = commands.add_parser('pull', help="export from another database file and apply it here")
+    pull_command.add_argument('source', help="database file to pull from")
+    pull_command.set_defaults(handler=command_pull)
+    status = commands.add_parser('status', help="this database's origin, last change and the watermarks applied")
+    status.set_defaults(handler=command_status)
+    args = parser.parse_args(argv)
+
+    try:
+        return args.handler(args)
+    except (SyncError, shards.ClosedYearError, OSError) as error:
+        print(f"error: {error}", file=sys.stderr)
+        return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,26 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import time_tracker
+from database import Database
+
+@pytest.fixture
+def database(tmp_path):
+    # A bare Database on a new file, without the tracker's schema
+    database = Database(str(tmp_path / 'bare.db'))
+    yield database
+    database.close()
+
+@pytest.fixture
+def tracker(tmp_path):
+    # time_tracker pointed at a new, migrated file
+    time_tracker.use_database(str(tmp_path / 'tracker.db'))
+    yield time_tracker
+    time_tracker.stop_writes()
+    time_tracker.sessions.stop()
+    time_tracker.db.close()
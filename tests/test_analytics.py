@@ -0,0 +1,29 @@
+from datetime import date
+
+import pytest
+
+pytest.importorskip('numpy')
+
+@pytest.fixture
+def march_and_april(tracker):
+    # A full week of 8 hours in March 2026 and 4 hours on a Monday in April
+    user_id = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    project_id = tracker.add_project('Engine')
+    for day in range(2, 7):
+        tracker.add_time_entry(project_id, user_id, date(2026, 3, day), 8, 'Design', '')
+    tracker.add_time_entry(project_id, user_id, date(2026, 4, 6), 4, 'Design', '')
+    return user_id
+
+def utilization(tracker, date_range):
+    pivot = tracker.get_pivot_report('utilization', 0, '2', [], date_range)
+    return pivot.column_labels, [round(float(value), 2) for value in pivot.values[0]], round(float(pivot.totals[0]), 2)
+
+def test_utilization_over_all_time_counts_the_days_with_entries(tracker, march_and_april):
+    # From Monday 2 March to Monday 6 April: 22 weekdays in March, 4 in April
+    assert utilization(tracker, tracker.preset_date_range('all-time')) == (
+        ['2026-03', '2026-04'], [round(40 * 100 / (22 * 8), 2), round(4 * 100 / (4 * 8), 2)], round(44 * 100 / (26 * 8), 2))
+
+def test_utilization_over_a_range_counts_all_of_it(tracker, march_and_april):
+    # 22 weekdays in each month
+    assert utilization(tracker, (date(2026, 3, 1), date(2026, 4, 30))) == (
+        ['2026-03', '2026-04'], [round(40 * 100 / 176, 2), round(4 * 100 / 176, 2)], round(44 * 100 / 352, 2))
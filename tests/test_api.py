@@ -0,0 +1,39 @@
+import asyncio
+from datetime import date
+
+import pytest
+
+from api import ApiServer, HttpError, Request
+
+@pytest.fixture
+def server(tracker):
+    server = ApiServer(workers=2)
+    yield server
+    server.executor.shutdown()
+
+@pytest.fixture
+def two_users(tracker):
+    ada = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    alan = tracker.add_user('alan', 'secret', 'Alan', 'Turing')
+    project_id = tracker.add_project('Engine')
+    tracker.add_time_entry(project_id, ada, date(2026, 3, 2), 2, 'Design', 'ada')
+    tracker.add_time_entry(project_id, alan, date(2026, 3, 2), 3, 'Design', 'alan')
+    return ada, alan
+
+def get(server, target, user_id):
+    request = Request('GET', target, {}, b'')
+    request.user_id = user_id
+    return asyncio.run(server.entries(request, None))
+
+def test_entries_lists_the_session_users_own(server, two_users):
+    ada, _ = two_users
+    for target in ('/entries', f'/entries?user={ada}'):
+        status, payload = get(server, target, ada)
+        assert status == 200
+        assert [entry['notes'] for entry in payload['entries']] == ['ada']
+
+def test_entries_of_another_user_are_forbidden(server, two_users):
+    ada, alan = two_users
+    with pytest.raises(HttpError) as error:
+        get(server, f'/entries?user={alan}', ada)
+    assert error.value.status == 403
@@ -0,0 +1,17 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import ROOT
+
+def test_script_commands_share_the_running_module(tmp_path):
+    # python time_tracker.py <command> hands over to cli, which must not import a second copy
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', os.path.join(ROOT, 'time_tracker.py'), 'shards', 'list'],
+        capture_output=True, text=True, cwd=tmp_path, env={**os.environ, 'TIME_TRACKER_DB': str(tmp_path / 'cli.db')},
+    )
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout) == []
+    imported = [line.rsplit('|', 1)[-1].strip() for line in result.stderr.splitlines() if line.startswith('import time:')]
+    assert 'time_tracker' not in imported
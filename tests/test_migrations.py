@@ -0,0 +1,106 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+from dates import day_number, iso_week_number
+
+# The tables as the first release created them, before schema versions existed (user_version 0)
+V0_SCHEMA = '''
+    CREATE TABLE users (
+        id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL UNIQUE,
+        password TEXT NOT NULL,
+        first_name TEXT NOT NULL,
+        last_name TEXT NOT NULL
+    );
+    CREATE TABLE projects (
+        id INTEGER PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE
+    );
+    CREATE TABLE time_entries (
+        id INTEGER PRIMARY KEY,
+        project_id INTEGER,
+        user_id INTEGER,
+        date TEXT,
+        hours INTEGER,
+        category TEXT,
+        notes TEXT,
+        FOREIGN KEY (project_id) REFERENCES projects (id),
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+    CREATE TABLE sessions (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER,
+        created_at TEXT,
+        last_accessed TEXT,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    );
+'''
+
+USERS = [(1, 'ada', 'hash-1', 'Ada', 'Lovelace'), (2, 'alan', 'hash-2', 'Alan', 'Turing')]
+PROJECTS = [(1, 'Engine'), (2, 'Bombe')]
+# Around new year, where the ISO week belongs to the other calendar year
+ENTRIES = [
+    (1, 1, 1, date(2024, 12, 30), 3, 'Design', 'first week of 2025'),
+    (2, 1, 2, date(2025, 12, 29), 5, 'Programming', 'invoice the client'),
+    (3, 2, 1, date(2026, 1, 1), 2, 'Programming', ''),
+    (5, 2, 2, date(2026, 3, 2), 8, 'Marketing', None),
+]
+SESSIONS = [('session-1', 1, '2026-03-01T09:00:00', '2026-03-02T17:00:00')]
+
+def create_v0(path):
+    conn = sqlite3.connect(path)
+    conn.executescript(V0_SCHEMA)
+    conn.executemany('INSERT INTO users VALUES (?, ?, ?, ?, ?)', USERS)
+    conn.executemany('INSERT INTO projects VALUES (?, ?)', PROJECTS)
+    conn.executemany('INSERT INTO time_entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [(*entry[:3], entry[3].strftime('%Y-%m-%d'), *entry[4:]) for entry in ENTRIES])
+    conn.executemany('INSERT INTO sessions VALUES (?, ?, ?, ?)', SESSIONS)
+    conn.commit()
+    conn.close()
+
+def test_v0_database_migrates_to_current_with_its_data(tracker, tmp_path):
+    path = str(tmp_path / 'v0.db')
+    create_v0(path)
+    tracker.use_database(path)
+    cursor = tracker.db.cursor()
+
+    assert tracker.get_schema_version(cursor) == len(tracker.MIGRATIONS)
+    assert cursor.execute('SELECT * FROM users ORDER BY id').fetchall() == USERS
+    assert cursor.execute('SELECT * FROM projects ORDER BY id').fetchall() == PROJECTS
+    assert cursor.execute('SELECT * FROM sessions').fetchall() == SESSIONS
+    assert cursor.execute('''
+        SELECT id, project_id, user_id, day, iso_week, hours, category, notes FROM time_entries ORDER BY id
+    ''').fetchall() == [(entry_id, project_id, user_id, day_number(day), iso_week_number(day), hours, category, notes)
+                        for entry_id, project_id, user_id, day, hours, category, notes in ENTRIES]
+    assert [week for _, week in cursor.execute('SELECT id, iso_week FROM time_entries ORDER BY id')] == [202501, 202601, 202601, 202610]
+
+    # Rollups rebuilt over the converted dates, the existing notes indexed, and nothing journaled
+    # for sync: rows from before the journal go out with the first full export
+    assert tracker.verify_rollups(cursor) == {'daily_totals': 0, 'weekly_totals': 0}
+    assert cursor.execute('SELECT SUM(hours) FROM weekly_totals WHERE iso_week = 202601').fetchone()[0] == 7
+    assert [row[0] for row in tracker.search_entries('invoice', 0, '2', [], tracker.preset_date_range('all-time'))] == [2]
+    assert cursor.execute('SELECT next_id > end_id FROM search_backfill').fetchone()[0] == 1
+    assert cursor.execute('SELECT COUNT(*) FROM changes').fetchone()[0] == 0
+
+def test_current_database_is_opened_without_changes(tracker, tmp_path):
+    path = str(tmp_path / 'v0.db')
+    create_v0(path)
+    tracker.use_database(path)
+    tracker.db.cursor()
+    tracker.db.close()
+    before = open(path, 'rb').read()
+    tracker.use_database(path)
+    assert tracker.get_schema_version(tracker.db.cursor()) == len(tracker.MIGRATIONS)
+    tracker.db.close()
+    assert open(path, 'rb').read() == before
+
+def test_newer_schema_is_refused(tracker, tmp_path):
+    path = str(tmp_path / 'future.db')
+    conn = sqlite3.connect(path)
+    conn.execute(f'PRAGMA user_version = {len(tracker.MIGRATIONS) + 1}')
+    conn.close()
+    tracker.use_database(path)
+    with pytest.raises(RuntimeError, match='newer than this program supports'):
+        tracker.db.cursor()
@@ -0,0 +1,51 @@
+from datetime import date
+
+import pytest
+
+@pytest.fixture
+def ada_entries(tracker):
+    # Three entries on most days, so pages break between entries of the same day
+    ada = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    alan = tracker.add_user('alan', 'secret', 'Alan', 'Turing')
+    engine = tracker.add_project('Engine')
+    ids = []
+    for day in range(1, 6):
+        for hours in (1, 2, 3):
+            ids.append((tracker.day_number(date(2026, 3, day)), tracker.add_time_entry(engine, ada, date(2026, 3, day), hours, 'Design', '')))
+        tracker.add_time_entry(engine, alan, date(2026, 3, day), 8, 'Design', '')
+    return ada, engine, sorted(ids, reverse=True)
+
+def keys(entries):
+    return [(entry[2], entry[0]) for entry in entries]
+
+def walk_older(tracker, user_id, page_size):
+    pages = []
+    before = tracker.NEWEST_KEY
+    while True:
+        entries, more = tracker.get_time_entries_page(user_id, before, page_size=page_size)
+        pages.append(keys(entries))
+        if not more:
+            return pages
+        before = pages[-1][-1]
+
+def test_pages_cover_every_entry_once_newest_first(tracker, ada_entries):
+    ada, _, expected = ada_entries
+    pages = walk_older(tracker, ada, 4)
+    assert [len(page) for page in pages] == [4, 4, 4, 3]
+    assert [key for page in pages for key in page] == expected
+
+def test_newer_pages_walk_back(tracker, ada_entries):
+    ada, _, expected = ada_entries
+    # Nothing is older than the oldest entry
+    assert tracker.get_time_entries_page(ada, expected[-1], page_size=4) == ([], False)
+    entries, more = tracker.get_time_entries_page(ada, after=expected[-1], page_size=4)
+    assert more and keys(entries) == expected[-5:-1]
+    entries, more = tracker.get_time_entries_page(ada, after=keys(entries)[0], page_size=20)
+    assert not more and keys(entries) == expected[:-5]
+
+def test_entries_added_between_pages_neither_repeat_nor_shift_the_next_page(tracker, ada_entries):
+    ada, engine, expected = ada_entries
+    first, _ = tracker.get_time_entries_page(ada, page_size=4)
+    tracker.add_time_entry(engine, ada, date(2026, 3, 6), 5, 'Design', 'newest')
+    second, _ = tracker.get_time_entries_page(ada, keys(first)[-1], page_size=4)
+    assert keys(second) == expected[4:8]
@@ -0,0 +1,118 @@
+import sqlite3
+from datetime import date
+
+import pytest
+
+from report_cache import ReportCache
+
+MARCH = (date(2026, 3, 1), date(2026, 3, 31))
+
+@pytest.fixture
+def cache(database):
+    # data_version() needs the file to exist
+    with database.transaction() as cursor:
+        cursor.execute('CREATE TABLE t (x)')
+    return ReportCache(database)
+
+def cached(cache, key):
+    return cache.lookup(key)[0]
+
+def fill(cache, keys):
+    for key in keys:
+        _, generation = cache.lookup(key)
+        cache.store(key, [key], generation)
+
+def test_invalidate_drops_only_reports_that_could_hold_the_row(cache):
+    # (project_id or 0 for all, user ids or None for all, first day, last day)
+    keys = {
+        'all projects and users': (0, None, 10, 20),
+        'the project': (1, None, 10, 20),
+        'another project': (2, None, 10, 20),
+        'the user': (0, (5, 7), 10, 20),
+        'other users': (0, (5,), 10, 20),
+        'other days': (0, None, 30, 40),
+    }
+    fill(cache, keys.values())
+    cache.invalidate(day=15, project_id=1, user_id=7)
+    assert {name for name, key in keys.items() if cached(cache, key) is None} == {'all projects and users', 'the project', 'the user'}
+
+    # A rename: that project's reports and those over all projects
+    fill(cache, [keys['the project']])
+    cache.invalidate(project_id=2)
+    assert cached(cache, keys['another project']) is None
+    assert cached(cache, keys['other days']) is None
+    assert cached(cache, keys['the project']) is not None
+    cache.invalidate()
+    assert cache.stats()['entries'] == 0
+
+def test_result_read_across_a_write_is_not_stored(cache):
+    key = (0, None, 10, 20)
+    rows, generation = cache.lookup(key)
+    assert rows is None
+    # A write commits while the report is being read: its rows may predate it
+    cache.invalidate(day=99)
+    cache.store(key, ['stale'], generation)
+    assert cached(cache, key) is None
+
+    def fetch_with_write():
+        cache.invalidate(day=99)
+        return ['stale']
+    assert cache.load(key, fetch_with_write) == ['stale']
+    assert cached(cache, key) is None
+    assert cache.load(key, lambda: ['fresh']) == ['fresh']
+    assert cached(cache, key) == ['fresh']
+
+def test_streamed_report_is_not_stored_across_a_write(cache):
+    key = (0, None, 10, 20)
+
+    def rows():
+        yield 'first'
+        cache.invalidate(day=15)
+        yield 'second'
+    assert list(cache.stream(key, rows())) == ['first', 'second']
+    assert cached(cache, key) is None
+    assert list(cache.stream(key, iter(['first', 'second']))) == ['first', 'second']
+    assert cached(cache, key) == ['first', 'second']
+
+def test_commit_by_another_connection_clears_the_cache(cache, database):
+    key = (0, None, 10, 20)
+    fill(cache, [key])
+    assert cached(cache, key) is not None
+    other = sqlite3.connect(database.path, isolation_level=None)
+    other.execute('INSERT INTO t VALUES (1)')
+    other.close()
+    assert cached(cache, key) is None
+
+def test_least_recently_used_report_is_evicted(database):
+    cache = ReportCache(database, max_entries=2)
+    first, second, third = (0, None, 1, 1), (0, None, 2, 2), (0, None, 3, 3)
+    fill(cache, [first, second])
+    cached(cache, first)
+    fill(cache, [third])
+    assert cached(cache, second) is None
+    assert cached(cache, first) is not None and cached(cache, third) is not None
+    assert cache.stats()['evictions'] == 1
+
+def test_tracker_writes_invalidate_the_reports_they_touch(tracker):
+    ada = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    engine = tracker.add_project('Engine')
+    bombe = tracker.add_project('Bombe')
+    entry_id = tracker.add_time_entry(engine, ada, date(2026, 3, 2), 3, 'Design', '')
+
+    def hours(project_id):
+        return [row[3] for row in tracker.get_report_data(project_id, '2', [], MARCH)]
+    assert hours(0) == hours(engine) == [3]
+    assert hours(bombe) == []
+
+    tracker.add_time_entry(bombe, ada, date(2026, 3, 3), 2, 'Design', '')
+    hits = tracker.report_cache.hits
+    assert hours(engine) == [3]
+    assert tracker.report_cache.hits == hits + 1
+    assert sorted(hours(0)) == [2, 3]
+    assert hours(bombe) == [2]
+
+    tracker.edit_time_entry(entry_id, date(2026, 3, 2), 5, 'Design', '')
+    assert hours(engine) == [5]
+    tracker.remove_time_entry(entry_id)
+    assert hours(engine) == []
+    assert hours(0) == [2]
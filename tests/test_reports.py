@@ -0,0 +1,81 @@
+import csv
+import gzip
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+
+from exporters import CsvExporter, GzipCsvExporter
+
+THIS_YEAR = (date(2026, 1, 1), date(2026, 12, 31))
+
+class BrokenStream:
+    # A pager the user quit right away
+    def write(self, text):
+        raise BrokenPipeError()
+
+    def flush(self):
+        pass
+
+class FailingSink:
+    # ReportPrinter writing to BrokenStream: fails on every row and again on the totals
+    def start(self):
+        pass
+
+    def add(self, entry):
+        raise BrokenPipeError()
+
+    def finish(self):
+        raise BrokenPipeError()
+
+@contextmanager
+def quit_pager():
+    # render.paged() when the pager is closed before the end of the report
+    try:
+        yield BrokenStream()
+    except BrokenPipeError:
+        pass
+
+@pytest.fixture
+def entries(tracker):
+    user_id = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    project_id = tracker.add_project('Engine')
+    for day in range(1, 21):
+        tracker.add_time_entry(project_id, user_id, date(2026, 3, day), 1.5, 'Development', f'note {day}')
+    return user_id, project_id
+
+def test_run_report_finishes_every_sink_when_one_fails(tracker, entries, tmp_path):
+    exporter = GzipCsvExporter(str(tmp_path / 'report.csv.gz'), chunk_size=5)
+    with pytest.raises(BrokenPipeError):
+        tracker.run_report(tracker.iter_report_data(0, '2', [], THIS_YEAR), [FailingSink(), exporter])
+    # Closed, so a complete gzip stream, though with none of the rows
+    with gzip.open(exporter.path, 'rt', newline='') as file:
+        assert list(csv.reader(file)) == [['Date', 'Project', 'Hours', 'Category', 'Notes', 'User']]
+
+def test_generate_report_exports_everything_after_the_pager_quits(tracker, entries, tmp_path, monkeypatch, capsys):
+    user_id, _ = entries
+    exporter = CsvExporter(str(tmp_path / 'report.csv'))
+    monkeypatch.setattr(tracker, 'clear_console', lambda: None)
+    monkeypatch.setattr(tracker, 'get_report_parameters', lambda user_id: (0, '2', [], THIS_YEAR))
+    monkeypatch.setattr(tracker, 'select_report_type', lambda: '1')
+    monkeypatch.setattr(tracker, 'paged', quit_pager)
+    monkeypatch.setattr(tracker, 'ask_export', lambda project_id: exporter)
+    monkeypatch.setattr('builtins.input', lambda prompt='': '')
+    tracker.generate_report(user_id)
+    with open(exporter.path, newline='') as file:
+        assert len(list(csv.reader(file))) == 21
+    assert f"Report exported to {exporter.path} (20 rows" in capsys.readouterr().out
+
+def test_generate_report_reports_a_failed_export(tracker, entries, tmp_path, monkeypatch, capsys):
+    user_id, _ = entries
+    exporter = CsvExporter(str(tmp_path / 'missing' / 'report.csv'))
+    monkeypatch.setattr(tracker, 'clear_console', lambda: None)
+    monkeypatch.setattr(tracker, 'get_report_parameters', lambda user_id: (0, '2', [], THIS_YEAR))
+    monkeypatch.setattr(tracker, 'select_report_type', lambda: '1')
+    monkeypatch.setattr(tracker, 'paged', quit_pager)
+    monkeypatch.setattr(tracker, 'ask_export', lambda project_id: exporter)
+    monkeypatch.setattr('builtins.input', lambda prompt='': '')
+    tracker.generate_report(user_id)
+    output = capsys.readouterr().out
+    assert f"Export to {exporter.path} failed" in output
+    assert "Report exported" not in output
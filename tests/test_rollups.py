@@ -0,0 +1,66 @@
+import json
+from datetime import date
+
+import pytest
+
+import bulk_import
+import cli
+
+@pytest.fixture
+def ids(tracker):
+    ada = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    alan = tracker.add_user('alan', 'secret', 'Alan', 'Turing')
+    engine = tracker.add_project('Engine')
+    return ada, alan, engine
+
+def weekly(tracker):
+    cursor = tracker.db.cursor()
+    return cursor.execute('SELECT user_id, iso_week, category, hours, entries FROM weekly_totals ORDER BY 1, 2, 3').fetchall()
+
+def verify(capsys):
+    # The `rollups verify` command, which compares every rollup row with the raw entries
+    status = cli.main(['rollups', 'verify'])
+    assert 'FAIL' not in capsys.readouterr().out
+    return status
+
+def test_rollups_follow_inserts_edits_and_deletes(tracker, ids, capsys):
+    ada, alan, engine = ids
+    first = tracker.add_time_entry(engine, ada, date(2026, 3, 2), 3, 'Design', '')
+    second = tracker.add_time_entry(engine, ada, date(2026, 3, 3), 2, 'Design', '')
+    tracker.add_time_entry(engine, alan, date(2026, 3, 3), 4, 'Programming', '')
+    assert verify(capsys) == 0
+    assert weekly(tracker) == [(ada, 202610, 'Design', 5, 2), (alan, 202610, 'Programming', 4, 1)]
+
+    # Into another week, with other hours and category
+    tracker.edit_time_entry(second, date(2026, 3, 9), 6, 'Programming', 'moved')
+    assert verify(capsys) == 0
+    assert weekly(tracker) == [(ada, 202610, 'Design', 3, 1), (ada, 202611, 'Programming', 6, 1), (alan, 202610, 'Programming', 4, 1)]
+
+    # The last entry of a rollup row removes the row
+    tracker.remove_time_entry(first)
+    assert verify(capsys) == 0
+    assert weekly(tracker) == [(ada, 202611, 'Programming', 6, 1), (alan, 202610, 'Programming', 4, 1)]
+    daily = tracker.db.cursor().execute('SELECT day, hours FROM daily_totals ORDER BY day').fetchall()
+    assert daily == [(tracker.day_number(date(2026, 3, 3)), 4), (tracker.day_number(date(2026, 3, 9)), 6)]
+
+def test_bulk_import_keeps_the_rollups(tracker, ids, tmp_path, capsys):
+    _, _, engine = ids
+    tracker.add_time_entry(engine, ids[0], date(2026, 3, 2), 1, 'Design', 'before')
+    path = tmp_path / 'entries.jsonl'
+    with open(path, 'w') as file:
+        for day in range(1, 29):
+            file.write(json.dumps({'date': f'2026-02-{day:02}', 'project': 'Engine', 'hours': day % 8 + 1,
+                                   'category': 'Design', 'notes': f'import {day}', 'user': 'Alan Turing'}) + '\n')
+    imported, rejected, _ = bulk_import.import_entries(str(path), batch_size=10, progress=False)
+    assert (imported, rejected) == (28, 0)
+    assert verify(capsys) == 0
+
+def test_verify_reports_and_rebuild_repairs_a_drifted_rollup(tracker, ids, capsys):
+    ada, _, engine = ids
+    tracker.add_time_entry(engine, ada, date(2026, 3, 2), 3, 'Design', '')
+    with tracker.db.transaction() as cursor:
+        cursor.execute('UPDATE daily_totals SET hours = hours + 1')
+    assert cli.main(['rollups', 'verify']) == 1
+    assert 'FAIL daily_totals' in capsys.readouterr().out
+    assert cli.main(['rollups', 'rebuild']) == 0
+    assert verify(capsys) == 0
@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+
+ALL_TIME = (date(2000, 1, 1), date(2099, 12, 31))
+NOTES = ['invoice the client', 'client meeting', 'fix invoice totals', 'design review', 'meeting notes']
+
+@pytest.fixture
+def entries(tracker):
+    ada = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    alan = tracker.add_user('alan', 'secret', 'Alan', 'Turing')
+    engine = tracker.add_project('Engine')
+    for i in range(60):
+        tracker.add_time_entry(engine, (ada, alan)[i % 2], date(2026, 1, 1 + i % 28), 1, 'Design', f"{NOTES[i % len(NOTES)]} {i}")
+    return ada, alan, engine
+
+def matches(tracker, text, users=()):
+    rows = tracker.search_entries(text, 0, '3' if users else '2', list(users), ALL_TIME, limit=1000)
+    return sorted(row[0] for row in rows)
+
+def expected(tracker, words, user_id=None):
+    cursor = tracker.db.cursor()
+    cursor.execute('SELECT id, user_id, notes FROM time_entries ORDER BY id')
+    return [entry_id for entry_id, user, notes in cursor
+            if all(word in notes.split() for word in words) and user_id in (None, user)]
+
+def index_is_consistent(tracker):
+    # Raises when the full-text index disagrees with the notes in time_entries
+    with tracker.db.transaction() as cursor:
+        cursor.execute("INSERT INTO time_entries_fts (time_entries_fts, rank) VALUES ('integrity-check', 1)")
+    return True
+
+@pytest.mark.parametrize('plan', ['ranked', 'newest first', 'entries first'])
+def test_every_plan_finds_the_same_entries(tracker, entries, monkeypatch, plan):
+    ada, _, _ = entries
+    if plan != 'ranked':
+        monkeypatch.setattr(tracker, 'SEARCH_RANKED_MAX_ENTRIES', 0)
+        # Probing the index per filtered entry made free or prohibitive
+        monkeypatch.setattr(tracker, 'SEARCH_PROBE_COST', 1 if plan == 'entries first' else 10 ** 9)
+    assert matches(tracker, 'invoice') == expected(tracker, ['invoice'])
+    assert matches(tracker, 'client invoice') == expected(tracker, ['client', 'invoice'])
+    assert matches(tracker, 'meeting', [ada]) == expected(tracker, ['meeting'], ada)
+    assert matches(tracker, 'meet*') == expected(tracker, ['meeting'])
+    assert matches(tracker, 'nowhere') == []
+
+def test_interrupted_backfill_resumes_around_edits(tracker, entries):
+    ada, _, engine = entries
+    # As just after migration_search_index on a database with these entries
+    with tracker.db.transaction() as cursor:
+        cursor.execute("INSERT INTO time_entries_fts (time_entries_fts) VALUES ('delete-all')")
+        cursor.execute('UPDATE search_backfill SET next_id = 1, end_id = (SELECT MAX(id) FROM time_entries)')
+    tracker.backfill_search_index(tracker.db, batch_size=7)
+    assert index_is_consistent(tracker)
+
+    with tracker.db.transaction() as cursor:
+        cursor.execute("INSERT INTO time_entries_fts (time_entries_fts) VALUES ('delete-all')")
+        cursor.execute('UPDATE search_backfill SET next_id = 1, end_id = (SELECT MAX(id) FROM time_entries)')
+        # Stopped after the first batches
+        cursor.execute('INSERT INTO time_entries_fts (rowid, notes, project_id, category) '
+                       'SELECT id, notes, project_id, category FROM time_entries WHERE id <= 20')
+        cursor.execute('UPDATE search_backfill SET next_id = 21')
+    # Edits, deletes and inserts on both sides of where it stopped
+    tracker.edit_time_entry(5, date(2026, 1, 5), 1, 'Design', 'invoice sent')
+    tracker.edit_time_entry(40, date(2026, 1, 12), 1, 'Design', 'invoice sent')
+    tracker.remove_time_entry(6)
+    tracker.remove_time_entry(41)
+    new_id = tracker.add_time_entry(engine, ada, date(2026, 2, 1), 1, 'Design', 'invoice sent')
+
+    tracker.backfill_search_index(tracker.db, batch_size=7)
+    assert index_is_consistent(tracker)
+    assert matches(tracker, 'sent') == [5, 40, new_id]
+    assert matches(tracker, 'invoice') == expected(tracker, ['invoice'])
@@ -0,0 +1,55 @@
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from sessions import SessionStore
+
+@pytest.fixture
+def ada(tracker):
+    return tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+
+def stored_last_accessed(tracker, session_id):
+    cursor = tracker.db.cursor()
+    row = cursor.execute('SELECT last_accessed FROM sessions WHERE id = ?', (session_id,)).fetchone()
+    return row and row[0]
+
+def test_logout_by_another_process_ends_the_cached_session(tracker, ada):
+    session_id = tracker.create_session(ada)
+    assert tracker.sessions.get(session_id)[1] == ada
+    assert tracker.get_active_session()[0] == session_id
+    other = sqlite3.connect(tracker.db.path, isolation_level=None)
+    other.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
+    other.close()
+    assert tracker.sessions.get(session_id) is None
+    assert tracker.get_active_session() is None
+
+def test_use_by_another_process_keeps_the_session_alive(tracker, ada):
+    session_id = tracker.create_session(ada)
+    later = (datetime.now() + timedelta(minutes=5)).isoformat()
+    other = sqlite3.connect(tracker.db.path, isolation_level=None)
+    other.execute('UPDATE sessions SET last_accessed = ? WHERE id = ?', (later, session_id))
+    other.close()
+    assert tracker.sessions.get(session_id)[3] == later
+
+def test_touches_are_written_on_flush(tracker, ada):
+    session_id = tracker.create_session(ada)
+    created = stored_last_accessed(tracker, session_id)
+    tracker.update_session_access(session_id)
+    touched = tracker.sessions.get(session_id)[3]
+    assert touched > created
+    assert stored_last_accessed(tracker, session_id) == created
+    tracker.sessions.flush()
+    assert stored_last_accessed(tracker, session_id) == touched
+
+def test_sweep_removes_only_expired_sessions(tracker, ada):
+    old, current = tracker.create_session(ada), tracker.create_session(ada)
+    an_hour_ago = (datetime.now() - timedelta(hours=1)).isoformat()
+    with tracker.db.transaction() as cursor:
+        cursor.execute('UPDATE sessions SET last_accessed = ? WHERE id = ?', (an_hour_ago, old))
+    # As seen by another process, which has not used either session
+    store = SessionStore(tracker.db, ttl_seconds=60)
+    assert store.get(old) is None
+    assert store.sweep() == 1
+    assert stored_last_accessed(tracker, old) is None
+    assert store.get(current)[0] == current
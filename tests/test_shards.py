@@ -0,0 +1,66 @@
+from datetime import date
+
+import pytest
+
+import shards
+
+ALL_TIME = (date(2000, 1, 1), date(2099, 12, 31))
+
+@pytest.fixture
+def entries(tracker):
+    # Entries in three years, the last of them the current one
+    ada = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    alan = tracker.add_user('alan', 'secret', 'Alan', 'Turing')
+    engine = tracker.add_project('Engine')
+    this_year = date.today().year
+    ids = {}
+    for year in (this_year - 2, this_year - 1, this_year):
+        for i in range(6):
+            entry_date = date(year, 1 + i, 1 + i)
+            ids[entry_date] = tracker.add_time_entry(engine, (ada, alan)[i % 2], entry_date, 1 + i, 'Design', f'invoice {year} {i}')
+    return ada, engine, ids
+
+def views(tracker, ada, engine):
+    # What reports, paging and search show over every year
+    report = sorted(tracker.get_report_data(0, '2', [], ALL_TIME))
+    by_project = sorted(tracker.get_report_data(engine, '3', [ada], ALL_TIME))
+    pages = []
+    before = tracker.NEWEST_KEY
+    while True:
+        page, more = tracker.get_time_entries_page(ada, before, page_size=4)
+        pages.append([entry[0] for entry in page])
+        if not more:
+            break
+        before = (page[-1][2], page[-1][0])
+    found = sorted(row[0] for row in tracker.search_entries('invoice', 0, '2', [], ALL_TIME, limit=1000))
+    return report, by_project, pages, found
+
+def test_closed_years_read_the_same(tracker, entries):
+    ada, engine, ids = entries
+    before = views(tracker, ada, engine)
+    this_year = date.today().year
+    assert tracker.close_years() == [this_year - 2, this_year - 1]
+    assert views(tracker, ada, engine) == before
+    assert shards.shard_years(tracker.db.attached) == [this_year - 1, this_year - 2]
+    # Only the current year is left in the main file
+    cursor = tracker.db.cursor()
+    assert cursor.execute('SELECT COUNT(*) FROM main.time_entries').fetchone()[0] == 6
+
+def test_closed_years_refuse_changes(tracker, entries):
+    ada, engine, ids = entries
+    tracker.close_years()
+    last_year = date(date.today().year - 1, 3, 3)
+    with pytest.raises(shards.ClosedYearError):
+        tracker.add_time_entry(engine, ada, last_year, 1, 'Design', '')
+    with pytest.raises(shards.ClosedYearError):
+        tracker.edit_time_entry(ids[last_year], last_year, 2, 'Design', '')
+    with pytest.raises(shards.ClosedYearError):
+        tracker.remove_time_entry(ids[last_year])
+    # Nor can an open entry be moved into a closed year
+    this_year = date(date.today().year, 3, 3)
+    with pytest.raises(shards.ClosedYearError):
+        tracker.edit_time_entry(ids[this_year], last_year, 2, 'Design', '')
+
+    # New entries get ids above those moved out
+    new_id = tracker.add_time_entry(engine, ada, this_year, 1, 'Design', '')
+    assert new_id > max(ids.values())
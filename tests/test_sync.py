@@ -0,0 +1,85 @@
+import io
+from datetime import date
+
+import pytest
+
+import sync
+
+def contents(tracker):
+    # Every synced row by its natural names, independent of the local ids
+    cursor = tracker.db.cursor()
+    return {
+        'projects': sorted(row[0] for row in cursor.execute('SELECT name FROM projects')),
+        'users': sorted(cursor.execute('SELECT username, first_name, last_name FROM users').fetchall()),
+        'entries': sorted(cursor.execute('''
+            SELECT p.name, u.username, e.day, e.iso_week, e.hours, e.category, e.notes
+            FROM time_entries e JOIN projects p ON p.id = e.project_id JOIN users u ON u.id = e.user_id
+        ''').fetchall()),
+    }
+
+def journal_length(tracker):
+    return tracker.db.cursor().execute('SELECT COUNT(*) FROM changes').fetchone()[0]
+
+def export(tracker, since=0):
+    stream = io.StringIO()
+    _, until = sync.export_changes(tracker.db, since, stream)
+    return stream.getvalue(), until
+
+def apply(text):
+    return sync.apply_changes(io.StringIO(text))
+
+def test_applying_an_export_again_changes_nothing(tracker, tmp_path):
+    office, central = str(tmp_path / 'office.db'), str(tmp_path / 'central.db')
+    tracker.use_database(office)
+    ada = tracker.add_user('ada', 'secret', 'Ada', 'Lovelace')
+    engine = tracker.add_project('Engine')
+    first = tracker.add_time_entry(engine, ada, date(2026, 3, 2), 3, 'Design', 'sketches')
+    second = tracker.add_time_entry(engine, ada, date(2026, 3, 3), 2, 'Design', 'review')
+    full, until = export(tracker)
+    expected = contents(tracker)
+
+    tracker.use_database(central)
+    assert apply(full) == {'inserted': 4, 'updated': 0, 'deleted': 0, 'skipped': False}
+    assert contents(tracker) == expected
+    journaled = journal_length(tracker)
+    assert apply(full)['skipped']
+    # The same records replayed without the watermark match what is there already
+    with tracker.db.transaction() as cursor:
+        cursor.execute('DELETE FROM sync_watermarks')
+    assert apply(full) == {'inserted': 0, 'updated': 0, 'deleted': 0, 'skipped': False}
+    assert contents(tracker) == expected
+    assert journal_length(tracker) == journaled
+
+    # Only what changed since, and again harmless twice
+    tracker.use_database(office)
+    tracker.edit_time_entry(first, date(2026, 3, 2), 4, 'Design', 'sketches')
+    tracker.remove_time_entry(second)
+    delta, _ = export(tracker, until)
+    expected = contents(tracker)
+    tracker.use_database(central)
+    assert apply(delta) == {'inserted': 0, 'updated': 1, 'deleted': 1, 'skipped': False}
+    assert apply(delta)['skipped']
+    assert contents(tracker) == expected
+
+    # Sent back to where they came from, the rows are recognized rather than duplicated
+    back, _ = export(tracker)
+    tracker.use_database(office)
+    journaled = journal_length(tracker)
+    assert apply(back) == {'inserted': 0, 'updated': 0, 'deleted': 0, 'skipped': False}
+    assert contents(tracker) == expected
+    assert journal_length(tracker) == journaled
+
+def test_gap_in_the_changes_is_refused(tracker, tmp_path):
+    tracker.use_database(str(tmp_path / 'office.db'))
+    engine = tracker.add_project('Engine')
+    full, until = export(tracker)
+    tracker.rename_project(engine, 'Difference Engine')
+    tracker.add_project('Analytical Engine')
+    _, later = export(tracker, until)
+    tracker.add_project('Bombe')
+    skipped, _ = export(tracker, later)
+
+    tracker.use_database(str(tmp_path / 'central.db'))
+    apply(full)
+    with pytest.raises(sync.SyncError, match=f'--since {until}'):
+        apply(skipped)
@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+
+import pytest
+
+from write_queue import WriteQueue
+
+@pytest.fixture
+def notes(database):
+    with database.transaction() as cursor:
+        cursor.execute('CREATE TABLE notes (id INTEGER PRIMARY KEY, text TEXT NOT NULL)')
+    return database
+
+def insert(text, fail=False):
+    def work(cursor):
+        cursor.execute('INSERT INTO notes (text) VALUES (?)', (text,))
+        if fail:
+            raise ValueError(text)
+        return cursor.lastrowid
+    return work
+
+def stored(database):
+    return [row[0] for row in database.cursor().execute('SELECT text FROM notes ORDER BY id')]
+
+def test_failed_unit_is_rolled_back_alone(notes):
+    # One batch: the delay is long enough for all three to be queued before it is committed
+    queue = WriteQueue(notes, max_writes=3, max_delay_ms=1000)
+    futures = [queue.submit(insert('first')), queue.submit(insert('broken', fail=True)), queue.submit(insert('third'))]
+    assert futures[0].result(timeout=5) == 1
+    with pytest.raises(ValueError, match='broken'):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 2
+    queue.stop()
+    assert stored(notes) == ['first', 'third']
+    assert queue.stats() == {'batches': 1, 'writes': 2, 'failures': 1, 'writes_per_batch': 2.0}
+
+def test_after_runs_once_committed(notes):
+    queue = WriteQueue(notes)
+    seen = []
+    # A read connection of its own sees the row only once it is committed
+    future = queue.submit(insert('note'), lambda row_id: seen.append((row_id, stored(notes))))
+    assert future.result(timeout=5) == 1
+    queue.stop()
+    assert seen == [(1, ['note'])]
+
+def test_after_error_keeps_the_write(notes, capsys):
+    queue = WriteQueue(notes)
+    def after(result):
+        raise RuntimeError('cache gone')
+    assert queue.run(insert('note'), after) == 1
+    queue.stop()
+    assert stored(notes) == ['note']
+    assert 'cache gone' in capsys.readouterr().err
+
+def test_locked_begin_fails_every_write_in_the_batch(notes):
+    notes.busy_timeout_ms = 50
+    notes.close()
+    blocker = sqlite3.connect(notes.path, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    queue = WriteQueue(notes, max_writes=2, max_delay_ms=1000)
+    try:
+        futures = [queue.submit(insert('first')), queue.submit(insert('second'))]
+        for future in futures:
+            with pytest.raises(sqlite3.OperationalError, match='locked'):
+                future.result(timeout=5)
+        assert queue.stats()['failures'] == 2
+    finally:
+        blocker.rollback()
+        blocker.close()
+    # The writer thread carries on once the file is free again
+    assert queue.run(insert('third')) == 1
+    queue.stop()
+    assert stored(notes) == ['third']
+
+def test_cancelled_write_is_skipped(notes):
+    started = threading.Event()
+    release = threading.Event()
+    def wait(cursor):
+        started.set()
+        release.wait(5)
+    queue = WriteQueue(notes, max_writes=1)
+    first = queue.submit(wait)
+    started.wait(5)
+    cancelled = queue.submit(insert('cancelled'))
+    assert cancelled.cancel()
+    release.set()
+    first.result(timeout=5)
+    assert queue.run(insert('kept')) == 1
+    queue.stop()
+    assert stored(notes) == ['kept']
@@ -1,15 +1,76 @@
+import math
 import os
 import sqlite3
-import csv
-from datetime import datetime, date, timedelta
+import sys
+import threading
+from datetime import date, timedelta
 import hashlib
-import uuid 
 
-# Database setup
-conn = sqlite3.connect('time_tracker.db')
-cursor = conn.cursor()
-
-def setup_database():
+from database import Database
+from dimensions import DimensionCache
+import shards
+from dates import EPOCH_JULIAN_DAY, day_date, day_label, day_name, day_number, iso_week_number, week_start
+from exporters import DEFAULT_CHUNK_SIZE, EXPORT_FORMATS, create_exporter
+from profiler import is_full_scan, profiled
+from render import Screen, clear_screen, draw_screen, paged
+from report_cache import ReportCache
+from sessions import SessionStore
+
+# Database setup: the path comes from TIME_TRACKER_DB (default time_tracker.db).
+# The file is opened, and migrated if needed, on the first query. Closed years (see shards.py)
+# are attached to every connection.
+db = Database(setup=lambda database: migrate(database), attach=shards.attached_shards)
+sessions = SessionStore(db)
+report_cache = ReportCache(db)
+dimensions = DimensionCache(db)
+# The group-committing writer, created by the first write_queue() call: only the API server and
+# the load tests queue writes, so nothing else pays for importing it
+writes = None
+writes_lock = threading.Lock()
+
+def use_database(path, **options):
+    # Point every data-access function at another database file
+    global db, sessions, report_cache, dimensions
+    stop_writes()
+    sessions.stop()
+    db.close()
+    db = Database(path, setup=lambda database: migrate(database), attach=shards.attached_shards, **options)
+    sessions = SessionStore(db)
+    report_cache = ReportCache(db)
+    dimensions = DimensionCache(db)
+
+# Writes are units of work, (work(cursor) -> result, after(result)): work runs inside a
+# transaction and after once it is committed, to invalidate the caches. run_unit() applies one
+# in a transaction of its own on the calling thread; submit() queues it for the group-committing
+# writer thread (see write_queue.py) and returns a Future.
+
+def run_unit(unit):
+    work, after = unit
+    with db.transaction() as cursor:
+        result = work(cursor)
+    after(result)
+    return result
+
+def write_queue():
+    global writes
+    with writes_lock:
+        if writes is None:
+            from write_queue import WriteQueue
+            writes = WriteQueue(db)
+        return writes
+
+def submit(unit):
+    return write_queue().submit(*unit)
+
+def stop_writes():
+    # Commits whatever is still queued and ends the writer thread; the next submit() starts over
+    global writes
+    with writes_lock:
+        queue, writes = writes, None
+    if queue is not None:
+        queue.stop()
+
+def migration_base_tables(cursor):
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY,
@@ -51,23 +112,383 @@ def setup_database():
         )
     ''')
 
-    conn.commit()
+def migration_report_indexes(cursor):
+    # Date range reports over all projects; project and user filters are checked inside the index
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_time_entries_date ON time_entries (date, project_id, user_id)')
+    # Reports filtered by project
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_time_entries_project_date ON time_entries (project_id, date, user_id)')
+    # Reports filtered by user and list_time_entries (rowid follows date, so ORDER BY date, id needs no sort)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_time_entries_user_date ON time_entries (user_id, date)')
+
+def migration_project_users_index(cursor):
+    # Covering index for get_project_users
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_time_entries_project_user ON time_entries (project_id, user_id)')
+
+# Rollup tables with the hours per (user, project, category, day) and per ISO week.
+# Triggers on time_entries keep them current, so totals never need a walk over the raw entries.
+ROLLUP_KEY_EXPRS = "IFNULL({0}user_id, 0), IFNULL({0}project_id, 0), IFNULL({0}category, '')"
+
+ROLLUP_TABLES = [
+    # (table, period column, period expression over a time_entries row)
+    ('daily_totals', 'day', "IFNULL({0}day, '')"),
+    ('weekly_totals', 'iso_week', "IFNULL({0}iso_week, '')"),
+]
+# time_entries columns whose update moves an entry between rollup rows
+ROLLUP_UPDATE_COLUMNS = 'user_id, project_id, category, day, iso_week, hours'
+
+# The rollups as first released, over the TEXT date column (see migration_integer_dates)
+TEXT_DATE_ROLLUP_TABLES = [
+    ('daily_totals', 'day', "IFNULL({0}date, '')"),
+    ('weekly_totals', 'week_start', "IFNULL(date({0}date, '-6 days', 'weekday 1'), '')"),
+]
+TEXT_DATE_ROLLUP_UPDATE_COLUMNS = 'user_id, project_id, category, date, hours'
+
+def rollup_source_query(period_expr, where='true', source='time_entries'):
+    return f'''
+        SELECT {ROLLUP_KEY_EXPRS.format('')}, {period_expr.format('')}, SUM(IFNULL(hours, 0)), COUNT(*)
+        FROM {source}
+        WHERE {where}
+        GROUP BY 1, 2, 3, 4
+    '''
 
-# Llamar a esta función al inicio del programa
-setup_database()
+def create_rollup_triggers(cursor, tables=ROLLUP_TABLES, update_columns=ROLLUP_UPDATE_COLUMNS):
+    inserts = []
+    deletes = []
+    for table, period, period_expr in tables:
+        new_key = f"{ROLLUP_KEY_EXPRS.format('NEW.')}, {period_expr.format('NEW.')}"
+        old_key = f"{ROLLUP_KEY_EXPRS.format('OLD.')}, {period_expr.format('OLD.')}"
+        inserts.append(f'''
+            INSERT INTO {table} (user_id, project_id, category, {period}, hours, entries)
+            VALUES ({new_key}, IFNULL(NEW.hours, 0), 1)
+            ON CONFLICT (user_id, project_id, category, {period})
+            DO UPDATE SET hours = hours + excluded.hours, entries = entries + 1;
+        ''')
+        deletes.append(f'''
+            UPDATE {table} SET hours = hours - IFNULL(OLD.hours, 0), entries = entries - 1
+            WHERE (user_id, project_id, category, {period}) = ({old_key});
+            DELETE FROM {table}
+            WHERE (user_id, project_id, category, {period}) = ({old_key}) AND entries <= 0;
+        ''')
+    inserts = ''.join(inserts)
+    deletes = ''.join(deletes)
+
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS time_entries_rollup_insert AFTER INSERT ON time_entries BEGIN {inserts} END')
+    cursor.execute(f'CREATE TRIGGER IF NOT EXISTS time_entries_rollup_delete AFTER DELETE ON time_entries BEGIN {deletes} END')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS time_entries_rollup_update
+        AFTER UPDATE OF {update_columns} ON time_entries
+        BEGIN {deletes} {inserts} END
+    ''')
 
-# Para captura de teclas sin Enter
-if os.name == 'nt':  # Para Windows
-    import msvcrt
-else:  # Para sistemas Unix
-    import sys
-    import tty
-    import termios
+def rebuild_rollups(cursor, tables=ROLLUP_TABLES, source='time_entries'):
+    for table, period, period_expr in tables:
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(f'''
+            INSERT INTO {table} (user_id, project_id, category, {period}, hours, entries)
+            {rollup_source_query(period_expr, source=source)}
+        ''')
+
+def add_entries_to_rollups(cursor, after_id):
+    # Set-based alternative to the insert trigger for bulk loads: adds every entry with id > after_id
+    for table, period, period_expr in ROLLUP_TABLES:
+        cursor.execute(f'''
+            INSERT INTO {table} (user_id, project_id, category, {period}, hours, entries)
+            {rollup_source_query(period_expr, 'id > ?')}
+            ON CONFLICT (user_id, project_id, category, {period})
+            DO UPDATE SET hours = hours + excluded.hours, entries = entries + excluded.entries
+        ''', (after_id,))
+
+def verify_rollups(cursor, source='time_entries'):
+    # Returns {table: number of rollup keys that disagree with the raw time_entries}
+    mismatches = {}
+    for table, period, period_expr in ROLLUP_TABLES:
+        stored = f'SELECT user_id, project_id, category, {period}, hours, entries FROM {table}'
+        expected = rollup_source_query(period_expr, source=source)
+        cursor.execute(f'''
+            SELECT COUNT(*) FROM (
+                SELECT * FROM ({expected} EXCEPT {stored})
+                UNION ALL
+                SELECT * FROM ({stored} EXCEPT {expected})
+            )
+        ''')
+        mismatches[table] = cursor.fetchone()[0]
+    return mismatches
+
+def create_rollup_tables(cursor, tables=ROLLUP_TABLES, period_type='INTEGER'):
+    for table, period, _ in tables:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                user_id INTEGER NOT NULL,
+                project_id INTEGER NOT NULL,
+                category TEXT NOT NULL,
+                {period} {period_type} NOT NULL,
+                hours REAL NOT NULL,
+                entries INTEGER NOT NULL,
+                PRIMARY KEY (user_id, project_id, category, {period})
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_{period} ON {table} ({period}, project_id, user_id)')
+
+def migration_rollup_tables(cursor):
+    create_rollup_tables(cursor, TEXT_DATE_ROLLUP_TABLES, 'TEXT')
+    create_rollup_triggers(cursor, TEXT_DATE_ROLLUP_TABLES, TEXT_DATE_ROLLUP_UPDATE_COLUMNS)
+    rebuild_rollups(cursor, TEXT_DATE_ROLLUP_TABLES)
+
+def migration_sessions_index(cursor):
+    # Active session lookup and the expiry sweep both range over last_accessed
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_last_accessed ON sessions (last_accessed)')
+
+# ISO year * 100 + ISO week of a day number, from the Thursday of its week (which gives the ISO year)
+SQL_ISO_WEEK = """
+    (SELECT CAST(strftime('%Y', thursday * 86400, 'unixepoch') AS INTEGER) * 100
+            + (CAST(strftime('%j', thursday * 86400, 'unixepoch') AS INTEGER) - 1) / 7 + 1
+     FROM (SELECT {0} - (({0} + 3) % 7 + 7) % 7 + 3 AS thursday))
+"""
+
+def migration_integer_dates(cursor):
+    # Rebuilds time_entries with the TEXT date replaced by a day number and its ISO week.
+    # Dropping the old table drops its indexes and rollup triggers, which are recreated below.
+    cursor.execute('''
+        CREATE TABLE time_entries_new (
+            id INTEGER PRIMARY KEY,
+            project_id INTEGER,
+            user_id INTEGER,
+            day INTEGER,
+            iso_week INTEGER,
+            hours INTEGER,
+            category TEXT,
+            notes TEXT,
+            FOREIGN KEY (project_id) REFERENCES projects (id),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute(f'''
+        INSERT INTO time_entries_new (id, project_id, user_id, day, iso_week, hours, category, notes)
+        SELECT id, project_id, user_id, day, {SQL_ISO_WEEK.format('day')}, hours, category, notes
+        FROM (
+            SELECT *, CAST(julianday(date) - {EPOCH_JULIAN_DAY} AS INTEGER) AS day
+            FROM time_entries
+        )
+        ORDER BY id
+    ''')
+    cursor.execute('DROP TABLE time_entries')
+    cursor.execute('ALTER TABLE time_entries_new RENAME TO time_entries')
+
+    cursor.execute('CREATE INDEX idx_time_entries_date ON time_entries (day, project_id, user_id)')
+    cursor.execute('CREATE INDEX idx_time_entries_project_date ON time_entries (project_id, day, user_id)')
+    cursor.execute('CREATE INDEX idx_time_entries_user_date ON time_entries (user_id, day)')
+    cursor.execute('CREATE INDEX idx_time_entries_project_user ON time_entries (project_id, user_id)')
+
+    for table, _, _ in TEXT_DATE_ROLLUP_TABLES:
+        cursor.execute(f'DROP TABLE {table}')
+    create_rollup_tables(cursor)
+    create_rollup_triggers(cursor)
+    rebuild_rollups(cursor)
+
+def migration_rollup_user_indexes(cursor):
+    # Subtotals for a page of one user's entries (list_time_entries)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_totals_user_day ON daily_totals (user_id, day)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_weekly_totals_user_week ON weekly_totals (user_id, iso_week)')
+
+# Entries the full-text index is built over per transaction by backfill_search_index
+SEARCH_BACKFILL_BATCH = int(os.environ.get('TIME_TRACKER_SEARCH_BACKFILL_BATCH', 20000))
+# Entries that existed before the index, still waiting for backfill_search_index
+SEARCH_BACKFILL_PENDING = "{0}id BETWEEN (SELECT next_id FROM search_backfill) AND (SELECT end_id FROM search_backfill)"
+
+def create_search_triggers(cursor):
+    insert = "INSERT INTO time_entries_fts (rowid, notes, project_id, category) VALUES (new.id, new.notes, new.project_id, new.category);"
+    delete = ("INSERT INTO time_entries_fts (time_entries_fts, rowid, notes, project_id, category) "
+              "VALUES ('delete', old.id, old.notes, old.project_id, old.category);")
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS time_entries_search_insert AFTER INSERT ON time_entries
+        WHEN NOT ({SEARCH_BACKFILL_PENDING.format('new.')})
+        BEGIN {insert} END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS time_entries_search_delete AFTER DELETE ON time_entries
+        WHEN NOT ({SEARCH_BACKFILL_PENDING.format('old.')})
+        BEGIN {delete} END
+    ''')
+    # Only the notes are tokenized, so other updates leave the index as it is
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS time_entries_search_update AFTER UPDATE OF notes ON time_entries
+        WHEN NOT ({SEARCH_BACKFILL_PENDING.format('old.')})
+        BEGIN {delete} {insert} END
+    ''')
+
+def add_entries_to_search_index(cursor, after_id):
+    # Set-based alternative to the insert trigger for bulk loads: indexes every entry with
+    # id > after_id, except those the backfill is still going to reach
+    cursor.execute(f'''
+        INSERT INTO time_entries_fts (rowid, notes, project_id, category)
+        SELECT id, notes, project_id, category FROM time_entries
+        WHERE id > ? AND NOT ({SEARCH_BACKFILL_PENDING.format('')})
+    ''', (after_id,))
+
+def migration_search_index(cursor):
+    # FTS5 index over the notes. It is an external content table: the text stays in
+    # time_entries and only the tokens are stored. project_id and category are UNINDEXED
+    # columns, read from time_entries, for narrowing matches without a join. Two and three
+    # letter prefixes are indexed on their own, so short word* searches stay fast.
+    cursor.execute('''
+        CREATE VIRTUAL TABLE time_entries_fts USING fts5(
+            notes, project_id UNINDEXED, category UNINDEXED,
+            content='time_entries', content_rowid='id', prefix='2 3'
+        )
+    ''')
+    # Existing entries are indexed afterwards in batches (see backfill_search_index) instead of
+    # in this transaction; the triggers leave that id range alone until the backfill reaches it
+    cursor.execute('CREATE TABLE search_backfill (next_id INTEGER NOT NULL, end_id INTEGER NOT NULL)')
+    cursor.execute('INSERT INTO search_backfill SELECT IFNULL(MIN(id), 1), IFNULL(MAX(id), 0) FROM time_entries')
+
+    create_search_triggers(cursor)
+
+def backfill_search_index(database, batch_size=SEARCH_BACKFILL_BATCH):
+    # Indexes the entries that predate migration_search_index, one committed batch of ids at a
+    # time, so other connections can write in between. Safe to run from several processes.
+    cursor = database.cursor()
+    cursor.execute('SELECT end_id - next_id + 1 FROM search_backfill')
+    pending = cursor.fetchone()[0]
+    if pending <= 0:
+        return
+    print(f"Building the search index over up to {pending} time entries...", file=sys.stderr)
+    while True:
+        with database.transaction() as cursor:
+            cursor.execute('SELECT next_id, end_id FROM search_backfill')
+            next_id, end_id = cursor.fetchone()
+            if next_id > end_id:
+                return
+            last_id = min(next_id + batch_size - 1, end_id)
+            cursor.execute('''
+                INSERT INTO time_entries_fts (rowid, notes, project_id, category)
+                SELECT id, notes, project_id, category FROM time_entries WHERE id BETWEEN ? AND ?
+            ''', (next_id, last_id))
+            cursor.execute('UPDATE search_backfill SET next_id = ?', (last_id + 1,))
+
+def migration_entry_shards(cursor):
+    # Registry of the closed years moved out to shard files (see close_years)
+    shards.create_registry(cursor)
+
+# Tables whose changes are journaled for sync.py, with the columns an update has to change
+JOURNALED_TABLES = {
+    'projects': ['name'],
+    'users': ['username', 'password', 'first_name', 'last_name'],
+    'time_entries': ['project_id', 'user_id', 'day', 'hours', 'category', 'notes'],
+}
+
+def create_journal_triggers(cursor):
+    # Appends (table, row id, operation) to the change journal. Updates that leave every
+    # column as it was are not recorded, so applying a row back to where it came from ends there.
+    # A deleted row that came from another database keeps its name there in the journal, as its
+    # id here is free to be reused.
+    for table, columns in JOURNALED_TABLES.items():
+        record = "INSERT INTO changes (table_name, row_id, op) VALUES ('{0}', NEW.id, '{1}');"
+        changed = ' OR '.join(f'OLD.{column} IS NOT NEW.{column}' for column in columns)
+        received = f"FROM sync_ids WHERE table_name = '{table}' AND local_id = OLD.id"
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_journal_insert AFTER INSERT ON {table}
+            BEGIN {record.format(table, 'insert')} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_journal_update AFTER UPDATE ON {table} WHEN {changed}
+            BEGIN {record.format(table, 'update')} END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_journal_delete AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO changes (table_name, row_id, op, origin, origin_id)
+                VALUES ('{table}', OLD.id, 'delete', (SELECT origin {received}), (SELECT origin_id {received}));
+                DELETE {received};
+            END
+        ''')
+
+def add_entries_to_journal(cursor, after_id):
+    # Set-based alternative to the journal's insert trigger for bulk loads
+    cursor.execute('''
+        INSERT INTO changes (table_name, row_id, op)
+        SELECT 'time_entries', id, 'insert' FROM time_entries WHERE id > ? ORDER BY id
+    ''', (after_id,))
+
+def migration_change_journal(cursor):
+    # Append-only change journal for sync.py. AUTOINCREMENT keeps sequence numbers increasing
+    # even after the newest changes are removed, so a watermark never points at reused numbers.
+    # Rows that existed before the journal are sent by the first, full export.
+    cursor.execute('''
+        CREATE TABLE changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER NOT NULL,
+            op TEXT NOT NULL,
+            origin TEXT,
+            origin_id INTEGER
+        )
+    ''')
+    # Latest change of a row, for exporting only its final state
+    cursor.execute('CREATE INDEX idx_changes_row ON changes (table_name, row_id, seq)')
+    # Random id of this database, which together with a row id names the row in every copy
+    cursor.execute('CREATE TABLE sync_origin (origin TEXT NOT NULL)')
+    cursor.execute("INSERT INTO sync_origin VALUES (lower(hex(randomblob(16))))")
+    # Rows received from other databases: their (origin, id) there and the id they have here
+    cursor.execute('''
+        CREATE TABLE sync_ids (
+            origin TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            origin_id INTEGER NOT NULL,
+            local_id INTEGER NOT NULL,
+            PRIMARY KEY (origin, table_name, origin_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX idx_sync_ids_local ON sync_ids (table_name, local_id)')
+    # Last change applied from each other database
+    cursor.execute('CREATE TABLE sync_watermarks (origin TEXT PRIMARY KEY, seq INTEGER NOT NULL)')
+    create_journal_triggers(cursor)
+
+# Ordered schema upgrades. PRAGMA user_version stores how many of them have been applied,
+# so only append new steps at the end and never reorder or edit released ones.
+MIGRATIONS = [
+    migration_base_tables,
+    migration_report_indexes,
+    migration_project_users_index,
+    migration_rollup_tables,
+    migration_sessions_index,
+    migration_integer_dates,
+    migration_rollup_user_indexes,
+    migration_search_index,
+    migration_entry_shards,
+    migration_change_journal,
+]
+
+def get_schema_version(cursor):
+    cursor.execute('PRAGMA user_version')
+    return cursor.fetchone()[0]
+
+def migrate(database):
+    # Checked on a read connection first, so opening an up-to-date database runs no DDL
+    # and never takes the write lock
+    if get_schema_version(database.cursor()) != len(MIGRATIONS):
+        with database.write_lock:
+            while True:
+                # Each step and its version bump are committed together
+                with database.transaction() as cursor:
+                    version = get_schema_version(cursor)
+                    if version > len(MIGRATIONS):
+                        raise RuntimeError(f"Database schema version {version} is newer than this program supports ({len(MIGRATIONS)})")
+                    if version == len(MIGRATIONS):
+                        break
+                    MIGRATIONS[version](cursor)
+                    cursor.execute(f'PRAGMA user_version = {version + 1}')
+    # Picks up where an interrupted backfill stopped
+    backfill_search_index(database)
 
 def get_key():
-    if os.name == 'nt':
+    # Para captura de teclas sin Enter. The terminal modules are only needed once
+    # interactive mode reads a key, so they are imported here rather than at startup.
+    if os.name == 'nt':  # Para Windows
+        import msvcrt
         return msvcrt.getch().decode('utf-8')
-    else:
+    else:  # Para sistemas Unix
+        import tty
+        import termios
         fd = sys.stdin.fileno()
         old_settings = termios.tcgetattr(fd)
         try:
@@ -78,42 +499,24 @@ def get_key():
         return ch
 
 def clear_console():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    # ANSI escape sequence instead of spawning a 'clear' process for every screen
+    clear_screen()
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
 
 def create_session(user_id):
-    session_id = str(uuid.uuid4())
-    now = datetime.now().isoformat()
-    cursor.execute('''
-        INSERT INTO sessions (id, user_id, created_at, last_accessed)
-        VALUES (?, ?, ?, ?)
-    ''', (session_id, user_id, now, now))
-    conn.commit()
-    return session_id
+    return run_unit(sessions.creation(user_id))
 
 def get_active_session():
-    cursor.execute('''
-        SELECT id, user_id, created_at, last_accessed
-        FROM sessions
-        ORDER BY last_accessed DESC
-        LIMIT 1
-    ''')
-    return cursor.fetchone()
+    return sessions.get_active()
 
 def update_session_access(session_id):
-    now = datetime.now().isoformat()
-    cursor.execute('''
-        UPDATE sessions
-        SET last_accessed = ?
-        WHERE id = ?
-    ''', (now, session_id))
-    conn.commit()
+    # Only updates memory; the session store writes it back in batches
+    sessions.touch(session_id)
 
 def delete_session(session_id):
-    cursor.execute('DELETE FROM sessions WHERE id = ?', (session_id,))
-    conn.commit()
+    sessions.delete(session_id)
 
 def logout(session_id):
     delete_session(session_id)
@@ -122,6 +525,21 @@ def logout(session_id):
 # Predefined categories
 CATEGORIES = ["Programming", "Project Management", "Business Development", "Design", "Marketing"]
 
+def user_insert(username, password, first_name, last_name):
+    password_hash = hash_password(password)
+
+    def work(cursor):
+        cursor.execute('''
+            INSERT INTO users (username, password, first_name, last_name)
+            VALUES (?, ?, ?, ?)
+        ''', (username, password_hash, first_name, last_name))
+        return cursor.lastrowid
+
+    return work, lambda user_id: dimensions.invalidate()
+
+def add_user(username, password, first_name, last_name):
+    return run_unit(user_insert(username, password, first_name, last_name))
+
 def create_account():
     clear_console()
     print("Create a new account")
@@ -130,33 +548,29 @@ def create_account():
     first_name = input("Enter first name: ")
     last_name = input("Enter last name: ")
 
-    hashed_password = hash_password(password)
-
     try:
-        cursor.execute('''
-            INSERT INTO users (username, password, first_name, last_name)
-            VALUES (?, ?, ?, ?)
-        ''', (username, hashed_password, first_name, last_name))
-        conn.commit()
+        add_user(username, password, first_name, last_name)
         print("Account created successfully!")
     except sqlite3.IntegrityError:
         print("Username already exists. Please choose a different username.")
     input("Press Enter to continue...")
 
+def authenticate(username, password):
+    # (id, first_name, last_name) of the user, or None when the credentials do not match
+    cursor = db.cursor()
+    cursor.execute('''
+        SELECT id, first_name, last_name FROM users
+        WHERE username = ? AND password = ?
+    ''', (username, hash_password(password)))
+    return cursor.fetchone()
+
 def login():
     clear_console()
     print("Login")
     username = input("Enter username: ")
     password = input("Enter password: ")
 
-    hashed_password = hash_password(password)
-
-    cursor.execute('''
-        SELECT id, first_name, last_name FROM users
-        WHERE username = ? AND password = ?
-    ''', (username, hashed_password))
-    user = cursor.fetchone()
-
+    user = authenticate(username, password)
     if user:
         print(f"Welcome, {user[1]} {user[2]}!")
         session_id = create_session(user[0])
@@ -231,16 +645,70 @@ def select_category():
         except ValueError:
             print("Please enter a number.")
 
+def project_insert(name):
+    def work(cursor):
+        cursor.execute("INSERT INTO projects (name) VALUES (?)", (name,))
+        return cursor.lastrowid
+
+    return work, lambda project_id: dimensions.invalidate()
+
+def add_project(name):
+    return run_unit(project_insert(name))
+
+def project_rename(project_id, new_name):
+    def work(cursor):
+        cursor.execute("UPDATE projects SET name = ? WHERE id = ?", (new_name, project_id))
+
+    def after(result):
+        dimensions.invalidate()
+        report_cache.invalidate(project_id=project_id)
+
+    return work, after
+
+def rename_project(project_id, new_name):
+    run_unit(project_rename(project_id, new_name))
+
+def get_projects():
+    # (id, name) of every project, from the dimension cache
+    return list(dimensions.projects().items())
+
+def get_users():
+    cursor = db.cursor()
+    cursor.execute("SELECT id, username, first_name, last_name FROM users ORDER BY id")
+    return cursor.fetchall()
+
+# Entry queries read only time_entries columns, (id, project_id, day, hours, category, notes,
+# user_id, ...), and the names are filled in from the dimension cache instead of joining every
+# row to projects and users
+ENTRY_COLUMNS = '''time_entries.id, time_entries.project_id, time_entries.day, time_entries.hours,
+                   time_entries.category, time_entries.notes, time_entries.user_id'''
+
+def report_rows(rows, projects, users):
+    # (id, project_id, day, hours, category, notes, project name, first name, last name, ...)
+    return [row[:6] + (projects[row[1]],) + users[row[6]] + row[7:] for row in rows]
+
+def listing_rows(rows, projects, users):
+    # (id, project name, day, hours, category, notes, first name, last name, ...)
+    return [(row[0], projects[row[1]]) + row[2:6] + users[row[6]] + row[7:] for row in rows]
+
+def add_names(rows, shape=report_rows):
+    # A row with a project or user missing from the cache is looked up again after reloading it,
+    # and left out if it is still missing, as the joins would have done. Called per batch: the
+    # operation runs dimensions.check() once before its first batch.
+    try:
+        return shape(rows, *dimensions.get())
+    except KeyError:
+        projects, users = dimensions.reload()
+        return shape([row for row in rows if row[1] in projects and row[6] in users], projects, users)
+
 def create_project():
     clear_console()
     name = input("Enter project name: ")
-    cursor.execute("INSERT INTO projects (name) VALUES (?)", (name,))
-    conn.commit()
+    add_project(name)
     print(f"Project '{name}' created successfully.")
 
 def list_projects():
-    cursor.execute("SELECT * FROM projects")
-    projects = cursor.fetchall()
+    projects = get_projects()
     if not projects:
         print("No projects found.")
     else:
@@ -252,11 +720,87 @@ def update_project():
     list_projects()
     project_id = int(input("\nEnter the ID of the project to update: "))
     new_name = input("Enter the new project name: ")
-    cursor.execute("UPDATE projects SET name = ? WHERE id = ?", (new_name, project_id))
-    conn.commit()
+    rename_project(project_id, new_name)
     print(f"Project updated successfully.")
     input("Press Enter to continue...")
 
+# Report cache invalidation happens after the commit, so a report loaded in between is never kept.
+# Only the main file is written: changes dated in a closed year raise shards.ClosedYearError.
+
+# Next entry id, above those moved out to closed years as well
+NEXT_ENTRY_ID = "(SELECT MAX(IFNULL(MAX(id), 0), (SELECT IFNULL(MAX(last_id), 0) FROM entry_shards)) + 1 FROM time_entries)"
+
+INSERT_TIME_ENTRY = f'''
+    INSERT INTO time_entries (id, project_id, user_id, day, iso_week, hours, category, notes)
+    VALUES ({NEXT_ENTRY_ID}, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+def time_entry_insert(project_id, user_id, entry_date, hours, category, notes):
+    # Results in the new entry's id
+    day = day_number(entry_date)
+
+    def work(cursor):
+        shards.check_open(db.attached, day)
+        cursor.execute(INSERT_TIME_ENTRY, (project_id, user_id, day, iso_week_number(entry_date), hours, category, notes))
+        return cursor.lastrowid
+
+    return work, lambda entry_id: report_cache.invalidate(day, project_id, user_id)
+
+def add_time_entry(project_id, user_id, entry_date, hours, category, notes):
+    return run_unit(time_entry_insert(project_id, user_id, entry_date, hours, category, notes))
+
+def get_entry_scope(cursor, entry_id):
+    # (day, project_id, user_id) of an entry, for invalidating the reports that include it.
+    # Entries of closed years are looked up too, so changing one fails instead of doing nothing.
+    row = None
+    for partition in shards.partitions(db.attached):
+        cursor.execute(f"SELECT day, project_id, user_id FROM {shards.table(partition.schema)} WHERE id = ?", (entry_id,))
+        row = cursor.fetchone()
+        if row:
+            shards.check_open(db.attached, row[0])
+            break
+    return row
+
+def time_entry_update(entry_id, new_date, hours, category, notes):
+    # Results in the entry's scope before the change, None when there is no such entry
+    day = day_number(new_date)
+
+    def work(cursor):
+        shards.check_open(db.attached, day)
+        old = get_entry_scope(cursor, entry_id)
+        cursor.execute('''
+            UPDATE time_entries 
+            SET day = ?, iso_week = ?, hours = ?, category = ?, notes = ?
+            WHERE id = ?
+        ''', (day, iso_week_number(new_date), hours, category, notes, entry_id))
+        return old
+
+    def after(old):
+        if old:
+            report_cache.invalidate(*old)
+            report_cache.invalidate(day, old[1], old[2])
+
+    return work, after
+
+def edit_time_entry(entry_id, new_date, hours, category, notes):
+    run_unit(time_entry_update(entry_id, new_date, hours, category, notes))
+
+def time_entry_delete(entry_id):
+    # Results in the deleted entry's scope, None when there was no such entry
+    def work(cursor):
+        old = get_entry_scope(cursor, entry_id)
+        cursor.execute("DELETE FROM time_entries WHERE id = ?", (entry_id,))
+        return old
+
+    def after(old):
+        if old:
+            report_cache.invalidate(*old)
+
+    return work, after
+
+def remove_time_entry(entry_id):
+    run_unit(time_entry_delete(entry_id))
+
 def create_time_entry(user_id):
     clear_console()
     list_projects()
@@ -267,16 +811,16 @@ def create_time_entry(user_id):
     category = select_category()
     notes = input("Enter any notes (if any): ")
 
-    cursor.execute('''
-        INSERT INTO time_entries (project_id, user_id, date, hours, category, notes)
-        VALUES (?, ?, ?, ?, ?, ?)
-    ''', (project_id, user_id, entry_date.strftime("%Y-%m-%d"), hours, category, notes))
-    conn.commit()
+    try:
+        add_time_entry(project_id, user_id, entry_date, hours, category, notes)
+    except shards.ClosedYearError as error:
+        print(error)
+        return
     print("Time entry created successfully.")
 
-def update_time_entry():
+def update_time_entry(user_id):
     clear_console()
-    list_time_entries()
+    list_time_entries(user_id)
     entry_id = int(input("Enter the ID of the time entry to update: "))
     print("Enter the new date for the time entry:")
     new_date = input_date()
@@ -284,67 +828,172 @@ def update_time_entry():
     category = select_category()
     notes = input("Enter the new notes: ")
 
-    cursor.execute('''
-        UPDATE time_entries 
-        SET date = ?, hours = ?, category = ?, notes = ?
-        WHERE id = ?
-    ''', (new_date.strftime("%Y-%m-%d"), hours, category, notes, entry_id))
-    conn.commit()
+    try:
+        edit_time_entry(entry_id, new_date, hours, category, notes)
+    except shards.ClosedYearError as error:
+        print(error)
+        return
     print("Time entry updated successfully.")
 
-def list_time_entries(user_id):
-    clear_console()
-    cursor.execute('''
-        SELECT time_entries.id, projects.name, time_entries.date, time_entries.hours, time_entries.category, time_entries.notes, users.first_name, users.last_name
-        FROM time_entries 
-        JOIN projects ON time_entries.project_id = projects.id
-        JOIN users ON time_entries.user_id = users.id
+def build_list_time_entries_query(schema='main'):
+    return f'''
+        SELECT {ENTRY_COLUMNS}
+        FROM {shards.table(schema)}
         WHERE time_entries.user_id = ?
-        ORDER BY time_entries.date DESC, time_entries.id DESC
-    ''', (user_id,))
-    entries = cursor.fetchall()
-    
-    if not entries:
-        print("No time entries found.")
-        return
+        ORDER BY time_entries.day DESC, time_entries.id DESC
+    '''
 
-    current_date = None
-    current_week_start = None
-    daily_total = 0
-    weekly_total = 0
+LIST_TIME_ENTRIES_QUERY = build_list_time_entries_query()
+
+def get_time_entries(user_id):
+    cursor = db.cursor()
+    dimensions.check()
+    entries = []
+    for partition in shards.partitions(db.attached):
+        cursor.execute(build_list_time_entries_query(partition.schema), (user_id,))
+        entries.extend(add_names(cursor.fetchall(), listing_rows))
+    return entries
+
+# Entries per screen in list_time_entries
+TIME_ENTRIES_PAGE_SIZE = int(os.environ.get('TIME_TRACKER_PAGE_SIZE', 20))
+
+def build_time_entries_page_query(newer, schema='main'):
+    # Keyset pagination on (day, id), which idx_time_entries_user_date (user_id, day) plus the
+    # rowid serves directly: a page costs the same however much history precedes it.
+    # Newer pages are read in ascending order from the cursor and reversed by the caller.
+    comparison, order = ('>', 'ASC') if newer else ('<', 'DESC')
+    return f'''
+        SELECT {ENTRY_COLUMNS}, time_entries.iso_week
+        FROM {shards.table(schema)}
+        WHERE time_entries.user_id = ? AND (time_entries.day, time_entries.id) {comparison} (?, ?)
+        ORDER BY time_entries.day {order}, time_entries.id {order}
+        LIMIT ?
+    '''
 
+OLDER_PAGE_QUERY = build_time_entries_page_query(newer=False)
+NEWER_PAGE_QUERY = build_time_entries_page_query(newer=True)
+
+# Full daily and weekly totals for the days and weeks on a page, from the rollup tables
+PAGE_DAILY_TOTALS_QUERY = '''
+    SELECT day, SUM(hours), SUM(entries) FROM daily_totals
+    WHERE user_id = ? AND day BETWEEN ? AND ?
+    GROUP BY day
+'''
+PAGE_WEEKLY_TOTALS_QUERY = '''
+    SELECT iso_week, SUM(hours) FROM weekly_totals
+    WHERE user_id = ? AND iso_week BETWEEN ? AND ?
+    GROUP BY iso_week
+'''
+
+# Keyset positions beyond any real (day, id), for the first page in either direction
+NEWEST_KEY = (2 ** 62, 0)
+OLDEST_KEY = (-2 ** 62, 0)
+
+def get_time_entries_page(user_id, before=NEWEST_KEY, after=None, page_size=TIME_ENTRIES_PAGE_SIZE):
+    # One page of a user's entries, newest first: the page_size entries older than the
+    # (day, id) key before, or newer than after when given.
+    # Returns (entries, more), where more tells whether further entries exist in that direction.
+    # Partitions are read from the key onwards until the page is full.
+    cursor = db.cursor()
+    dimensions.check()
+    newer = after is not None
+    if newer:
+        key = after
+        partitions = reversed(shards.partitions(db.attached, first_day=after[0]))
+    else:
+        key = before
+        partitions = shards.partitions(db.attached, last_day=before[0])
+    entries = []
+    for partition in partitions:
+        cursor.execute(build_time_entries_page_query(newer, partition.schema), (user_id, *key, page_size + 1 - len(entries)))
+        entries.extend(add_names(cursor.fetchall(), listing_rows))
+        if len(entries) > page_size:
+            break
+    more = len(entries) > page_size
+    entries = entries[:page_size]
+    return (entries[::-1] if newer else entries), more
+
+def get_page_totals(user_id, entries):
+    # ({day: (hours, entries)}, {iso_week: hours}) for the days and weeks the page touches,
+    # so subtotals cover entries on neighbouring pages too
+    cursor = db.cursor()
+    newest, oldest = entries[0], entries[-1]
+    cursor.execute(PAGE_DAILY_TOTALS_QUERY, (user_id, oldest[2], newest[2]))
+    daily = {day: (hours, count) for day, hours, count in cursor.fetchall()}
+    cursor.execute(PAGE_WEEKLY_TOTALS_QUERY, (user_id, oldest[8], newest[8]))
+    weekly = dict(cursor.fetchall())
+    return daily, weekly
+
+def format_time_entries_page(entries, daily, weekly):
+    lines = []
+    line = lines.append
+    shown = {}
     for entry in entries:
-        entry_date = datetime.strptime(entry[2], "%Y-%m-%d").date()
-        
-        # Check if it's a new date
-        if entry_date != current_date:
-            if current_date:
-                print(f"Daily total: {daily_total} hours")
-            
-            # Check if it's a new week
-            if not current_week_start or entry_date < current_week_start:
-                if current_week_start:
-                    print(f"Weekly total: {weekly_total} hours\n")
-                current_week_start = entry_date - timedelta(days=entry_date.weekday())
-                weekly_total = 0
-            
-            print(f"\nDate: {entry_date.strftime('%Y-%m-%d')} ({entry_date.strftime('%A')})")
-            current_date = entry_date
-            daily_total = 0
-
-        print(f"ID: {entry[0]}, Project: {entry[1]}, Hours: {entry[3]}, Category: {entry[4]}, Notes: {entry[5]}")
-        print(f"User: {entry[6]} {entry[7]}")
-        
-        daily_total += entry[3]
-        weekly_total += entry[3]
+        shown[entry[2]] = shown.get(entry[2], 0) + 1
+
+    for i, entry in enumerate(entries):
+        day, iso_week = entry[2], entry[8]
+        if i == 0 or day != entries[i - 1][2]:
+            line(f"\nDate: {day_label(day)} ({day_name(day)})")
+
+        line(f"ID: {entry[0]}, Project: {entry[1]}, Hours: {entry[3]}, Category: {entry[4]}, Notes: {entry[5]}")
+        line(f"User: {entry[6]} {entry[7]}")
+
+        last_of_day = i == len(entries) - 1 or entries[i + 1][2] != day
+        if last_of_day:
+            hours, count = daily.get(day, (0, 0))
+            partial = f" ({shown[day]} of {count} entries on this page)" if count > shown[day] else ""
+            line(f"Daily total: {hours:g} hours{partial}")
+        if i == len(entries) - 1 or entries[i + 1][8] != iso_week:
+            line(f"Weekly total: {weekly.get(iso_week, 0):g} hours")
+    return lines
+
+def list_time_entries(user_id, page_size=TIME_ENTRIES_PAGE_SIZE):
+    # Pages through the user's entries, newest first, until they are done browsing
+    entries, has_older = get_time_entries_page(user_id, page_size=page_size)
+    if not entries:
+        clear_console()
+        print("No time entries found.")
+        return
 
-    if current_date:
-        print(f"Daily total: {daily_total} hours")
-        print(f"Weekly total: {weekly_total} hours")
+    has_newer = False
+    page = 1
+    while True:
+        daily, weekly = get_page_totals(user_id, entries)
+        options = []
+        if has_newer:
+            options.append("[p] Previous page")
+        if has_older:
+            options.append("[n] Next page")
+        options.append("[q] Done")
+        draw_screen([
+            f"Time entries, page {page}",
+            *format_time_entries_page(entries, daily, weekly),
+            "",
+            "  ".join(options),
+        ])
+
+        choice = get_key().lower()
+        if choice == 'n' and has_older:
+            older, more = get_time_entries_page(user_id, before=(entries[-1][2], entries[-1][0]), page_size=page_size)
+            if older:
+                entries, has_older, has_newer = older, more, True
+                page += 1
+            else:
+                has_older = False
+        elif choice == 'p' and has_newer:
+            newer, more = get_time_entries_page(user_id, after=(entries[0][2], entries[0][0]), page_size=page_size)
+            if newer:
+                entries, has_newer, has_older = newer, more, True
+                page -= 1
+            else:
+                has_newer = False
+        elif choice in ('q', '\r', '\n'):
+            return
 
-def delete_time_entry():
+def delete_time_entry(user_id):
     clear_console()
-    list_time_entries()
+    list_time_entries(user_id)
     entry_id = int(input("Enter the ID of the time entry to delete: "))
     print(f"Are you sure you want to delete this time entry? This action cannot be undone.")
     print("1. Yes")
@@ -353,8 +1002,11 @@ def delete_time_entry():
     while True:
         choice = get_key()
         if choice == '1':
-            cursor.execute("DELETE FROM time_entries WHERE id = ?", (entry_id,))
-            conn.commit()
+            try:
+                remove_time_entry(entry_id)
+            except shards.ClosedYearError as error:
+                print(error)
+                break
             print("Time entry deleted successfully.")
             break
         elif choice == '2':
@@ -408,18 +1060,38 @@ def select_specific_users(project_id):
     
     return selected_users
 
+def build_project_users_query(project_id, schemas=('main',)):
+    # Users with an entry in any of the partitions: one index probe per user and partition,
+    # however many entries there are
+    condition = '' if project_id == 0 else ' AND time_entries.project_id = ?'
+    exists = ' OR '.join(
+        f"EXISTS (SELECT 1 FROM {shards.table(schema)} WHERE time_entries.user_id = users.id{condition})"
+        for schema in schemas
+    )
+    return f"SELECT users.id, users.first_name, users.last_name FROM users WHERE {exists}", [] if project_id == 0 else [project_id] * len(schemas)
+
 def get_project_users(project_id):
-    if project_id == 0:
-        cursor.execute("SELECT DISTINCT users.id, users.first_name, users.last_name FROM users JOIN time_entries ON users.id = time_entries.user_id")
-    else:
-        cursor.execute("""
-            SELECT DISTINCT users.id, users.first_name, users.last_name 
-            FROM users 
-            JOIN time_entries ON users.id = time_entries.user_id 
-            WHERE time_entries.project_id = ?
-        """, (project_id,))
+    cursor = db.cursor()
+    schemas = [partition.schema for partition in shards.partitions(db.attached)]
+    cursor.execute(*build_project_users_query(project_id, schemas))
     return cursor.fetchall()
 
+# Menu option -> preset name
+PRESET_DATE_RANGES = {'1': 'this-month', '2': 'last-month', '3': 'this-year'}
+
+def preset_date_range(name, today=None):
+    today = today or date.today()
+    if name == 'this-month':
+        return today.replace(day=1), today
+    elif name == 'last-month':
+        last_month = today.replace(day=1) - timedelta(days=1)
+        return last_month.replace(day=1), last_month
+    elif name == 'this-year':
+        return today.replace(month=1, day=1), today
+    elif name == 'all-time':
+        return date.min, date.max
+    raise ValueError(f"Unknown date range: {name}")
+
 def get_date_range():
     print("\nSelect a date range for the report:")
     print("1. This month")
@@ -435,14 +1107,8 @@ def get_date_range():
         else:
             print("Invalid choice. Please select 1, 2, 3, or 4.")
     
-    today = date.today()
-    if choice == '1':
-        return today.replace(day=1), today
-    elif choice == '2':
-        last_month = today.replace(day=1) - timedelta(days=1)
-        return last_month.replace(day=1), last_month
-    elif choice == '3':
-        return today.replace(month=1, day=1), today
+    if choice in PRESET_DATE_RANGES:
+        return preset_date_range(PRESET_DATE_RANGES[choice])
     elif choice == '4':
         print("Enter the start date for the report:")
         start_date = input_date()
@@ -450,116 +1116,496 @@ def get_date_range():
         end_date = input_date()
         return start_date, end_date
 
-def get_report_data(project_id, user_choice, selected_users, date_range):
+def build_report_filters(project_id, user_choice, selected_users, date_range, table='time_entries'):
+    # WHERE clause and parameters shared by every report query over time_entries or daily_totals
     start_date, end_date = date_range
-    query = '''
-        SELECT time_entries.id, time_entries.project_id, time_entries.date, time_entries.hours, 
-               time_entries.category, time_entries.notes, projects.name as project_name, 
-               users.first_name, users.last_name
-        FROM time_entries
-        JOIN projects ON time_entries.project_id = projects.id
-        JOIN users ON time_entries.user_id = users.id
-        WHERE time_entries.date BETWEEN ? AND ?
-    '''
-    params = [start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")]
+    where = f'{table}.day BETWEEN ? AND ?'
+    params = [day_number(start_date), day_number(end_date)]
 
     if project_id != 0:
-        query += ' AND time_entries.project_id = ?'
+        where += f' AND {table}.project_id = ?'
         params.append(project_id)
 
     if user_choice in ['1', '3'] and selected_users:
         placeholders = ', '.join('?' * len(selected_users))
-        query += f' AND time_entries.user_id IN ({placeholders})'
+        where += f' AND {table}.user_id IN ({placeholders})'
         params.extend(selected_users)
 
-    query += ' ORDER BY time_entries.date DESC, time_entries.id DESC'
+    return where, params
 
-    cursor.execute(query, params)
-    return cursor.fetchall()
+def build_report_query(project_id, user_choice, selected_users, date_range, schema='main'):
+    # Over one partition of time_entries (see shards.py)
+    where, params = build_report_filters(project_id, user_choice, selected_users, date_range)
+    query = f'''
+        SELECT {ENTRY_COLUMNS}
+        FROM {shards.table(schema)}
+        WHERE {where}
+        ORDER BY time_entries.day DESC, time_entries.id DESC
+    '''
+    return query, params
 
-def print_report(entries, project_id, date_range):
+# Rows pulled from the report cursor per fetchmany() call
+REPORT_BATCH_SIZE = 1000
+
+def report_cache_key(project_id, user_choice, selected_users, date_range):
+    # Same filters as build_report_filters, normalized so equal reports share an entry
     start_date, end_date = date_range
-    total_hours = sum(float(entry[3]) for entry in entries)
+    users = tuple(sorted(set(selected_users))) if user_choice in ['1', '3'] and selected_users else None
+    return project_id, users, day_number(start_date), day_number(end_date)
 
-    print(f"\nReport for {'all projects' if project_id == 0 else f'Project ID {project_id}'} from {start_date} to {end_date}")
-    print(f"Total Hours: {total_hours:.2f}")
-    
-    current_date = None
-    current_week_start = None
-    daily_total = 0
-    weekly_total = 0
+def date_partitions(date_range):
+    # Partitions of time_entries holding days in the range, newest first. Call after
+    # db.cursor(), which attaches the closed years.
+    start_date, end_date = date_range
+    return shards.partitions(db.attached, day_number(start_date), day_number(end_date))
+
+def fetch_report_rows(project_id, user_choice, selected_users, date_range, batch_size=REPORT_BATCH_SIZE):
+    # Uses its own cursor so other queries can run while the report is being consumed.
+    # Only the partitions the date range reaches are read, newest first, which keeps the rows
+    # in the report's day order.
+    report_cursor = db.cursor()
+    dimensions.check()
+    try:
+        for partition in date_partitions(date_range):
+            report_cursor.execute(*build_report_query(project_id, user_choice, selected_users, date_range, partition.schema))
+            while True:
+                rows = report_cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from add_names(rows)
+    finally:
+        report_cursor.close()
+
+@profiled('get_report_data')
+def get_report_data(project_id, user_choice, selected_users, date_range):
+    # Served from the report cache when possible; the returned list is shared, do not modify it
+    key = report_cache_key(project_id, user_choice, selected_users, date_range)
+    return report_cache.load(key, lambda: list(fetch_report_rows(project_id, user_choice, selected_users, date_range)))
+
+def iter_report_data(project_id, user_choice, selected_users, date_range, batch_size=REPORT_BATCH_SIZE):
+    # Same rows as get_report_data, pulled in batches so memory stays flat however large the report is.
+    # Reports that fit in the cache are kept on the way through.
+    key = report_cache_key(project_id, user_choice, selected_users, date_range)
+    return report_cache.stream(key, fetch_report_rows(project_id, user_choice, selected_users, date_range, batch_size))
+
+def get_project_name(project_id):
+    return dimensions.projects().get(project_id)
+
+REPORT_ROW_FORMAT = "{:3} | {:7} | {:5.2f} | {:22} | {:20} | {}"
+REPORT_RULE = "-" * 100
+
+class ReportPrinter:
+    # Prints report rows as they arrive, keeping daily, weekly and grand totals in one pass.
+    # Lines are formatted into a Screen buffer and written in large chunks.
+
+    def __init__(self, project_id, date_range, stream=None):
+        self.project_id = project_id
+        self.date_range = date_range
+        self.screen = Screen(stream)
+        self.current_day = None
+        self.current_week_start = None
+        self.daily_total = 0
+        self.weekly_total = 0
+        self.total_hours = 0
+
+    def start(self):
+        start_date, end_date = self.date_range
+        line = self.screen.line
+        line(f"\nReport for {'all projects' if self.project_id == 0 else f'Project ID {self.project_id}'} from {start_date} to {end_date}")
+
+        # Imprimir encabezados de columnas
+        line("\n{:3} | {:7} | {:5} | {:22} | {:20} | {}".format("ID", "Project", "Hours", "Category", "User", "Notes"))
+        line(REPORT_RULE)
+
+    def add(self, entry):
+        line = self.screen.line
+        day = entry[2]
+        if day != self.current_day:
+            if self.current_day is not None:
+                line("Daily total: {:.2f} hours".format(self.daily_total))
+
+            if self.current_week_start is None or day < self.current_week_start:
+                if self.current_week_start is not None:
+                    line("Weekly total: {:.2f} hours\n".format(self.weekly_total))
+                self.current_week_start = week_start(day)
+                self.weekly_total = 0
+
+            line("\nDate: {} ({})".format(day_label(day), day_name(day)))
+            line(REPORT_RULE)
+            self.current_day = day
+            self.daily_total = 0
+
+        hours = float(entry[3])
+        # Imprimir toda la información en una sola línea con espaciado consistente
+        line(REPORT_ROW_FORMAT.format(entry[0], entry[6], hours, entry[4], f"{entry[7]} {entry[8]}", entry[5]))
+
+        self.daily_total += hours
+        self.weekly_total += hours
+        self.total_hours += hours
+
+    def finish(self):
+        line = self.screen.line
+        if self.current_day is not None:
+            line("Daily total: {:.2f} hours".format(self.daily_total))
+            line("Weekly total: {:.2f} hours".format(self.weekly_total))
+        line(f"\nTotal Hours: {self.total_hours:.2f}")
+        self.screen.flush()
+
+@profiled('run_report')
+def run_report(entries, sinks):
+    # Feeds every row to every sink in a single pass over the stream. Every sink that started is
+    # finished, so its file is closed, even when the rows or another sink fail; the first error
+    # is raised once they all are.
+    started = []
+    error = None
+    try:
+        for sink in sinks:
+            sink.start()
+            started.append(sink)
+        for entry in entries:
+            for sink in sinks:
+                sink.add(entry)
+    except BaseException as failure:
+        error = failure
+        # Rows not read to the end: release their cursor now rather than when collected
+        if hasattr(entries, 'close'):
+            entries.close()
+    for sink in started:
+        try:
+            sink.finish()
+        except Exception as failure:
+            error = error or failure
+    if error is not None:
+        raise error
+
+@profiled('print_report')
+def print_report(entries, project_id, date_range, stream=None):
+    run_report(entries, [ReportPrinter(project_id, date_range, stream)])
+
+@profiled('export_report')
+def export_report(entries, exporter):
+    run_report(entries, [exporter])
+
+def report_filename(project_id, extension='csv'):
+    project_name = "All_Projects" if project_id == 0 else (get_project_name(project_id) or f"Project_{project_id}").replace(" ", "_")
+    return f"{project_name}_{date.today().strftime('%Y%m%d')}.{extension}"
+
+def ask_export(project_id):
+    # Returns an exporter for the chosen format, or None when the report is not exported
+    print("\nDo you want to export this report? (y/N)")
+    export_choice = get_key().lower()
+    print(f"Selected option: {'Yes' if export_choice == 'y' else 'No'}")
+    if export_choice != 'y':
+        return None
 
-    # Imprimir encabezados de columnas
-    print("\n{:3} | {:7} | {:5} | {:22} | {:20} | {}".format("ID", "Project", "Hours", "Category", "User", "Notes"))
-    print("-" * 100)
+    formats = list(EXPORT_FORMATS)
+    print("\nSelect the export format:")
+    for i, export_format in enumerate(formats, 1):
+        print(f"{i}. {export_format}")
+    while True:
+        choice = get_key()
+        if choice.isdigit() and 1 <= int(choice) <= len(formats):
+            export_format = formats[int(choice) - 1]
+            print(f"Selected: {export_format}")
+            break
+        print("Invalid choice. Please try again.")
+
+    return create_exporter(export_format, report_filename(project_id, EXPORT_FORMATS[export_format].extension))
+
+@profiled('get_summary_data')
+def get_summary_data(project_id, user_choice, selected_users, date_range):
+    # Daily totals read from the rollup table: cost grows with the number of days, not entries
+    where, params = build_report_filters(project_id, user_choice, selected_users, date_range, 'daily_totals')
+    query = f'''
+        SELECT day, SUM(hours), SUM(entries)
+        FROM daily_totals
+        WHERE {where}
+        GROUP BY day
+        ORDER BY day DESC
+    '''
 
-    for entry in entries:
-        entry_date = datetime.strptime(entry[2], "%Y-%m-%d").date()
-        
-        if entry_date != current_date:
-            if current_date:
-                print("Daily total: {:.2f} hours".format(daily_total))
-            
-            if not current_week_start or entry_date < current_week_start:
-                if current_week_start:
-                    print("Weekly total: {:.2f} hours\n".format(weekly_total))
-                current_week_start = entry_date - timedelta(days=entry_date.weekday())
-                weekly_total = 0
-            
-            print("\nDate: {} ({})".format(entry_date.strftime('%Y-%m-%d'), entry_date.strftime('%A')))
-            print("-" * 100)
-            current_date = entry_date
-            daily_total = 0
+    cursor = db.cursor()
+    cursor.execute(query, params)
+    return cursor.fetchall()
 
-        # Imprimir toda la información en una sola línea con espaciado consistente
-        print("{:3} | {:7} | {:5.2f} | {:22} | {:20} | {}".format(
-            entry[0],
-            entry[6],
-            float(entry[3]),
-            entry[4],
-            f"{entry[7]} {entry[8]}",
-            entry[5]
-        ))
-        
-        daily_total += float(entry[3])
-        weekly_total += float(entry[3])
+def print_summary_report(days, project_id, date_range):
+    start_date, end_date = date_range
+    print(f"\nSummary for {'all projects' if project_id == 0 else f'Project ID {project_id}'} from {start_date} to {end_date}")
+    print("\n{:10} | {:9} | {:>8} | {:>7}".format("Date", "Day", "Hours", "Entries"))
+    print("-" * 44)
 
-    if current_date:
-        print("Daily total: {:.2f} hours".format(daily_total))
+    current_week_start = None
+    weekly_total = 0
+    total_hours = 0
+    total_entries = 0
+
+    for day, hours, entries in days:
+        monday = week_start(day)
+        if monday != current_week_start:
+            if current_week_start is not None:
+                print("Weekly total: {:.2f} hours\n".format(weekly_total))
+            current_week_start = monday
+            weekly_total = 0
+
+        print("{:10} | {:9} | {:8.2f} | {:7}".format(day_label(day), day_name(day), hours, entries))
+        weekly_total += hours
+        total_hours += hours
+        total_entries += entries
+
+    if current_week_start is not None:
         print("Weekly total: {:.2f} hours".format(weekly_total))
+    print(f"\nTotal Hours: {total_hours:.2f} ({total_entries} entries)")
+
+# Matches returned by a search unless another limit is given
+SEARCH_LIMIT = 50
+# Ranking by relevance scores every entry containing each search word (about 2 µs each). When
+# the words are in more entries than this between them, matches are listed newest first
+# instead, which stops as soon as the limit is reached.
+SEARCH_RANKED_MAX_ENTRIES = int(os.environ.get('TIME_TRACKER_SEARCH_RANKED_MAX', 20000))
+# Checking one entry against the full-text index costs about as much as reading this many
+# matches from it in order (about 50 µs against 1 µs)
+SEARCH_PROBE_COST = 50
+
+def build_search_terms(text):
+    # FTS5 phrases for plain search words; a trailing * matches any word with that prefix.
+    # Words are quoted, so input like "invoice-bug" is not read as query syntax.
+    terms = []
+    for word in text.split():
+        prefix = word.endswith('*')
+        word = word.rstrip('*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return terms
+
+def build_search_match(text):
+    # Every word has to appear
+    return ' '.join(build_search_terms(text))
+
+def count_up_to(cursor, query, params, limit):
+    # COUNT(*) of the query's rows that stops looking after limit of them
+    cursor.execute(f'SELECT COUNT(*) FROM ({query} LIMIT ?)', [*params, limit])
+    return cursor.fetchone()[0]
+
+def build_search_query(text, project_id, user_choice, selected_users, date_range, category=None, limit=SEARCH_LIMIT,
+                       ranked=True, entries_first=False, schema='main'):
+    # Entry rows (see ENTRY_COLUMNS) plus a relevance score (higher is better), best matches
+    # first; unranked, the most recently added matches first with no score. CROSS JOIN fixes which side is read
+    # first: the full-text index, or with entries_first the entries the filters select, each
+    # checked against the index by rowid. Only unranked searches should read the entries
+    # first, as the score would then be worked out from scratch for every entry.
+    # Every partition of time_entries (see shards.py) has its own index.
+    where, params = build_report_filters(project_id, user_choice, selected_users, date_range)
+    if category:
+        where += ' AND time_entries_fts.category = ?'
+        params.append(category)
+    entries, index = shards.table(schema), shards.table(schema, 'time_entries_fts')
+    if entries_first:
+        source = f'{entries} CROSS JOIN {index} ON time_entries_fts.rowid = time_entries.id'
+        newest = 'time_entries.id DESC'
+    else:
+        source = f'{index} CROSS JOIN {entries} ON time_entries.id = time_entries_fts.rowid'
+        newest = 'time_entries_fts.rowid DESC'
+    score, order = ('-time_entries_fts.rank', 'time_entries_fts.rank') if ranked else ('NULL', newest)
+    query = f'''
+        SELECT {ENTRY_COLUMNS}, {score} AS score
+        FROM {source}
+        WHERE time_entries_fts MATCH ? AND {where}
+        ORDER BY {order}
+        LIMIT ?
+    '''
+    return query, [build_search_match(text), *params, limit]
+
+@profiled('search_entries')
+def search_entries(text, project_id, user_choice, selected_users, date_range, category=None, limit=SEARCH_LIMIT):
+    # Picks the plan from bounded counts, so a word that is in nearly every entry costs no more
+    # than SEARCH_RANKED_MAX_ENTRIES rows to look at
+    # Each partition the date range reaches is searched on its own and the best of their
+    # matches are kept. Scores come from each partition's index statistics, which agree
+    # closely enough for ordering once a partition holds a year of entries.
+    terms = build_search_terms(text)
+    if not terms:
+        return []
+    cursor = db.cursor()
+    partitions = date_partitions(date_range)
+    word_entries = {
+        partition.schema: [
+            count_up_to(cursor, f"SELECT 1 FROM {shards.table(partition.schema, 'time_entries_fts')} WHERE time_entries_fts MATCH ?",
+                        [term], SEARCH_RANKED_MAX_ENTRIES + 1)
+            for term in terms
+        ]
+        for partition in partitions
+    }
+    ranked = sum(sum(counts) for counts in word_entries.values()) <= SEARCH_RANKED_MAX_ENTRIES
+    where, params = build_report_filters(project_id, user_choice, selected_users, date_range)
+    dimensions.check()
+    rows = []
+    for partition in partitions:
+        if min(word_entries[partition.schema]) == 0:
+            continue
+        entries_first = False
+        if not ranked:
+            # Reading the index newest first goes through about limit * matches / filtered
+            # matches to find the limit; reading the filtered entries first probes the index once
+            # per entry. The bounded count of the rarest word stands in for the matches.
+            worthwhile = math.isqrt(limit * min(word_entries[partition.schema]) // SEARCH_PROBE_COST)
+            entries_first = count_up_to(cursor, f'SELECT 1 FROM {shards.table(partition.schema)} WHERE {where}', params, worthwhile + 1) <= worthwhile
+        cursor.execute(*build_search_query(text, project_id, user_choice, selected_users, date_range, category, limit,
+                                           ranked, entries_first, partition.schema))
+        rows.extend(add_names(cursor.fetchall()))
+    if len(partitions) > 1:
+        rows.sort(key=lambda row: row[9] if ranked else row[0], reverse=True)
+    return rows[:limit]
+
+SEARCH_ROW_FORMAT = "{:>6} | {:10} | {:7} | {:5.2f} | {:20} | {:20} | {}"
+
+def print_search_results(rows, text, stream=None):
+    screen = Screen(stream)
+    order = 'newest first' if rows and rows[0][9] is None else 'best first'
+    screen.line(f"\nEntries matching {text!r}, {order} ({len(rows)} shown)")
+    screen.line("\n{:6} | {:10} | {:7} | {:5} | {:20} | {:20} | {}".format("Score", "Date", "Project", "Hours", "Category", "User", "Notes"))
+    screen.line(REPORT_RULE)
+    for row in rows:
+        score = '' if row[9] is None else f"{row[9]:.2f}"
+        screen.line(SEARCH_ROW_FORMAT.format(score, day_label(row[2]), row[6], float(row[3]), row[4], f"{row[7]} {row[8]}", row[5]))
+    if not rows:
+        screen.line("No matching entries.")
+    screen.flush()
+
+def get_pivot_report(report_type, project_id, user_choice, selected_users, date_range, top=None):
+    # Pivot summaries computed with NumPy over the filtered entries (see analytics.py)
+    import analytics
+    where, params = build_report_filters(project_id, user_choice, selected_users, date_range)
+    cursor = db.cursor()
+    tables = [shards.table(partition.schema) for partition in date_partitions(date_range)]
+    columns = analytics.load_columns(cursor, where, params, CATEGORIES, tables)
+    dimensions.check()
+    projects, users = dimensions.get()
+    user_names = {user_id: f"{first_name} {last_name}" for user_id, (first_name, last_name) in users.items()}
+    project_names = projects
+    return analytics.build_pivot(report_type, columns, user_names, project_names, CATEGORIES, date_range, top)
+
+def print_pivot_report(pivot, project_id, date_range, stream=None):
+    start_date, end_date = date_range
+    with Screen(stream) as screen:
+        screen.line(f"\nReport for {'all projects' if project_id == 0 else f'Project ID {project_id}'} from {start_date} to {end_date}")
+        screen.lines(pivot.format_table())
+
+# Menu key -> pivot report type, after the detailed (1) and summary (2) reports
+PIVOT_MENU = {'3': 'user-week', '4': 'project-category', '5': 'utilization'}
+SEARCH_CHOICE = '6'
+
+def select_report_type():
+    from analytics import PIVOT_REPORTS
+    print("\nSelect the report type:")
+    print("1. Detailed (every entry)")
+    print("2. Summary (daily and weekly totals)")
+    for key, report_type in PIVOT_MENU.items():
+        print(f"{key}. {PIVOT_REPORTS[report_type]}")
+    print(f"{SEARCH_CHOICE}. Search notes")
 
-def export_to_csv(entries, project_id):
+    while True:
+        choice = get_key()
+        if choice in ['1', '2', *PIVOT_MENU, SEARCH_CHOICE]:
+            print(f"Selected option: {choice}")
+            return choice
+        print(f"Invalid choice. Please select 1 to {SEARCH_CHOICE}.")
+
+def export_pivot(pivot, project_id):
     print("\nDo you want to export this report to CSV? (y/N)")
     export_choice = get_key().lower()
     print(f"Selected option: {'Yes' if export_choice == 'y' else 'No'}")
-    
-    if export_choice == 'y':
-        project_name = "All_Projects" if project_id == 0 else entries[0][6].replace(" ", "_")
-        filename = f"{project_name}_{date.today().strftime('%Y%m%d')}.csv"
-        
-        with open(filename, 'w', newline='') as csvfile:
-            csvwriter = csv.writer(csvfile)
-            csvwriter.writerow(['Date', 'Project', 'Hours', 'Category', 'Notes', 'User'])
-            for entry in entries:
-                csvwriter.writerow([entry[2], entry[6], float(entry[3]), entry[4], entry[5], f"{entry[7]} {entry[8]}"])
-        
-        print(f"Report exported to {filename}")
+    if export_choice != 'y':
+        return
+    filename = report_filename(project_id)
+    with open(filename, 'w', newline='') as file:
+        pivot.write_csv(file)
+    print(f"Report exported to {filename}")
 
 def generate_report(user_id):
     clear_console()
     project_id, user_choice, selected_users, date_range = get_report_parameters(user_id)
-    entries = get_report_data(project_id, user_choice, selected_users, date_range)
-    print_report(entries, project_id, date_range)
-    export_to_csv(entries, project_id)
+    report_type = select_report_type()
+    if report_type == '2':
+        print_summary_report(get_summary_data(project_id, user_choice, selected_users, date_range), project_id, date_range)
+        input("\nPress Enter to continue...")
+        return
+    if report_type == SEARCH_CHOICE:
+        text = input("\nSearch the notes for: ")
+        rows = search_entries(text, project_id, user_choice, selected_users, date_range)
+        with paged() as stream:
+            print_search_results(rows, text, stream)
+        input("\nPress Enter to continue...")
+        return
+    if report_type in PIVOT_MENU:
+        try:
+            pivot = get_pivot_report(PIVOT_MENU[report_type], project_id, user_choice, selected_users, date_range)
+        except RuntimeError as error:
+            print(error)
+        else:
+            with paged() as stream:
+                print_pivot_report(pivot, project_id, date_range, stream)
+            export_pivot(pivot, project_id)
+        input("\nPress Enter to continue...")
+        return
+    with paged() as stream:
+        print_report(iter_report_data(project_id, user_choice, selected_users, date_range, DEFAULT_CHUNK_SIZE), project_id, date_range, stream)
+    # A pass of its own, so the export neither waits for the user to page nor stops when they
+    # quit the pager early
+    exporter = ask_export(project_id)
+    if exporter:
+        try:
+            export_report(iter_report_data(project_id, user_choice, selected_users, date_range, DEFAULT_CHUNK_SIZE), exporter)
+        except (OSError, sqlite3.Error) as error:
+            print(f"Export to {exporter.path} failed after {exporter.rows} rows, the file is incomplete: {error}")
+        else:
+            print(f"Report exported to {exporter.path} ({exporter.rows} rows, {exporter.bytes_written()} bytes)")
     input("\nPress Enter to continue...")
 
+def report_query_shapes():
+    # One representative of every query shape the reports and listings issue
+    date_range = (date.today().replace(month=1, day=1), date.today())
+    return [
+        ("Report: all projects, all users", build_report_query(0, '2', [], date_range)),
+        ("Report: one project, all users", build_report_query(1, '2', [], date_range)),
+        ("Report: all projects, selected users", build_report_query(0, '3', [1, 2], date_range)),
+        ("Report: one project, selected users", build_report_query(1, '3', [1, 2], date_range)),
+        ("List time entries", (LIST_TIME_ENTRIES_QUERY, [1])),
+        ("Time entries: older page", (OLDER_PAGE_QUERY, [1, *NEWEST_KEY, TIME_ENTRIES_PAGE_SIZE + 1])),
+        ("Time entries: newer page", (NEWER_PAGE_QUERY, [1, 19000, 5, TIME_ENTRIES_PAGE_SIZE + 1])),
+        ("Time entries: page daily totals", (PAGE_DAILY_TOTALS_QUERY, [1, 19000, 19030])),
+        ("Time entries: page weekly totals", (PAGE_WEEKLY_TOTALS_QUERY, [1, 202101, 202105])),
+        ("Project users: all projects", build_project_users_query(0)),
+        ("Project users: one project", build_project_users_query(1)),
+        ("Search notes", build_search_query('invoice', 0, '2', [], date_range)),
+        ("Search notes: one project, selected users", build_search_query('invoice', 1, '3', [1, 2], date_range)),
+        ("Search notes: newest first", build_search_query('invoice', 0, '2', [], date_range, ranked=False)),
+        ("Search notes: one user, entries first", build_search_query('invoice', 0, '3', [1], date_range, ranked=False, entries_first=True)),
+    ]
+
+def check_query_plans():
+    # Returns (name, plan steps, uses_index) for each query shape. A plan that reads
+    # time_entries without an index is a full table scan.
+    results = []
+    cursor = db.cursor()
+    for name, (query, params) in report_query_shapes():
+        cursor.execute('EXPLAIN QUERY PLAN ' + query, params)
+        steps = [row[3] for row in cursor.fetchall()]
+        uses_index = not any(is_full_scan(step) for step in steps)
+        results.append((name, steps, uses_index))
+    return results
+
+def print_query_plans():
+    results = check_query_plans()
+    for name, steps, uses_index in results:
+        print(f"{'OK  ' if uses_index else 'SCAN'} {name}")
+        for step in steps:
+            print(f"       {step}")
+    return all(uses_index for _, _, uses_index in results)
+
 def get_user_by_id(user_id):
-    cursor.execute('''
-        SELECT id, first_name, last_name 
-        FROM users 
-        WHERE id = ?
-    ''', (user_id,))
-    return cursor.fetchone()
+    # (id, first_name, last_name), or None when the user does not exist
+    names = dimensions.users().get(user_id)
+    return (user_id, *names) if names else None
 
 def main_menu():
     while True:
@@ -572,10 +1618,11 @@ def main_menu():
                 logged_in_menu(user, session_id)
                 continue
         
-        clear_console()
-        print("Time Tracker Menu")
-        print("1. Login")
-        print("2. Create Account")
+        draw_screen([
+            "Time Tracker Menu",
+            "1. Login",
+            "2. Create Account",
+        ])
         choice = get_key()
         print(f"Selected: {choice}")
 
@@ -591,12 +1638,13 @@ def main_menu():
 
 def logged_in_menu(user, session_id):
     while True:
-        clear_console()
-        print(f"Welcome, {user[1]} {user[2]}!")
-        print("1. Manage Projects")
-        print("2. Manage Time Entries")
-        print("3. Generate Report")
-        print("4. Logout")
+        draw_screen([
+            f"Welcome, {user[1]} {user[2]}!",
+            "1. Manage Projects",
+            "2. Manage Time Entries",
+            "3. Generate Report",
+            "4. Logout",
+        ])
         choice = get_key()
         print(f"Selected: {choice}")
 
@@ -616,12 +1664,13 @@ def logged_in_menu(user, session_id):
 
 def project_menu():
     while True:
-        clear_console()
-        print("Project Management")
-        print("1. Create Project")
-        print("2. List Projects")
-        print("3. Update Project")
-        print("4. Back to Main Menu")
+        draw_screen([
+            "Project Management",
+            "1. Create Project",
+            "2. List Projects",
+            "3. Update Project",
+            "4. Back to Main Menu",
+        ])
         choice = get_key()
         print(f"Selected: {choice}")
 
@@ -641,13 +1690,14 @@ def project_menu():
 
 def time_entry_menu(user_id):
     while True:
-        clear_console()
-        print("Time Entry Management")
-        print("1. Create Time Entry")
-        print("2. List Time Entries")
-        print("3. Update Time Entry")
-        print("4. Delete Time Entry")
-        print("5. Back to Main Menu")
+        draw_screen([
+            "Time Entry Management",
+            "1. Create Time Entry",
+            "2. List Time Entries",
+            "3. Update Time Entry",
+            "4. Delete Time Entry",
+            "5. Back to Main Menu",
+        ])
         choice = get_key()
         print(f"Selected: {choice}")
 
@@ -656,16 +1706,165 @@ def time_entry_menu(user_id):
         elif choice == '2':
             list_time_entries(user_id)
         elif choice == '3':
-            update_time_entry()
+            update_time_entry(user_id)
         elif choice == '4':
-            delete_time_entry()
+            delete_time_entry(user_id)
         elif choice == '5':
             break
         else:
             print("Invalid choice. Please try again.")
         input("Press Enter to continue...")  
 
+def all_entries_source(database=None):
+    # FROM clause over every partition of time_entries, e.g. for the rollups, which cover closed
+    # years too. Call after database.cursor() or inside a transaction, which attach the closed years.
+    partitions = shards.partitions((database or db).attached)
+    if len(partitions) == 1:
+        return 'time_entries'
+    selects = ' UNION ALL '.join(f'SELECT * FROM {partition.schema}.time_entries' for partition in partitions)
+    return f'({selects}) AS time_entries'
+
+def check_rollups(rebuild=False):
+    if rebuild:
+        with db.transaction() as cursor:
+            rebuild_rollups(cursor, source=all_entries_source())
+        print("Rollup tables rebuilt from time_entries.")
+    cursor = db.cursor()
+    mismatches = verify_rollups(cursor, all_entries_source())
+    for table, count in mismatches.items():
+        print(f"{'OK  ' if count == 0 else 'FAIL'} {table}: {count} mismatched rows")
+    return not any(mismatches.values())
+
+# A closed year's shard file: time_entries as in the main file (without the foreign keys, as
+# users and projects stay behind) with the same indexes and full-text index
+SHARD_SCHEMA = [
+    '''CREATE TABLE time_entries (
+        id INTEGER PRIMARY KEY,
+        project_id INTEGER,
+        user_id INTEGER,
+        day INTEGER,
+        iso_week INTEGER,
+        hours INTEGER,
+        category TEXT,
+        notes TEXT
+    )''',
+    'CREATE INDEX idx_time_entries_date ON time_entries (day, project_id, user_id)',
+    'CREATE INDEX idx_time_entries_project_date ON time_entries (project_id, day, user_id)',
+    'CREATE INDEX idx_time_entries_user_date ON time_entries (user_id, day)',
+    'CREATE INDEX idx_time_entries_project_user ON time_entries (project_id, user_id)',
+    '''CREATE VIRTUAL TABLE time_entries_fts USING fts5(
+        notes, project_id UNINDEXED, category UNINDEXED,
+        content='time_entries', content_rowid='id', prefix='2 3'
+    )''',
+]
+
+def build_shard(path, first_day, last_day):
+    # Copies the main file's entries dated first_day..last_day into a new shard file, then
+    # indexes, analyzes and compacts it and makes it read-only. Returns (entries, highest id).
+    temporary = path + '.tmp'
+    if os.path.exists(temporary):
+        os.remove(temporary)
+    conn = sqlite3.connect(temporary, isolation_level=None)
+    try:
+        conn.execute('ATTACH DATABASE ? AS source', (db.path,))
+        conn.execute('BEGIN')
+        conn.execute(SHARD_SCHEMA[0])
+        # In id order, so the table is written by appending; the indexes are built afterwards
+        conn.execute('''
+            INSERT INTO time_entries (id, project_id, user_id, day, iso_week, hours, category, notes)
+            SELECT id, project_id, user_id, day, iso_week, hours, category, notes
+            FROM source.time_entries WHERE day BETWEEN ? AND ? ORDER BY id
+        ''', (first_day, last_day))
+        for statement in SHARD_SCHEMA[1:]:
+            conn.execute(statement)
+        conn.execute("INSERT INTO time_entries_fts (time_entries_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO time_entries_fts (time_entries_fts) VALUES ('optimize')")
+        conn.execute('COMMIT')
+        conn.execute('DETACH DATABASE source')
+        # Planner statistics and a compact file; nothing changes them afterwards
+        conn.execute('ANALYZE')
+        conn.execute('VACUUM')
+        entries, last_id = conn.execute('SELECT COUNT(*), IFNULL(MAX(id), 0) FROM time_entries').fetchone()
+    finally:
+        conn.close()
+    os.chmod(temporary, 0o444)
+    os.replace(temporary, path)
+    return entries, last_id
+
+def get_shards():
+    # (year, file, entries, highest id) of every closed year, oldest first
+    cursor = db.cursor()
+    cursor.execute('SELECT year, path, entries, last_id FROM entry_shards ORDER BY year')
+    return cursor.fetchall()
+
+def close_years(through_year=None, vacuum=False):
+    # Moves the entries of every open year up to through_year (default: last year) out of the
+    # main file into one read-only shard file per year (see shards.py). Run it while no other
+    # process has the database open: their connections only attach the new files once reopened.
+    # Returns the years closed.
+    this_year = date.today().year
+    through_year = through_year or this_year - 1
+    if through_year >= this_year:
+        raise ValueError(f"Only past years can be closed, not {through_year}")
+    with db.transaction() as cursor:
+        closed = shards.shard_years(db.attached)
+        if closed:
+            first_year = closed[0] + 1
+        else:
+            cursor.execute('SELECT MIN(day) FROM time_entries')
+            first_day = cursor.fetchone()[0]
+            first_year = day_date(first_day).year if first_day is not None else through_year + 1
+        years = list(range(first_year, through_year + 1))
+        if not years:
+            return []
+        if len(closed) + len(years) > shards.attach_limit():
+            raise ValueError(f"Closing {len(years)} more years would need more than the {shards.attach_limit()} files SQLite can attach")
+
+        # The write lock is held from here on, so the copies match what is deleted below
+        for year in years:
+            path = shards.shard_path(db.path, year)
+            print(f"Closing {year} into {path}...", file=sys.stderr)
+            entries, last_id = build_shard(path, *shards.year_days(year))
+            cursor.execute('INSERT INTO entry_shards (year, path, entries, last_id) VALUES (?, ?, ?, ?)',
+                           (year, os.path.basename(path), entries, last_id))
+
+        # The rollups keep covering the closed years, the search index is rebuilt over what is
+        # left instead of removing the moved entries one by one, and the move is no change to sync
+        cursor.execute('DROP TRIGGER IF EXISTS time_entries_rollup_delete')
+        cursor.execute('DROP TRIGGER IF EXISTS time_entries_search_delete')
+        cursor.execute('DROP TRIGGER IF EXISTS time_entries_journal_delete')
+        cursor.execute('DELETE FROM time_entries WHERE day <= ?', (shards.year_days(through_year)[1],))
+        create_rollup_triggers(cursor)
+        create_search_triggers(cursor)
+        create_journal_triggers(cursor)
+        cursor.execute("INSERT INTO time_entries_fts (time_entries_fts) VALUES ('rebuild')")
+        cursor.execute('UPDATE search_backfill SET next_id = end_id + 1')
+    if vacuum:
+        print("Compacting the main file...", file=sys.stderr)
+        with db.write_lock:
+            db.writer().execute('VACUUM')
+    # Every connection is reopened with the new shards attached
+    db.close()
+    return years
+
+def run_interactive():
+    sessions.start()
+    try:
+        main_menu()
+    finally:
+        sessions.stop()
+        if os.environ.get('TIME_TRACKER_CACHE_STATS'):
+            print(report_cache.format_stats(), file=sys.stderr)
+
 if __name__ == "__main__":
-    setup_database()
-    main_menu()
-    conn.close()
\ No newline at end of file
+    # Run as a script this module is __main__; cli and the others import it as time_tracker,
+    # which would otherwise load a second copy with its own database, caches and write queue
+    sys.modules.setdefault('time_tracker', sys.modules['__main__'])
+    if sys.argv[1:]:
+        # Headless, scriptable mode
+        from cli import main
+        sys.exit(main(sys.argv[1:]))
+    try:
+        run_interactive()
+    finally:
+        db.close()
\ No newline at end of file
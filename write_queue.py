@@ -0,0 +1,131 @@
+import os
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+# A batch is committed once it holds this many writes, or this long after its first write
+GROUP_COMMIT_MAX_WRITES = int(os.environ.get('TIME_TRACKER_GROUP_COMMIT_WRITES', 500))
+GROUP_COMMIT_MAX_DELAY_MS = float(os.environ.get('TIME_TRACKER_GROUP_COMMIT_DELAY_MS', 1))
+
+class WriteQueue:
+    # Group commit: a writer thread takes units of work off a queue and applies them in batches,
+    # one transaction and so one WAL sync per batch instead of one per write. While a batch is
+    # being committed the next one fills up, so the more writers there are, the larger the batches.
+    #
+    # A unit of work is work(cursor), which runs inside the batch's transaction and returns the
+    # result, and after(result), which runs once the batch is committed (e.g. to invalidate
+    # caches). Each unit runs under a savepoint: one that raises is rolled back alone and the rest
+    # of its batch is still committed. submit() returns a Future that resolves to the result once
+    # the write is committed, or to the exception that undid it.
+    #
+    # Every batch runs on the database's single writer connection, whose statement cache keeps
+    # the statements of the recurring writes prepared from one batch to the next.
+
+    def __init__(self, database, max_writes=GROUP_COMMIT_MAX_WRITES, max_delay_ms=GROUP_COMMIT_MAX_DELAY_MS):
+        self.database = database
+        self.max_writes = max_writes
+        self.max_delay = max_delay_ms / 1000
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.writes = 0
+        self.failures = 0
+
+    def submit(self, work, after=None):
+        future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+                self._thread.start()
+            self._queue.put((work, after, future))
+        return future
+
+    def run(self, work, after=None):
+        # Blocks until the write is committed; returns its result or raises its exception
+        return self.submit(work, after).result()
+
+    def _next_batch(self):
+        # Waits for a first write, then takes what else is queued, waiting up to max_delay for
+        # more. None once stop() was called and everything before it has been taken.
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_writes:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if item is None:
+                # Stop after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _commit(self, batch):
+        outcomes = []
+        try:
+            with self.database.transaction() as cursor:
+                for work, after, future in batch:
+                    if not future.set_running_or_notify_cancel():
+                        continue
+                    cursor.execute('SAVEPOINT unit_of_work')
+                    try:
+                        outcomes.append((future, after, work(cursor), None))
+                    except Exception as error:
+                        cursor.execute('ROLLBACK TO unit_of_work')
+                        outcomes.append((future, None, None, error))
+                    cursor.execute('RELEASE unit_of_work')
+        except Exception as error:
+            # BEGIN or the commit itself failed: nothing in the batch was written. Units the
+            # batch never got to are still pending and are failed all the same, unless cancelled.
+            for _, _, future in batch:
+                if future.running() or future.set_running_or_notify_cancel():
+                    self.failures += 1
+                    future.set_exception(error)
+            return
+        self.batches += 1
+        for future, after, result, error in outcomes:
+            if error is not None:
+                self.failures += 1
+                future.set_exception(error)
+                continue
+            self.writes += 1
+            if after:
+                try:
+                    after(result)
+                except Exception as after_error:
+                    # The write is committed all the same
+                    print(f"write queue: {type(after_error).__name__}: {after_error}", file=sys.stderr)
+            future.set_result(result)
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._commit(batch)
+
+    def stop(self):
+        # Commits everything submitted so far, then ends the writer thread
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self):
+        return {'batches': self.batches, 'writes': self.writes, 'failures': self.failures,
+                'writes_per_batch': self.writes / self.batches if self.batches else 0.0}